@@ -15,16 +15,43 @@ import h5py
 import pandas as pd
 from mcnpoutput import TrackLengthTally
 from plotting_utils import ( names, energy_histogram )
-from analysis_utils import get_num_cores
-import matplotlib as mpl
-mpl.use('agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
+from analysis_utils import get_num_cores, LazyModule, use_agg
+from instrumentation import traced
 import logging
 import json
+import os
+import re
+plt = LazyModule('matplotlib.pyplot', setup=use_agg)
+sns = LazyModule('seaborn', setup=use_agg)
 
 ###############################################################################
 
+# Precision policy for anisotropy data read through H5Output. Metrics that are
+# ratios in [0, 1] or log-distributed lose nothing in float32, which halves
+# the memory of every array read, sampled or plotted. Sums and moments are
+# always accumulated in float64. Use set_precision to change the default, or
+# pass dtype to H5Output directly.
+precision = {'dtype' : np.float64}
+
+def set_precision(dtype=np.float64):
+    '''
+    Sets the default dtype used by H5Output readers (np.float64 or
+    np.float32). Returns the previous default.
+    '''
+    logger = logging.getLogger("analysis.precision")
+
+    dtype = np.dtype(dtype).type
+    if dtype not in (np.float32, np.float64):
+        logger.error('%s is not a supported precision. Keeping %s'
+                %(dtype, precision['dtype']))
+        return precision['dtype']
+    previous = precision['dtype']
+    precision['dtype'] = dtype
+    logger.info('anisotropy data precision set to %s' %(np.dtype(dtype).name))
+    return previous
+
+#-----------------------------------------------------------------------------#
+
 class MCNPOutput(object):
     '''
     MCNPOutput is a simple wrapping class to pull in tally data for an
@@ -41,6 +68,7 @@ class MCNPOutput(object):
         self.tallynumber = tallynumber
         pass
 
+    @traced('MCNPOutput.get_tally_data', 'read')
     def get_tally_data(self):
         '''
         Returns dict of tally data. Dict includes timing data returned from
@@ -60,19 +88,79 @@ class MCNPOutput(object):
 
 #-----------------------------------------------------------------------------#
 
+# Cost models of the deterministic time charged in the adjusted FOMs. The
+# serial time is the ADVANTG and omega time, which run on one core, and the
+# denovo time is the wall time of the parallel Denovo solve.
+#    'cpu time'   : serial + cores*denovo, the original adjusted time. It
+#                   assumes Denovo scales perfectly.
+#    'wall time'  : serial + denovo, the time to solution.
+#    'core time'  : cores*(serial + denovo), what a core-hour allocation is
+#                   charged, since the job holds every core for every phase.
+#    'efficiency' : serial + efficiency*cores*denovo, the time Denovo would
+#                   take on one core at a measured parallel efficiency (see
+#                   timing_analytics.Timing_Runs.get_run_efficiency).
+cost_models = ['cpu time', 'wall time', 'core time', 'efficiency']
+
+def get_deterministic_costs(serial_time, denovo_time, cores=1,
+        efficiency=None):
+    '''
+    Returns a dict of the deterministic time charged under every cost model,
+    in the units of the times given. The arguments are broadcast against
+    each other, so arrays give the costs of many runs at once. The
+    efficiency model is only included if efficiency is given.
+    '''
+    serial_time = np.asarray(serial_time, dtype=float)
+    denovo_time = np.asarray(denovo_time, dtype=float)
+    cores = np.asarray(cores, dtype=float)
+    costs = {'cpu time' : serial_time + cores*denovo_time,
+             'wall time' : serial_time + denovo_time,
+             'core time' : cores*(serial_time + denovo_time)}
+    if efficiency is not None:
+        costs['efficiency'] = serial_time + \
+                np.asarray(efficiency, dtype=float)*cores*denovo_time
+    for model in costs:
+        if costs[model].ndim == 0:
+            costs[model] = float(costs[model])
+    return costs
+
+def add_efficiency_cost(times_used, efficiency):
+    '''
+    Returns a copy of a times_used dict (as in
+    FOMAnalysis.calculate_all_foms) with the deterministic and total times of
+    the efficiency cost model for a measured parallel efficiency. Runs
+    without a deterministic time are returned unchanged.
+    '''
+    if 'det_times' not in times_used:
+        return times_used
+    times_used = dict(times_used)
+    cost = get_deterministic_costs(times_used['serial_time'],
+            times_used['denovo_wall_time'], times_used['cores'],
+            efficiency)['efficiency']
+    times_used['det_times'] = dict(times_used['det_times'], efficiency=cost)
+    times_used['total_times'] = dict(times_used['total_times'],
+            efficiency=times_used['mc_time'] + cost)
+    return times_used
+
+#-----------------------------------------------------------------------------#
+
 class TimingOutput(object):
     '''
     This class reads in the timing dict from the timing.json file ouputted from
     a modified ADVANTG run.
     '''
-    def __init__(self, timingfilelocation, num_cores=None):
+    def __init__(self, timingfilelocation, num_cores=None,
+            parallel_efficiency=None):
         '''
-        Adds timingfile location to class as object.
+        Adds timingfile location to class as object. The parallel efficiency
+        of the Denovo solve, if known, adds the efficiency cost model to the
+        deterministic costs.
         '''
         self.timingfile = str(timingfilelocation)
         self.cores = num_cores
+        self.parallel_efficiency = parallel_efficiency
         pass
 
+    @traced('TimingOutput.get_timing_data', 'read')
     def get_timing_data(self, extraopts=['strings']):
         '''
         Returns a dict of timing information. Dict includes full deterministic
@@ -87,6 +175,9 @@ class TimingOutput(object):
         get_timing_data(extraopts=['Writing omega solution to disk']) will
         return a modified runtime with the default timings subtrated and also
         everything contained in extraopts.
+
+        The deterministic time charged under each cost model (see
+        cost_models) is in deterministic_costs.
         '''
         # open the logger
         logger = logging.getLogger("analysis.fomanalysis.timing_data")
@@ -106,6 +197,7 @@ class TimingOutput(object):
 
         adv_time = np.sum(times['advantg_times'].values())
         denovo_time = np.sum(times['denovo_times'].values())
+        denovo_wall_time = denovo_time
 
         if self.cores is not None:
             logger.debug('''calculating adjusted denovo runtime by %.2f seconds and
@@ -126,9 +218,18 @@ class TimingOutput(object):
         newtime = total_time
         full_det_time = newtime + dispose_time
 
+        # the deterministic time charged under each cost model. Without a
+        # core count the run is taken to be serial.
+        cores = self.cores if self.cores is not None else 1
+        costs = get_deterministic_costs(adv_time + omega_time,
+                denovo_wall_time, cores, self.parallel_efficiency)
+
         timing_data = {
                 'full_deterministic_time': full_det_time,
                 'adjusted_deterministic_time': newtime,
+                'deterministic_costs' : costs,
+                'denovo_wall_time' : denovo_wall_time,
+                'serial_time' : adv_time + omega_time,
                 'num_cores' : self.cores,
                 'timing_dicts' : times,
                 'units':'seconds'
@@ -181,18 +282,43 @@ class TimingOutput(object):
 
 #-----------------------------------------------------------------------------#
 
+def read_dataset(dataset, dtype, start=None, stop=None):
+    '''
+    Reads an hdf5 dataset, or its rows start to stop, straight into an array
+    of dtype. HDF5 converts the values as it reads them, so a float32 read
+    never holds a float64 copy of the data. Scalar datasets are returned as
+    an array of one value.
+    '''
+    if len(dataset.shape) == 0:
+        return np.array([dataset[()]], dtype=dtype)
+    if start is None:
+        start, stop = 0, dataset.shape[0]
+    data = np.empty((stop - start,) + dataset.shape[1:], dtype=dtype)
+    if data.size:
+        dataset.read_direct(data, np.s_[start:stop])
+    return data
+
 class H5Output(object):
     '''
     HDF5 reader class, custom for anisotropy output file specifically. In an
     ADVANTG run, this file should be located at
     ${solution_dir}/omega_solution/problem_anisotropies.h5
+
+    Data is returned in the dtype given at construction, or the module
+    precision policy (see set_precision) if none is given. The filter
+    matrices are kept after they are built unless cache_filters is False.
     '''
-    def __init__(self, outputlocation):
+    def __init__(self, outputlocation, dtype=None, cache_filters=True):
         self.outputlocation = str(outputlocation)
         self.filtermatrix = {}
+        self.cache_filters = cache_filters
+        if dtype is None:
+            dtype = precision['dtype']
+        self.dtype = np.dtype(dtype).type
         pass
 
     # this function still in progress. Not fully functional.
+    @traced('H5Output.get_all_data', 'read')
     def get_all_data(self):
         '''
         Returns all data from an hdf5 file. Users should be cautious because
@@ -216,16 +342,33 @@ class H5Output(object):
 
         return names
 
+    @traced('H5Output.get_dataset_by_metric', 'read')
     def get_dataset_by_metric(self, metric_name, num_samples = 1500,
-                             flatten_data=True, **kwargs):
+                             flatten_data=True, chunk_size=None, **kwargs):
         '''
         Returns a dict with the names of each energy group
         and a matrix of data corresponding to a sample of anisotropy data
-        (num_samples) for a specified metric name.
+        (num_samples) for a specified metric name. If chunk_size is given the
+        samples are drawn chunk by chunk (see sample_values) instead of from
+        the full data matrix.
         '''
         # open the logger
         logger = logging.getLogger("analysis.H5Output.subdatabymetric")
 
+        if chunk_size is not None:
+            with h5py.File('%s' %(self.outputlocation), 'r') as f:
+                groups = list(f['%s' %metric_name])
+            data = np.empty([num_samples, len(groups)], dtype=self.dtype)
+            for column, group in enumerate(groups):
+                data[:,column] = self.sample_values(metric_name, group,
+                        num_samples, chunk_size=chunk_size,
+                        cutoff=kwargs.get('cutoff'))
+            return {'names' : groups,
+                    'data' : data,
+                    'description': '%s count sample of ' %(num_samples)
+                           + 'anisotropy data for all energy groups, %s'
+                    %(metric_name)}
+
         full_dataset = self.get_data_by_metric(metric_name,
                 flatten_data=flatten_data, **kwargs)
         full_data = full_dataset['data']
@@ -236,14 +379,11 @@ class H5Output(object):
         size = np.shape(full_data)
         num_groups = size[-1]
 
-        data = np.zeros(num_samples)
+        data = np.empty([num_samples, num_groups], dtype=self.dtype)
         for group in np.arange(num_groups):
             datasample = full_data[:,group]
             dataset = datasample[~np.isnan(datasample)]
-            newdata = np.random.choice(dataset,num_samples)
-            data = np.column_stack((data,newdata))
-
-        data = data[:,1:]
+            data[:,group] = np.random.choice(dataset,num_samples)
 
         metricdata = {'names' : full_dataset['names'],
                      'data' : data,
@@ -254,7 +394,9 @@ class H5Output(object):
         return metricdata
 
 
-    def get_data_by_metric(self, metric_name, flatten_data=True, **kwargs):
+    @traced('H5Output.get_data_by_metric', 'read')
+    def get_data_by_metric(self, metric_name, flatten_data=True,
+            sample_rows=None, chunk_size=2**20, **kwargs):
         '''
         Returns a dict with the names of each group and a
         matrix of data corresponding to the anisotropy data (groupwise) for a
@@ -262,7 +404,8 @@ class H5Output(object):
         matrix returned in the dict will have dimensions of (groups, x, y, z),
         else it will be (groups, x*y*z). Because this function is used
         primarily for plotting, the dimensionality of the flattened array is
-        desired.
+        desired. If sample_rows is given, only that many randomly chosen mesh
+        cells (the same cells for every group) are read, chunk by chunk.
         '''
         # open the logger
         logger = logging.getLogger("analysis.H5Output.databymetric")
@@ -270,15 +413,34 @@ class H5Output(object):
         # open the file as readonly
         f=h5py.File('%s' %(self.outputlocation), 'r')
 
-
-        # set up empty arrays for data storage before loading it in
         matrix_size = f['%s' %metric_name]['group_000'].size
-        data = np.zeros([matrix_size])
+        if sample_rows is not None and sample_rows < matrix_size:
+            groups = list(f['%s' %metric_name])
+            indices = np.sort(np.random.choice(matrix_size, int(sample_rows),
+                replace=False))
+            logger.debug('sampling %d of %d mesh cells for %s'
+                    %(sample_rows, matrix_size, metric_name))
+            data = np.empty([len(indices), len(groups)], dtype=self.dtype)
+            for column, group in enumerate(groups):
+                data[:,column] = self.get_sampled_column(metric_name, group,
+                        indices, chunk_size=chunk_size,
+                        cutoff=kwargs.get('cutoff'))
+            return {'names' : groups,
+                    'data' : data,
+                    'description': 'anisotropy data for %d sampled mesh '
+                    %(len(indices)) + 'cells, all energy groups, %s'
+                    %metric_name}
+
+        # set up empty arrays for data storage before loading it in. The
+        # array is filled column by column in the requested precision so no
+        # growing copies are made.
+        groups = list(f['%s' %metric_name])
+        data = np.empty([matrix_size, len(groups)], dtype=self.dtype)
         names = []
 
         # loop through the data in the hdf5 file and load it in
-        for group in f['%s' %metric_name]:
-            subdata = f['%s' %metric_name][group][:]
+        for column, group in enumerate(groups):
+            subdata = self.read_dataset(f['%s' %metric_name][group])
             if kwargs.get('cutoff') == 'mean' or kwargs.get('cutoff') == 'median':
                 filter_mat = self.get_filter_matrix(group, **kwargs)
                 subdata = subdata*filter_mat
@@ -295,15 +457,9 @@ class H5Output(object):
             else:
                 logger.error('cutoff value of %s not recognized'
                         %kwargs.get('cutoff'))
-            data = np.row_stack((data,subdata))
+            data[:,column] = subdata.ravel()
             names.append(group)
 
-        # Rotate the matrix for plotting optimization
-        data = np.transpose(data)
-
-        # clear out the row of zeros that appears from row_stack
-        data = data[:,1:]
-
         metricdata = {'names' : names,
                      'data' : data,
                      'description': 'anisotropy data for all energy groups, %s'
@@ -311,13 +467,16 @@ class H5Output(object):
 
         return metricdata
 
-    def get_data_by_energy(self, group_number, flatten_data=True, **kwargs):
+    @traced('H5Output.get_data_by_energy', 'read')
+    def get_data_by_energy(self, group_number, flatten_data=True,
+            sample_rows=None, chunk_size=2**20, **kwargs):
         '''This function will return a dict of the names of each metric that
         have been aquired and an array of data corresponding to the anisotropy
         data for each metric given a specified energy group number. If
         flatten_data is set to False, then the data matrix will have
         dimensions of (no. metrics, x, y, z), else it will be (no. metrics,
-        x*y*z) '''
+        x*y*z). If sample_rows is given, only that many randomly chosen mesh
+        cells (the same cells for every metric) are read, chunk by chunk. '''
 
         # open the logger
         logger = logging.getLogger("analysis.H5Output.databyenergy")
@@ -327,8 +486,7 @@ class H5Output(object):
 
         # set up empty arrays for data storage before loading it in
         matrix_size = f['forward_anisotropy']['group_000'].size
-        data = np.zeros([matrix_size])
-        metric_names = f.keys()
+        metric_names = list(f.keys())
         if 'contributon_flux' in metric_names:
             metric_names.remove('contributon_flux')
 
@@ -342,9 +500,28 @@ class H5Output(object):
             logger.error('group number is not a recognized type')
 
         logger.debug('using data for %s' %group_number)
+
+        if sample_rows is not None and sample_rows < matrix_size:
+            indices = np.sort(np.random.choice(matrix_size, int(sample_rows),
+                replace=False))
+            logger.debug('sampling %d of %d mesh cells for %s'
+                    %(sample_rows, matrix_size, group_number))
+            data = np.empty([len(indices), len(metric_names)],
+                    dtype=self.dtype)
+            for column, metric in enumerate(metric_names):
+                data[:,column] = self.get_sampled_column(metric, group_number,
+                        indices, chunk_size=chunk_size,
+                        cutoff=kwargs.get('cutoff'))
+            return {'names' : metric_names,
+                    'data' : data,
+                    'description': 'anisotropy data for %d sampled mesh '
+                    %(len(indices)) + 'cells, all metrics, energy %s'
+                    %group_number}
+
         # loop through the data in the hdf5 file and load it in
-        for metric in metric_names:
-            subdata = f[metric][group_number][:]
+        data = np.empty([matrix_size, len(metric_names)], dtype=self.dtype)
+        for column, metric in enumerate(metric_names):
+            subdata = self.read_dataset(f[metric][group_number])
             if kwargs.get('cutoff') == 'mean' or kwargs.get('cutoff') == 'median':
                 filter_mat = self.get_filter_matrix(group_number, **kwargs)
                 subdata = subdata*filter_mat
@@ -361,13 +538,7 @@ class H5Output(object):
             else:
                 logger.error('cutoff value of %s not recognized'
                         %kwargs.get('cutoff'))
-            data = np.row_stack((data,subdata))
-
-        # Rotate the matrix for plotting optimization
-        data = np.transpose(data)
-
-        # clear out the row of zeros that appears from row_stack
-        data = data[:,1:]
+            data[:,column] = subdata.ravel()
 
         groupdata = {'names': names,
                       'data': data,
@@ -376,12 +547,15 @@ class H5Output(object):
 
         return groupdata
 
+    @traced('H5Output.get_dataset_by_energy', 'read')
     def get_dataset_by_energy(self, group_number, num_samples = 1500,
-                             flatten_data=True, **kwargs):
+                             flatten_data=True, chunk_size=None, **kwargs):
         '''
         Returns a dict with the names of eeach energy group
         and a matrix of data corresponding to a sample of anisotropy data (n
-        samples) for a specified metric name.
+        samples) for a specified metric name. If chunk_size is given the
+        samples are drawn chunk by chunk (see sample_values) instead of from
+        the full data matrix.
         '''
 
         # open the logger
@@ -394,6 +568,21 @@ class H5Output(object):
         else:
             logger.error('group number is not a recognized type')
 
+        if chunk_size is not None:
+            with h5py.File('%s' %(self.outputlocation), 'r') as f:
+                metric_names = [metric for metric in f.keys() if
+                        metric != 'contributon_flux']
+            data = np.empty([num_samples, len(metric_names)], dtype=self.dtype)
+            for column, metric in enumerate(metric_names):
+                data[:,column] = self.sample_values(metric, group_number,
+                        num_samples, chunk_size=chunk_size,
+                        cutoff=kwargs.get('cutoff'))
+            return {'names' : metric_names,
+                    'data' : data,
+                    'description': '%s count sample of ' %(num_samples)
+                           + 'anisotropy data for all metrics, energy %s'
+                    %(group_number)}
+
         full_dataset = self.get_data_by_energy(group_number,
                 flatten_data=flatten_data, **kwargs)
         full_data = full_dataset['data']
@@ -404,14 +593,11 @@ class H5Output(object):
         size = np.shape(full_data)
         num_metrics = size[-1]
 
-        data = np.zeros(num_samples)
+        data = np.empty([num_samples, num_metrics], dtype=self.dtype)
         for metric in np.arange(num_metrics):
             datasample = full_data[:,metric]
             dataset = datasample[~np.isnan(datasample)]
-            newdata = np.random.choice(dataset,num_samples)
-            data = np.column_stack((data,newdata))
-
-        data = data[:,1:]
+            data[:,metric] = np.random.choice(dataset,num_samples)
 
         groupdata = {'names' : full_dataset['names'],
                      'data' : data,
@@ -451,7 +637,10 @@ class H5Output(object):
                      + ' %d counts above the mean,' %counts[1]
                      + ' and %d counts filtered out' %counts[0] )
 
-            filter_matrix = data
+            filter_matrix = data.astype(self.dtype)
+
+            if not self.cache_filters:
+                return filter_matrix
 
             logger.debug('Adding %s filter matrix to %s dictionary'
                     %(group, cutoff))
@@ -463,6 +652,113 @@ class H5Output(object):
 
         return filter_matrix
 
+    def read_dataset(self, dataset, start=None, stop=None):
+        '''
+        Reads a dataset, or its rows start to stop, in the precision of this
+        reader (see read_dataset).
+        '''
+        return read_dataset(dataset, self.dtype, start, stop)
+
+    def get_shape(self, metric_name, group):
+        '''
+        Returns the mesh shape of a metric for a single group without reading
+        any of its data.
+        '''
+        if type(group) == int:
+            group = 'group_%03d' %group
+        with h5py.File('%s' %(self.outputlocation), 'r') as f:
+            shape = f[metric_name][group].shape
+        return shape
+
+    def iter_data_chunks(self, metric_name, group, chunk_size=2**20,
+            cutoff='full'):
+        '''
+        Generator that yields the anisotropy data for a single metric and
+        energy group in flattened slabs along the first mesh axis. Each slab
+        holds roughly chunk_size values, so memory use is bounded by
+        chunk_size and not by the mesh size. If cutoff is 'mean' or 'median'
+        the contributon flux filter matrix is applied to each slab and the
+        filtered values are returned as nan, as in get_data_by_metric.
+        '''
+        # open the logger
+        logger = logging.getLogger("analysis.H5Output.datachunks")
+
+        if type(group) == int:
+            group = 'group_%03d' %group
+
+        if cutoff == 'mean' or cutoff == 'median':
+            filter_mat = self.get_filter_matrix(group, cutoff=cutoff)
+        else:
+            filter_mat = None
+
+        with h5py.File('%s' %(self.outputlocation), 'r') as f:
+            dataset = f[metric_name][group]
+            shape = dataset.shape
+            if len(shape) == 0:
+                yield np.array([dataset[()]], dtype=self.dtype)
+                return
+
+            # choose a slab height along the first axis that holds about
+            # chunk_size values
+            row_size = int(np.prod(shape[1:]))
+            rows = max(1, int(chunk_size) // max(row_size, 1))
+            logger.debug('reading %s %s in slabs of %d rows'
+                    %(metric_name, group, rows))
+
+            for start in range(0, shape[0], rows):
+                stop = min(start + rows, shape[0])
+                subdata = self.read_dataset(dataset, start, stop)
+                if filter_mat is not None:
+                    subdata = subdata*filter_mat[start:stop]
+                    subdata[subdata == 0] = np.nan
+                yield subdata.ravel()
+
+    def get_sampled_column(self, metric_name, group, indices,
+            chunk_size=2**20, cutoff='full'):
+        '''
+        Returns the flattened data of a single metric and energy group at the
+        sorted flat mesh indices, read chunk by chunk so only one slab is in
+        memory at a time.
+        '''
+        values = np.empty(len(indices), dtype=self.dtype)
+        start = 0
+        for chunk in self.iter_data_chunks(metric_name, group,
+                chunk_size=chunk_size, cutoff=cutoff):
+            stop = start + chunk.size
+            low, high = np.searchsorted(indices, [start, stop])
+            values[low:high] = chunk[indices[low:high] - start]
+            start = stop
+        return values
+
+    @traced('H5Output.sample_values', 'read')
+    def sample_values(self, metric_name, group, num_samples,
+            chunk_size=2**20, cutoff='full'):
+        '''
+        Draws num_samples values, with replacement, from the data of a single
+        metric and energy group that is not filtered out, as
+        get_dataset_by_metric does, but reads the data twice in chunks
+        instead of holding all of it: once to count the values and once to
+        pick the samples.
+        '''
+        total = 0
+        for chunk in self.iter_data_chunks(metric_name, group,
+                chunk_size=chunk_size, cutoff=cutoff):
+            total += np.count_nonzero(~np.isnan(chunk))
+
+        picks = np.sort(np.random.randint(0, total, num_samples))
+        values = np.empty(num_samples, dtype=self.dtype)
+        start = 0
+        for chunk in self.iter_data_chunks(metric_name, group,
+                chunk_size=chunk_size, cutoff=cutoff):
+            chunk = chunk[~np.isnan(chunk)]
+            stop = start + chunk.size
+            low, high = np.searchsorted(picks, [start, stop])
+            values[low:high] = chunk[picks[low:high] - start]
+            start = stop
+        np.random.shuffle(values)
+        return values
+
+    @traced('H5Output.get_data_statistics', 'statistics')
     def get_data_statistics(self, filter_data=False, **kwargs):
         '''
         Calculates the average value, median value, metric variance,
@@ -501,7 +797,7 @@ class H5Output(object):
 
                 # pull the chunk of data associated with metric and group from
                 # the file.
-                data_chunk = f[metric][group][:]
+                data_chunk = self.read_dataset(f[metric][group])
 
                 if filter_data == True:
                     # sift out any of the values of the flux that lie in
@@ -522,11 +818,12 @@ class H5Output(object):
                     filtered_data = data_chunk
 
                 # calculate the statistics on the data chunk and put them into
-                # an array.
-                mean = np.mean(filtered_data)
+                # an array. The moments are accumulated in float64 whatever
+                # the precision of the data.
+                mean = np.mean(filtered_data, dtype=np.float64)
                 median = np.median(filtered_data)
-                std = np.std(filtered_data)
-                var = np.var(filtered_data)
+                std = np.std(filtered_data, dtype=np.float64)
+                var = np.var(filtered_data, dtype=np.float64)
                 stats = np.array([mean, median, std, var])
 
                 data[metric_location,group_location,:] = stats
@@ -547,15 +844,334 @@ class H5Output(object):
 #-----------------------------------------------------------------------------#
 
 class DenovoOutput(object):
-    def __init__(self, outputdirectory):
-        self.outputdirectory = str(outputdirectory)
-        pass
+    '''
+    Lazy reader for the HDF5-backed silo files written by Denovo in an ADVANTG
+    run (denovo_forward_output.silo, denovo_adjoint_output.silo,
+    denovo_omega_output.silo and fields.silo). Nothing is read when the
+    object is created. The flux variables in the file are found by name and
+    split into per-group views that follow the H5Output conventions:
+    get_datanames returns 'metric_names' (here the flux variable names) and
+    'energy_groups', iter_data_chunks yields a variable for a single group
+    in bounded slabs, and get_data_by_metric and get_data_by_energy return
+    the same dicts of names and (mesh cells, columns) matrices as H5Output.
+    Code written against H5Output can therefore read the forward, adjoint
+    and omega fluxes the same way. Data is returned in self.dtype.
+    '''
+    flux_files = ['denovo_forward_output.silo', 'denovo_adjoint_output.silo',
+                  'denovo_omega_output.silo', 'fields.silo']
 
-    def get_timing_data(self):
-        pass
+    def __init__(self, outputlocation, dtype=None):
+        '''
+        outputlocation can be a silo file or a solution directory. If it is a
+        directory, the first of flux_files found in it will be used. dtype
+        follows the H5Output precision policy.
+        '''
+        # open the logger
+        logger = logging.getLogger("analysis.DenovoOutput")
+
+        outputlocation = str(outputlocation)
+        self.outputdirectory = outputlocation
+        if os.path.isdir(outputlocation):
+            self.outputlocation = None
+            for filename in self.flux_files:
+                path = os.path.join(outputlocation, filename)
+                if os.path.isfile(path):
+                    self.outputlocation = path
+                    break
+            if self.outputlocation is None:
+                logger.error('No denovo silo file found in %s'
+                        %(outputlocation))
+        else:
+            self.outputlocation = outputlocation
+            self.outputdirectory = os.path.dirname(outputlocation)
 
-    def get_statistical_info(self):
-        pass
+        self.variables = None
+        if dtype is None:
+            dtype = precision['dtype']
+        self.dtype = np.dtype(dtype).type
+
+    def _resolve(self, obj):
+        '''
+        Returns the path of the raw dataset behind a silo object. The silo
+        HDF5 driver stores each variable as a small object whose 'silo'
+        attribute points at the data in the /.silo/ directory. Plain hdf5
+        datasets are returned as they are.
+        '''
+        if isinstance(obj, h5py.Dataset) and 'silo' not in obj.attrs:
+            return obj.name
+        if 'silo' in obj.attrs:
+            silo_attr = obj.attrs['silo']
+            names = silo_attr.dtype.names or ()
+            if 'value0' in names:
+                target = silo_attr['value0']
+                if hasattr(target, 'decode'):
+                    target = target.decode('utf8')
+                target = str(target).strip('\x00 ')
+                if target:
+                    return target
+        return None
+
+    def get_variables(self):
+        '''
+        Returns a dict of flux variable name : {group name : dataset path}.
+        Variables are matched by a trailing group number in their name, for
+        example scalar_flux_000, flux_g003 or angular_flux/group_012. The
+        dataset paths are only stored, not read.
+        '''
+        if self.variables is not None:
+            return self.variables
+
+        # open the logger
+        logger = logging.getLogger("analysis.DenovoOutput.variables")
+
+        pattern = re.compile(r"^(?P<name>.*?)[_/]*(?:group|grp|g)?_?"
+                + r"(?P<group>\d+)$")
+        variables = {}
+        found = []
+
+        with h5py.File('%s' %(self.outputlocation), 'r') as f:
+            # walk the file for every object name, skipping the raw data
+            # directory that silo keeps behind its variables
+            f.visit(found.append)
+
+            for name in found:
+                if name.startswith('.silo'):
+                    continue
+                target = self._resolve(f[name])
+                if target is None:
+                    continue
+                match = pattern.match(name)
+                if match is None or 'flux' not in match.group('name'):
+                    continue
+                if target not in f or not isinstance(f[target], h5py.Dataset):
+                    logger.warning('silo object %s points to missing data %s'
+                            %(name, target))
+                    continue
+                variable = match.group('name').strip('_/')
+                group = 'group_%03d' %int(match.group('group'))
+                variables.setdefault(variable, {})[group] = target
+
+        for variable in variables:
+            logger.debug('found %d groups of %s in %s' %(
+                len(variables[variable]), variable, self.outputlocation))
+
+        self.variables = variables
+        return variables
+
+    def get_datanames(self):
+        '''
+        Returns dict of metric_names (the flux variables) and energy_groups
+        contained in the silo file, following H5Output.get_datanames.
+        '''
+        variables = self.get_variables()
+        metric_names = sorted(variables)
+        if metric_names:
+            energy_groups = sorted(variables[metric_names[0]])
+        else:
+            energy_groups = []
+
+        names = {'metric_names' : metric_names,
+                 'energy_groups' : energy_groups}
+
+        return names
+
+    def get_shape(self, variable, group):
+        '''
+        Returns the shape of a variable for a single group without reading
+        any of its data.
+        '''
+        if type(group) == int:
+            group = 'group_%03d' %group
+        path = self.get_variables()[variable][group]
+        with h5py.File('%s' %(self.outputlocation), 'r') as f:
+            shape = f[path].shape
+        return shape
+
+    def iter_data_chunks(self, variable, group, chunk_size=2**20,
+            cutoff='full'):
+        '''
+        Generator that yields a flux variable for a single energy group in
+        flattened slabs of roughly chunk_size values, in the same way as
+        H5Output.iter_data_chunks. Angular fluxes are sliced along their
+        first (angle) axis. cutoff is accepted for compatibility; the flux
+        files have no contributon flux to filter with, so only 'full' is
+        supported.
+        '''
+        # open the logger
+        logger = logging.getLogger("analysis.DenovoOutput.datachunks")
+
+        if cutoff not in ('full', None):
+            logger.warning('cutoff %s is not supported for flux files. Using'
+                    %(cutoff) + ' all values.')
+        if type(group) == int:
+            group = 'group_%03d' %group
+        path = self.get_variables()[variable][group]
+
+        with h5py.File('%s' %(self.outputlocation), 'r') as f:
+            dataset = f[path]
+            shape = dataset.shape
+            if len(shape) == 0:
+                yield np.array([dataset[()]], dtype=self.dtype)
+                return
+
+            row_size = int(np.prod(shape[1:]))
+            rows = max(1, int(chunk_size) // max(row_size, 1))
+            for start in range(0, shape[0], rows):
+                stop = min(start + rows, shape[0])
+                yield read_dataset(dataset, self.dtype, start, stop).ravel()
+
+    def get_sampled_column(self, variable, group, indices, chunk_size=2**20,
+            cutoff='full'):
+        '''
+        Returns the flattened data of a flux variable for one group at the
+        sorted flat mesh indices, read chunk by chunk, as
+        H5Output.get_sampled_column.
+        '''
+        values = np.empty(len(indices), dtype=self.dtype)
+        start = 0
+        for chunk in self.iter_data_chunks(variable, group,
+                chunk_size=chunk_size, cutoff=cutoff):
+            stop = start + chunk.size
+            low, high = np.searchsorted(indices, [start, stop])
+            values[low:high] = chunk[indices[low:high] - start]
+            start = stop
+        return values
+
+    def get_columns(self, columns, sample_rows=None, chunk_size=2**20,
+            cutoff='full'):
+        '''
+        Returns a (mesh cells, columns) matrix of the (variable, group)
+        columns, or of sample_rows randomly chosen mesh cells (the same for
+        every column), and the number of cells sampled or None. Raises
+        ValueError if the columns do not have the same number of values.
+        '''
+        sizes = [int(np.prod(self.get_shape(variable, group))) for variable,
+                group in columns]
+        if len(set(sizes)) > 1:
+            raise ValueError('%s do not have the same number of values (%s)'
+                    %(', '.join('%s %s' %(variable, group) for variable, group
+                        in columns), ', '.join(str(size) for size in sizes)))
+        matrix_size = sizes[0] if sizes else 0
+
+        indices = None
+        rows = matrix_size
+        if sample_rows is not None and sample_rows < matrix_size:
+            indices = np.sort(np.random.choice(matrix_size, int(sample_rows),
+                replace=False))
+            rows = len(indices)
+        data = np.empty([rows, len(columns)], dtype=self.dtype)
+        for column, (variable, group) in enumerate(columns):
+            if indices is not None:
+                data[:,column] = self.get_sampled_column(variable, group,
+                        indices, chunk_size=chunk_size, cutoff=cutoff)
+                continue
+            start = 0
+            for chunk in self.iter_data_chunks(variable, group,
+                    chunk_size=chunk_size, cutoff=cutoff):
+                data[start:start + chunk.size, column] = chunk
+                start += chunk.size
+        return data, rows if indices is not None else None
+
+    @traced('DenovoOutput.get_data_by_metric', 'read')
+    def get_data_by_metric(self, variable, flatten_data=True,
+            sample_rows=None, chunk_size=2**20, **kwargs):
+        '''
+        Returns a dict with the names of each group and a (mesh cells,
+        groups) matrix of a flux variable, as H5Output.get_data_by_metric.
+        If sample_rows is given, only that many randomly chosen mesh cells
+        (the same cells for every group) are read, chunk by chunk.
+        flatten_data is accepted for compatibility; the matrix is always
+        flattened.
+        '''
+        groups = sorted(self.get_variables()[variable])
+        data, sampled = self.get_columns([(variable, group) for group in
+            groups], sample_rows, chunk_size, kwargs.get('cutoff', 'full'))
+        if sampled is not None:
+            description = 'flux data for %d sampled mesh cells, all energy ' \
+                    %(sampled) + 'groups, %s' %(variable)
+        else:
+            description = 'flux data for all energy groups, %s' %(variable)
+        return {'names' : groups,
+                'data' : data,
+                'description' : description}
+
+    @traced('DenovoOutput.get_data_by_energy', 'read')
+    def get_data_by_energy(self, group_number, flatten_data=True,
+            sample_rows=None, chunk_size=2**20, **kwargs):
+        '''
+        Returns a dict with the names of the flux variables and a (mesh
+        cells, variables) matrix of their data for one energy group, as
+        H5Output.get_data_by_energy. Raises ValueError if the variables do
+        not have the same number of values, such as a scalar and an angular
+        flux (use get_data_by_group for those). sample_rows and
+        flatten_data are as in get_data_by_metric.
+        '''
+        if type(group_number) == int:
+            group_number = 'group_%03d' %group_number
+        variables = [variable for variable in
+                self.get_datanames()['metric_names'] if group_number in
+                self.get_variables()[variable]]
+        data, sampled = self.get_columns([(variable, group_number) for
+            variable in variables], sample_rows, chunk_size,
+            kwargs.get('cutoff', 'full'))
+        if sampled is not None:
+            description = 'flux data for %d sampled mesh cells, all ' \
+                    %(sampled) + 'variables, energy %s' %(group_number)
+        else:
+            description = 'flux data for all variables, energy %s' \
+                    %(group_number)
+        return {'names' : variables,
+                'data' : data,
+                'description' : description}
+
+    @traced('DenovoOutput.get_data_by_group', 'read')
+    def get_data_by_group(self, variable, group):
+        '''
+        Returns the full array of a flux variable for one group, in
+        self.dtype. Only that group is read from the file.
+        '''
+        if type(group) == int:
+            group = 'group_%03d' %group
+        path = self.get_variables()[variable][group]
+        with h5py.File('%s' %(self.outputlocation), 'r') as f:
+            data = read_dataset(f[path], self.dtype)
+            if len(f[path].shape) == 0:
+                data = data[0]
+        return data
+
+    @traced('DenovoOutput.get_statistical_info', 'statistics')
+    def get_statistical_info(self, variables=None, chunk_size=2**20):
+        '''
+        Calculates the minimum, maximum, mean and sum of each flux variable by
+        energy group with a chunked pass over the file. Returns a dict of
+        variable : {'group numbers', 'statistics', 'data'} where data has
+        dimensions of (no. groups, 4).
+        '''
+        if variables is None:
+            variables = self.get_datanames()['metric_names']
+
+        statistics = ['minimum', 'maximum', 'mean', 'sum']
+        info = {}
+        for variable in variables:
+            groups = sorted(self.get_variables()[variable])
+            data = np.zeros([len(groups), 4])
+            for i, group in enumerate(groups):
+                low, high, total, count = np.inf, -np.inf, 0.0, 0
+                for chunk in self.iter_data_chunks(variable, group,
+                        chunk_size=chunk_size):
+                    chunk = chunk[np.isfinite(chunk)]
+                    if chunk.size == 0:
+                        continue
+                    low = min(low, chunk.min())
+                    high = max(high, chunk.max())
+                    total += np.sum(chunk, dtype=np.float64)
+                    count += chunk.size
+                mean = total/count if count else np.nan
+                data[i,:] = [low, high, mean, total]
+            info[variable] = {'group numbers' : groups,
+                              'statistics' : statistics,
+                              'data' : data}
+        return info
 
 
 #-----------------------------------------------------------------------------#
@@ -566,6 +1182,166 @@ class AnisotropyAnalysis(object):
 
 #-----------------------------------------------------------------------------#
 
+# Vectorized FOMs. These work on arrays of any shape, for example (runs, bins)
+# for several runs at once. Bins that did not score (a relative error of zero
+# or NaN) and runs without a time get a FOM of NaN rather than inf, so tables
+# show them as missing and ratios to them are NaN as well.
+
+def calculate_foms(relative_error, time):
+    '''
+    Returns the figures of merit 1/(R^2 T) for relative errors R and times
+    T, which are broadcast against each other. Returns a float for scalar
+    inputs and an array otherwise. FOMs that can not be calculated are NaN.
+    '''
+    relative_error = np.asarray(relative_error, dtype=float)
+    time = np.asarray(time, dtype=float)
+    denominator = relative_error*relative_error*time
+    with np.errstate(invalid='ignore', divide='ignore'):
+        foms = np.where(denominator > 0, 1/denominator, np.nan)
+    if foms.ndim == 0:
+        return float(foms)
+    return foms
+
+def calculate_ratios(values, reference):
+    '''
+    Returns values/reference, broadcast against each other, with NaN where
+    either is NaN or the reference is not positive. Used for the FOM and
+    relative error ratios between methods.
+    '''
+    values = np.asarray(values, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratios = np.where(reference > 0, values/reference, np.nan)
+    if ratios.ndim == 0:
+        return float(ratios)
+    return ratios
+
+def make_fom_frames(tally_data, times, keys, names):
+    '''
+    Returns the per-bin and the total FOMs of any number of tallies as two
+    tidy dataframes. tally_data is a list of tally data dicts (as in
+    MCNPOutput.get_tally_data()['tally_data']) and times the matching list
+    of times_used dicts (as in FOMAnalysis.calculate_all_foms()). keys is a
+    list of tuples that label each tally and names are their index level
+    names.
+    - bins is indexed by the key levels and 'bin' and has the energy,
+      result, relative error, mc time, total time, units, fom and fom
+      adjusted of each bin.
+    - totals is indexed by the key levels and has the same columns for the
+      tally total, with the max relative error instead of the energy.
+    The FOMs of all bins of all tallies are calculated together. fom
+    adjusted uses the total (MC and deterministic) time, it is NaN for
+    tallies without a deterministic time. Both frames also have a 'fom
+    adjusted (model)' column for every cost model in the times (see
+    cost_models), NaN for tallies without that model.
+    '''
+    names = list(names)
+    if not tally_data:
+        return pd.DataFrame(), pd.DataFrame()
+    counts = np.array([len(data['relative_error']) for data in tally_data])
+    keys = [tuple(key) for key in keys]
+
+    mc_time = np.array([time['mc_time'] for time in times], dtype=float)
+    total_time = np.array([time.get('total_time', np.nan) for time in
+        times], dtype=float)
+    units = np.array([time['units'] for time in times], dtype=object)
+    models = [model for model in cost_models if any(model in
+        time.get('total_times', {}) for time in times)]
+    model_times = dict((model, np.array([time.get('total_times',
+        {}).get(model, np.nan) for time in times], dtype=float)) for model in
+        models)
+    model_columns = ['fom adjusted (%s)' %(model) for model in models]
+    relative_error = np.concatenate([np.asarray(data['relative_error'],
+        dtype=float) for data in tally_data])
+
+    levels = [np.array([key[level] for key in keys], dtype=object) for level
+            in range(len(names))]
+    index = pd.MultiIndex.from_arrays([np.repeat(level, counts) for level in
+        levels] + [np.concatenate([np.arange(count) for count in counts])],
+        names=names + ['bin'])
+    bins = pd.DataFrame({
+        'energy' : np.concatenate([np.asarray(data['energy_groups'],
+            dtype=float) for data in tally_data]),
+        'result' : np.concatenate([np.asarray(data['tallied_result'],
+            dtype=float) for data in tally_data]),
+        'relative error' : relative_error,
+        'mc time' : np.repeat(mc_time, counts),
+        'total time' : np.repeat(total_time, counts),
+        'units' : np.repeat(units, counts)}, index=index)
+    bins['fom'] = calculate_foms(relative_error, bins['mc time'].values)
+    bins['fom adjusted'] = calculate_foms(relative_error,
+            bins['total time'].values)
+    for model, column in zip(models, model_columns):
+        bins[column] = calculate_foms(relative_error,
+                np.repeat(model_times[model], counts))
+    bins = bins[['energy', 'result', 'relative error', 'mc time',
+        'total time', 'units', 'fom', 'fom adjusted'] + model_columns]
+
+    total_error = np.array([data['tally_total_relative_error'] for data in
+        tally_data], dtype=float)
+    if len(names) == 1:
+        index = pd.Index(levels[0], name=names[0])
+    else:
+        index = pd.MultiIndex.from_arrays(levels, names=names)
+    totals = pd.DataFrame({
+        'result' : np.array([data['tallied_total'] for data in tally_data],
+            dtype=float),
+        'relative error' : total_error,
+        'max relative error' : np.array([np.max(data['relative_error']) for
+            data in tally_data], dtype=float),
+        'mc time' : mc_time,
+        'total time' : total_time,
+        'units' : units,
+        'fom' : calculate_foms(total_error, mc_time),
+        'fom adjusted' : calculate_foms(total_error, total_time)},
+        index=index)
+    for model, column in zip(models, model_columns):
+        totals[column] = calculate_foms(total_error, model_times[model])
+    totals = totals[['result', 'relative error', 'max relative error',
+        'mc time', 'total time', 'units', 'fom', 'fom adjusted'] +
+        model_columns]
+
+    return bins, totals
+
+def get_fom_ratio_frame(frame, reference, level='method', column='fom'):
+    '''
+    Returns the ratio of column (fom, a fom adjusted or relative error) of
+    every label of an index level of a frame from make_fom_frames to that
+    of the reference label, with one column per label. Raises KeyError if
+    reference is not a label of the level.
+    '''
+    values = frame[column].unstack(level)
+    if reference not in values.columns:
+        raise KeyError('%s is not a %s in the frame (they are %s)'
+                %(reference, level, ', '.join(str(label) for label in
+                    values.columns)))
+    ratios = calculate_ratios(values.values, values[reference].values[:,
+        None])
+    return pd.DataFrame(ratios, index=values.index, columns=values.columns)
+
+#-----------------------------------------------------------------------------#
+
+class memoized_property(object):
+    '''
+    A property that is computed by its function on first access and then
+    stored on the instance, so later accesses (and everything that uses it)
+    share the value. Assigning to it replaces the stored value and deleting
+    it makes the next access compute it again.
+    '''
+    def __init__(self, function):
+        self.function = function
+        self.__name__ = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.function(instance)
+        instance.__dict__[self.__name__] = value
+        return value
+
+#-----------------------------------------------------------------------------#
+
 class FOMAnalysis(object):
     '''
     This class has the options to calculate simple FoM data for a single
@@ -573,53 +1349,44 @@ class FOMAnalysis(object):
     for the tally average relative error, the tally maximum relative error, and
     the tally minumum_relative error given a speficied tally number. If a
     deterministic timing file is included, then modified FOMS including the
-    deterministic runtime will also be calculated.
+    deterministic runtime will also be calculated, under the cost_model (see
+    cost_models) and under every other model that can be calculated.
+
+    Nothing is read or calculated when the class is made. The MCNP data, the
+    timing data, the FOMs and the frames are memoized properties, each made
+    on first access and shared from then on, so asking for one FOM does not
+    build any frames. from_data and from_saved make a FOMAnalysis from
+    already parsed data or from the processed data of a Single_Run.
     '''
     def __init__(self, MC_output_file, tallynumber,
             deterministic_timing_file='', omnibus_output_file='',
-            datasavepath=''):
+            datasavepath='', cost_model='cpu time', parallel_efficiency=None):
         '''
         Sets up variables in the class that are usable by all class functions
         '''
 
         import os
 
+        if cost_model not in cost_models:
+            raise ValueError('%s is not a cost model (they are %s)'
+                    %(cost_model, ', '.join(cost_models)))
+        if cost_model == 'efficiency' and parallel_efficiency is None:
+            raise ValueError('the efficiency cost model needs a parallel '
+                    'efficiency')
+
         # set the user-specified variables for accessibility later
         self.mc_output_file = MC_output_file
         self.tallynumber = tallynumber
         self.det_timing_file = deterministic_timing_file
         self.omnibus_output_file = omnibus_output_file
-
-        # read in the relevant data for analysis into objects
-        # first, monte carlo data:
-        self.mc_data = MCNPOutput(self.mc_output_file,
-                        tallynumber=self.tallynumber).get_tally_data()
-
-        # then, if a deterministic timing file has been specified, read that
-        # data to an object as well.
-        #
-        if self.omnibus_output_file:
-            self.num_cores = get_num_cores(self.omnibus_output_file)
-
-        if deterministic_timing_file:
-            self.det_timingdata = TimingOutput(self.det_timing_file,
-                    num_cores=self.num_cores).get_timing_data()
-        else:
-            self.det_timingdata = None
-
-        # reserve some variables for accessibility later
-        self.all_foms = {}
-        self.fom_frame = self.generate_fom_frame()
-        self.timing_frame = self.generate_timing_frame()
-        self.tally_frame = self.get_tallyframe(self.mc_data['fom_trends'],
-                          index='nps')
-
+        self.cost_model = cost_model
+        self.parallel_efficiency = parallel_efficiency
 
         # specify a folder where the plots and files associated with this
         # method will be saved
         if datasavepath:
             self.savepath = datasavepath
-        elif self.det_timingdata is not None:
+        elif self.det_timing_file:
             # if no path is specified, then assume it should be saved in an
             # analysis folder alongside the MC_output_file.
             path1 = os.path.dirname(MC_output_file)
@@ -632,6 +1399,123 @@ class FOMAnalysis(object):
             self.savepath = os.path.dirname(MC_output_file)
         pass
 
+    @classmethod
+    def from_data(cls, mc_data, tallynumber, det_timingdata=None,
+            num_cores=None, **kwargs):
+        '''
+        Returns a FOMAnalysis of already parsed data: mc_data as from
+        MCNPOutput.get_tally_data and det_timingdata as from
+        TimingOutput.get_timing_data (None for an MCNP-only run). No file is
+        read. Other keyword arguments are passed to the class, for example
+        MC_output_file='path' to keep the output file name.
+        '''
+        MC_output_file = kwargs.pop('MC_output_file', '')
+        foms = cls(MC_output_file, tallynumber, **kwargs)
+        foms.mc_data = mc_data
+        foms.det_timingdata = det_timingdata
+        foms.num_cores = num_cores
+        return foms
+
+    @classmethod
+    def from_saved(cls, filenames, directories, tallynumber='44', **kwargs):
+        '''
+        Returns a FOMAnalysis of a run (filenames and directories as from
+        get_paths) with its MCNP data read from the processed data Single_Run
+        saved, or None if there is none or its inputs changed. The saved
+        FOMs and frames are reused too if they were made with the same cost
+        model. The timing and omnibus files, which are small, are read when
+        needed.
+        '''
+        from processed_data import read_saved_run_data
+
+        saved = read_saved_run_data(filenames, directories, tallynumber,
+                keys=['all foms', 'mcnp data', 'frames'])
+        if saved is None or saved.get('mcnp data') is None:
+            return None
+        foms = cls(filenames['mcnp_output_file'], tallynumber,
+                deterministic_timing_file=filenames['timing_file'] or '',
+                omnibus_output_file=filenames['omni_out_file'] or '',
+                **kwargs)
+        foms.mc_data = saved['mcnp data']
+
+        # older processed data has no cost model, it was always cpu time.
+        all_foms = saved.get('all foms') or {}
+        times_used = all_foms.get('times_used', {})
+        same_model = foms.parallel_efficiency is None and \
+                (not foms.det_timing_file or ('adjusted_foms' in all_foms
+                    and times_used.get('cost_model') == foms.cost_model))
+        if same_model:
+            foms.all_foms = all_foms
+            for name, frame in (saved.get('frames') or {}).items():
+                if name in ('fom_frame', 'timing_frame', 'tally_frame'):
+                    setattr(foms, name, frame)
+        return foms
+
+    @memoized_property
+    def mc_data(self):
+        '''
+        The tally data, fluctuation chart and timing of the MCNP output.
+        '''
+        return MCNPOutput(self.mc_output_file,
+                        tallynumber=self.tallynumber).get_tally_data()
+
+    @memoized_property
+    def num_cores(self):
+        '''
+        The cores of the deterministic run, from the omnibus output file, or
+        None without one.
+        '''
+        if self.omnibus_output_file:
+            return get_num_cores(self.omnibus_output_file)
+        return None
+
+    @memoized_property
+    def det_timingdata(self):
+        '''
+        The deterministic timing data, or None without a timing file.
+        '''
+        if self.det_timing_file:
+            return TimingOutput(self.det_timing_file,
+                    num_cores=self.num_cores,
+                    parallel_efficiency=self.parallel_efficiency
+                    ).get_timing_data()
+        return None
+
+    @memoized_property
+    def all_foms(self):
+        '''
+        The dict of all FOMs, see calculate_all_foms.
+        '''
+        return self.calculate_all_foms()
+
+    @memoized_property
+    def fom_frame(self):
+        '''
+        The FOM frame, see generate_fom_frame.
+        '''
+        return self.generate_fom_frame()
+
+    @memoized_property
+    def timing_frame(self):
+        '''
+        The timing frame, see generate_timing_frame.
+        '''
+        return self.generate_timing_frame()
+
+    @memoized_property
+    def tally_frame(self):
+        '''
+        The fluctuation chart of the tally as a frame indexed by nps.
+        '''
+        return self.get_tallyframe(self.mc_data['fom_trends'], index='nps')
+
+    @memoized_property
+    def bin_fom_frame(self):
+        '''
+        The per-bin FOM frame, see generate_bin_fom_frame.
+        '''
+        return self.generate_bin_fom_frame()
+
     def print_tally_convergence(self, printtype='', **kwargs):
         '''
         Returns the tally convergence data in a pandas dataframe, or a
@@ -640,10 +1524,7 @@ class FOMAnalysis(object):
         **kwargs.
         '''
         # first get the pandas dataframe from get_tallyframe
-        if self.tally_frame is not None:
-            frame = self.tally_frame
-        else:
-            frame = self.get_tallyframe(self.mc_data['fom_trends'], index='nps')
+        frame = self.tally_frame
 
         frame = self.format_dataframe(frame, printtype=printtype, **kwargs)
 
@@ -657,10 +1538,7 @@ class FOMAnalysis(object):
         **kwargs.
         '''
         # first get the pandas dataframe from generate_fom_frame
-        if self.fom_frame is not None:
-            frame = self.fom_frame
-        else:
-            frame = self.generate_fom_frame()
+        frame = self.fom_frame
 
         frame = self.format_dataframe(frame, printtype=printtype, **kwargs)
 
@@ -727,6 +1605,7 @@ class FOMAnalysis(object):
                 xlabel=x_label, ylabel=y_label, plot_name=plt_name)
         pass
 
+    @traced('FOMAnalysis.generate_timing_frame', 'statistics')
     def generate_timing_frame(self):
         '''Returns a dataframe of all timing data for the problem. If only an
         MCNP input exists, then only MCNP data will be reported.
@@ -744,7 +1623,7 @@ class FOMAnalysis(object):
         if self.det_timingdata is not None:
             logger.info('''Constructing
                     timing table with MCNP data from %s and timing data from
-                    %s. Parallelized times will be multiplied by %d cores.'''
+                    %s. Parallelized times will be multiplied by %s cores.'''
                     %(self.mc_output_file, self.det_timing_file, self.num_cores))
             totals = self.det_timingdata['timing_dicts']['totals']
             det_times = totals.copy()
@@ -769,12 +1648,20 @@ class FOMAnalysis(object):
 
             walltime = {'total': [ttime]}
 
+            # the deterministic time charged under each cost model, in the
+            # same units as the FOM times.
+            charged = dict((model, [value]) for model, value in
+                    self.all_foms['times_used']['det_times'].items())
+
             frame1 = pd.DataFrame(det_times).transpose()
             frame2 = pd.DataFrame(MCNP_time).transpose()
             frame3 = pd.DataFrame(walltime).transpose()
+            frame4 = pd.DataFrame(charged).transpose().reindex(
+                    [model for model in cost_models if model in charged])
 
-            data = [frame1, frame2, frame3]
-            labels = ['deterministic time', 'MCNP time', 'wall time']
+            data = [frame1, frame2, frame3, frame4]
+            labels = ['deterministic time', 'MCNP time', 'wall time',
+                    'charged deterministic time']
             frame = pd.concat(data, keys=labels)
             frame.columns = ['time (%s)' %(mc_units)]
 
@@ -793,6 +1680,7 @@ class FOMAnalysis(object):
         self.timing_frame = frame
         return frame
 
+    @traced('FOMAnalysis.generate_fom_frame', 'statistics')
     def generate_fom_frame(self):
         '''
         Returns a datframe of all FOMS for a tally. If only an MCNP input exists,
@@ -802,36 +1690,73 @@ class FOMAnalysis(object):
         in the returned dataframe.
         '''
 
-        # check to see if foms have been generated
-        if not self.all_foms:
-            all_foms = self.calculate_all_foms()
-        else:
-            all_foms = self.all_foms
+        # the foms are calculated on first use.
+        all_foms = self.all_foms
 
         # Put the MCNP FOMs into the data dict.
         data = {'MC': [all_foms['fom_mc']['FOM'], all_foms['fom_max']['FOM'],
             all_foms['fom_min']['FOM'], all_foms['fom_mc']['time'] ] }
 
         # If the deterministic timing file is present, then calculate the
-        # modified FOMS and add them to the data dict too
+        # modified FOMS and add them to the data dict too, for the chosen cost
+        # model and then for every cost model.
+        columns = ['MC']
         if self.det_timingdata is not None:
             data.update({ 'MC_adjusted':
                     [all_foms['fom_mc_det']['FOM'],
                     all_foms['fom_max_det']['FOM'],
                     all_foms['fom_min_det']['FOM'],
                     all_foms['fom_mc_det']['time']]})
+            columns.append('MC_adjusted')
+            adjusted = all_foms['adjusted_foms']
+            for model in cost_models:
+                if model not in adjusted:
+                    continue
+                column = 'MC_adjusted (%s)' %(model)
+                data[column] = [adjusted[model]['fom_mc']['FOM'],
+                        adjusted[model]['fom_max']['FOM'],
+                        adjusted[model]['fom_min']['FOM'],
+                        adjusted[model]['fom_mc']['time']]
+                columns.append(column)
 
         # add labels for the index
         labels = ['tally avg', 'max RE', 'min RE', 'time (mins)']
 
         # put the data into a datframe.
-        frame = pd.DataFrame(data, index=labels)
+        frame = pd.DataFrame(data, index=labels)[columns]
 
         # add the frame to the data object.
         self.fom_frame = frame
 
         return frame
 
+    def generate_bin_fom_frame(self):
+        '''
+        Returns a dataframe of the FOMs of every energy bin of the tally,
+        indexed by bin, with the MC FOM and (if a deterministic timing file
+        is present) the adjusted FOM. See make_fom_frames.
+        '''
+        bins, totals = make_fom_frames([self.mc_data['tally_data']],
+                [self.all_foms['times_used']], [(self.tallynumber,)],
+                ['tally'])
+        self.bin_fom_frame = bins.xs(self.tallynumber, level='tally')
+
+        return self.bin_fom_frame
+
+    def predict_convergence(self, target_error=0.05, fit_fraction=0.5):
+        '''
+        Predicts the histories and computer time the tally needs to reach
+        target_error from its fluctuation chart, and whether it will
+        converge at all. See convergence.predict_convergence.
+        '''
+        from convergence import predict_convergence
+
+        return predict_convergence(self.mc_data['fom_trends'],
+                target_error=target_error,
+                mc_time=self.mc_data['timing']['mcrun_time']['time'],
+                fit_fraction=fit_fraction)
+
+    @traced('FOMAnalysis.generic_scatterplot', 'plotting')
     def generic_scatterplot(self, xdata, ydata, savepath, title='title',
             xlabel='xlabel', ylabel='ylabel', plot_name='generic'):
         '''
@@ -849,12 +1774,15 @@ class FOMAnalysis(object):
         plt.ylabel(ylabel)
         plt.savefig('%s/%s.pdf' %(savepath,plot_name), hbox_inches='tight')
 
+    @traced('FOMAnalysis.calculate_all_foms', 'statistics')
     def calculate_all_foms(self):
         '''
         Function to calculate the FOMS for the problem. Returns dict with
-        either 3  or 6 entries. If only MCNP output is found, then dict will
+        either 3  or 7 entries. If only MCNP output is found, then dict will
         contain Monte Carlo-exclusive FOMS. If MCNP output and deterministic
-        output are found, then dict will also include adjusted FOMS.
+        output are found, then dict will also include adjusted FOMS with the
+        cost model of the class, and in adjusted_foms the adjusted FOMS of
+        every cost model.
         '''
 
         # open the logger
@@ -912,22 +1840,60 @@ class FOMAnalysis(object):
             # add all deterministic stuff to dict if timingdata has been
             # generated for this problem
 
-            det_time = self.det_timingdata['adjusted_deterministic_time']
+            costs = self.det_timingdata['deterministic_costs']
+            if self.parallel_efficiency is not None:
+                # timing data read without the efficiency of this analysis
+                # (for example given to from_data) has no efficiency cost.
+                cores = self.det_timingdata.get('num_cores')
+                if cores is None:
+                    cores = self.num_cores if self.num_cores is not None \
+                            else 1
+                costs = dict(costs, efficiency=get_deterministic_costs(
+                    self.det_timingdata['serial_time'],
+                    self.det_timingdata['denovo_wall_time'], cores,
+                    self.parallel_efficiency)['efficiency'])
+            models = [model for model in cost_models if model in costs]
+            det_times = np.array([costs[model] for model in models])
+            serial_time = self.det_timingdata['serial_time']
+            denovo_time = self.det_timingdata['denovo_wall_time']
 
             # make sure units of time match between files
             det_units = self.det_timingdata['units']
             if det_units == 'seconds' and mc_units == 'minutes':
-                det_time = det_time/60.0
+                det_times = det_times/60.0
+                serial_time = serial_time/60.0
+                denovo_time = denovo_time/60.0
             else:
                 logger.debug('The units for these timing files are different from'
                       'expected vals. det units are %s and mc units are %s'
                       %(det_units, mc_units))
 
-            total_time = std_fom_time + det_time
+            total_times = std_fom_time + det_times
+            det_time = det_times[models.index(self.cost_model)]
+            total_time = total_times[models.index(self.cost_model)]
+
+            # the total, max and min RE FOMs of every cost model at once.
+            foms = calculate_foms(np.array([total_err, max_err,
+                min_err])[:, None], total_times[None, :])
+            adjusted_foms = {}
+            for number, model in enumerate(models):
+                adjusted_foms[model] = dict((key, {
+                    'time' : total_times[number],
+                    'relative_error' : err,
+                    'FOM' : foms[row, number]}) for row, (key, err) in
+                    enumerate([('fom_mc', total_err), ('fom_max', max_err),
+                        ('fom_min', min_err)]))
 
             time_data.update({
                      'det_time' : det_time,
                      'total_time' : total_time,
+                     'cost_model' : self.cost_model,
+                     'det_times' : dict(zip(models, det_times)),
+                     'total_times' : dict(zip(models, total_times)),
+                     'serial_time' : serial_time,
+                     'denovo_wall_time' : denovo_time,
+                     'cores' : self.num_cores if self.num_cores is not None
+                         else 1,
                 })
 
             # calculate the deterministic adjusted FOMs. Add them to
@@ -941,6 +1907,7 @@ class FOMAnalysis(object):
                    'fom_mc_det': dat4,
                    'fom_max_det': dat5,
                    'fom_min_det': dat6,
+                   'adjusted_foms' : adjusted_foms,
                    'times_used' : time_data,
                 })
 
@@ -954,8 +1921,8 @@ class FOMAnalysis(object):
         putting fom data into a dictionary.
         '''
 
-        # calculate the FOM
-        figure_of_merit = np.divide(1,(err**2)*time)
+        # calculate the FOM. It is NaN if the error is zero.
+        figure_of_merit = calculate_foms(err, time)
 
         return {
                 'time': time,
@@ -10,13 +10,38 @@ from __future__ import (division, absolute_import, print_function, )
 import os
 import logging
 import json
+import hashlib
+import math
+import threading
+import importlib
+import time
+import sys
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+from instrumentation import stage
 ###############################################################################
 
-def format_logger(name,logfile):
+# re-raises an exception from sys.exc_info() with its original traceback,
+# such as one caught in another thread. The python 2 form is a syntax error
+# in python 3, so it is compiled only there.
+if sys.version_info[0] < 3:
+    exec('def reraise(exc_info):\n'
+         '    raise exc_info[0], exc_info[1], exc_info[2]\n')
+else:
+    def reraise(exc_info):
+        raise exc_info[1].with_traceback(exc_info[2])
+
+def format_logger(name,logfile=None):
     '''
     Logging formatting function. When called it will specify the string output
     format of the logger and it will also specify the filepath for the log
-    savefile.
+    savefile. Without a logfile the log is only printed to the screen.
     '''
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
@@ -29,38 +54,49 @@ def format_logger(name,logfile):
     logger.addHandler(handler)
 
     # specify the to-file printing for the logger.
-    fh = logging.FileHandler(filename=logfile)
-    fh.setLevel(logging.DEBUG)
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
+    if logfile is not None:
+        fh = logging.FileHandler(filename=logfile)
+        fh.setLevel(logging.DEBUG)
+        fh.setFormatter(formatter)
+        logger.addHandler(fh)
 
     return logger
 
+# The files each analysis flag depends on. verify_input_flags turns a flag off
+# if one of its files is missing, and Single_Run builds its task graph from
+# the same table.
+dependencies={'violins_for_metric': ['anisotropy_file'],
+        'violins_for_energy': ['anisotropy_file'],
+        'boxes_for_metric': ['anisotropy_file'],
+        'boxes_for_energy': ['anisotropy_file'],
+        'strip_for_metric': ['anisotropy_file'],
+        'strip_for_energy': ['anisotropy_file'],
+        'fom_convergence': ['mcnp_output_file'],
+        'relative_error_by_bin': ['mcnp_output_file'],
+        'tally_result' : ['mcnp_output_file'],
+        'save_tally_data' : ['mcnp_output_file'],
+        'save_fom_data' : ['mcnp_output_file', 'timing_file'],
+        'plot_anisotropy_correlations' : ['mcnp_output_file',
+                       'anisotropy_file'],
+        'plot_anisotropy_corrs_median' : ['mcnp_output_file',
+                       'anisotropy_file'],
+        'plot_anisotropy_corrs_mean' : ['mcnp_output_file',
+                       'anisotropy_file'],
+        }
+
+# Files an analysis flag reads if they are there, but can do without. They
+# are not checked by verify_input_flags, but are inputs in the provenance of
+# its output. The adjusted FOMs charge the deterministic time at the core
+# count from the omnibus output.
+optional_dependencies={'save_fom_data': ['omni_out_file'],
+        }
+
 def verify_input_flags(input_flags, filenames, directories):
     ''' This function will print the value for each of the input flags to a
     log file in the base analysis directory.'''
 
     logger = logging.getLogger("analysis.utils.input-flags")
 
-    dependencies={'violins_for_metric': ['anisotropy_file'],
-            'violins_for_energy': ['anisotropy_file'],
-            'boxes_for_metric': ['anisotropy_file'],
-            'boxes_for_energy': ['anisotropy_file'],
-            'strip_for_metric': ['anisotropy_file'],
-            'strip_for_energy': ['anisotropy_file'],
-            'fom_convergence': ['mcnp_output_file'],
-            'relative_error_by_bin': ['mcnp_output_file'],
-            'tally_result' : ['mcnp_output_file'],
-            'save_tally_data' : ['mcnp_output_file'],
-            'save_fom_data' : ['mcnp_output_file', 'timing_file'],
-            'plot_anisotropy_correlations' : ['mcnp_output_file',
-                           'anisotropy_file'],
-            'plot_anisotropy_corrs_median' : ['mcnp_output_file',
-                           'anisotropy_file'],
-            'plot_anisotropy_corrs_mean' : ['mcnp_output_file',
-                           'anisotropy_file'],
-            }
-
     input_flags2 = input_flags.copy()
 
     for flag in input_flags:
@@ -100,11 +136,12 @@ def check_analysis(path, inputs):
     return
 
 
-def get_paths(path, analysis_dirname='analysis'):
+def get_paths(path, analysis_dirname='analysis', create_analysis_dir=True):
     '''
     Given a path for a solution directory, this function will populate two
     different dicts (filenames and directories) with pertinent information used
-    in data processing later on.
+    in data processing later on. The analysis directory is created unless
+    create_analysis_dir is False.
     '''
 
     logger = logging.getLogger("analysis.utils.get_paths")
@@ -162,7 +199,7 @@ def get_paths(path, analysis_dirname='analysis'):
     if os.path.isdir(analysis_dir):
         logger.info("Analysis directory and data found at %s" %analysis_dir \
                 + " not creating new directory")
-    else:
+    elif create_analysis_dir == True:
         logger.info("Creating an analysis directory at %s" %(analysis_dir))
         os.makedirs(analysis_dir)
 
@@ -297,6 +334,535 @@ def get_num_cores(filepath):
             num_cores = 1
         return num_cores
 
+def parse_walltime(walltime):
+    '''
+    Returns the seconds of a PBS walltime ([[HH:]MM:]SS, so 20:00 is twenty
+    minutes).
+    '''
+    seconds = 0
+    for part in str(walltime).strip().split(':'):
+        seconds = 60*seconds + int(part)
+    return seconds
+
+def format_walltime(seconds):
+    '''
+    Returns a PBS walltime (HH:MM:00) of a number of seconds, rounded up to
+    the minute.
+    '''
+    minutes = int(math.ceil(seconds/60))
+    return '%02d:%02d:00' %(minutes//60, minutes%60)
+
+def get_file_fingerprint(filepath):
+    '''
+    Returns a cheap fingerprint of a file (its size and modification time)
+    that can be stored with processed data to check later whether the file
+    has changed. Returns None if the file does not exist.
+    '''
+    if filepath is None or not os.path.isfile(str(filepath)):
+        return None
+    stat = os.stat(str(filepath))
+    return {'size' : stat.st_size,
+            'mtime' : stat.st_mtime}
+
+def get_fingerprints(filenames, keys=None):
+    '''
+    Returns a dict of fingerprints for the files in a filenames dict (as
+    returned by get_paths). If keys is given, only those files are included.
+    '''
+    if keys is None:
+        keys = filenames.keys()
+    return dict((key, get_file_fingerprint(filenames.get(key))) for key in
+            keys)
+
+def get_file_hash(filepath, block_size=2**20):
+    '''
+    Returns the sha1 hash of the contents of a file, read in blocks of
+    block_size bytes. Returns None if the file does not exist.
+    '''
+    if filepath is None or not os.path.isfile(str(filepath)):
+        return None
+    sha = hashlib.sha1()
+    with open(str(filepath), 'rb') as fp:
+        block = fp.read(block_size)
+        while block:
+            sha.update(block)
+            block = fp.read(block_size)
+    return sha.hexdigest()
+
+def get_parameter_hash(parameters):
+    '''
+    Returns the sha1 hash of a dict of parameters. Values that json cannot
+    write are hashed by their repr.
+    '''
+    text = json.dumps(parameters, sort_keys=True, default=repr)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class Provenance(object):
+    '''
+    Provenance manifest of the outputs in an analysis directory. For each
+    output (a named group of artifacts, such as all the violin plots of a
+    run) it records the content hashes of its input files, the hash of the
+    parameters that produced it and the artifact paths. An output is stale,
+    and has to be rebuilt, if it has no record, if any of its inputs or
+    parameters changed, or if any of its artifacts is missing.
+
+    Hashing a large anisotropy file is slow, so the manifest also keeps the
+    hash of each input file with its fingerprint (size and modification
+    time) and only rehashes files whose fingerprint changed.
+    '''
+    version = 1
+
+    def __init__(self, manifest_path):
+        logger = logging.getLogger("analysis.utils.provenance")
+
+        self.manifest_path = manifest_path
+        self.files = {}
+        self.outputs = {}
+        self.lock = threading.Lock()
+
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, 'r') as fp:
+                    manifest = json.load(fp)
+            except (IOError, ValueError) as e:
+                logger.warning("provenance manifest %s could not be read (%s)."
+                        %(manifest_path, e) + " Rebuilding all outputs.")
+                manifest = {}
+            if manifest.get('version') == self.version:
+                self.files = manifest.get('files', {})
+                self.outputs = manifest.get('outputs', {})
+
+    def get_input_hashes(self, inputs):
+        '''
+        Returns a dict of input path : content hash for a list of input
+        files.
+        '''
+        hashes = {}
+        for filepath in inputs:
+            filepath = str(filepath)
+            fingerprint = get_file_fingerprint(filepath)
+            with self.lock:
+                known = self.files.get(filepath)
+            if known is not None and fingerprint is not None and \
+            known['fingerprint'] == fingerprint:
+                hashes[filepath] = known['hash']
+                continue
+            content_hash = get_file_hash(filepath)
+            if fingerprint is not None:
+                with self.lock:
+                    self.files[filepath] = {'fingerprint' : fingerprint,
+                                            'hash' : content_hash}
+            hashes[filepath] = content_hash
+        return hashes
+
+    def check(self, name, inputs, parameters):
+        '''
+        Returns the reason the output name has to be rebuilt, or None if its
+        recorded inputs, parameters and artifacts are all still current.
+        '''
+        with self.lock:
+            record = self.outputs.get(name)
+        if record is None:
+            return 'no record of a previous build'
+        if record['parameters'] != get_parameter_hash(parameters):
+            return 'parameters changed'
+        hashes = self.get_input_hashes(inputs)
+        for filepath in sorted(set(hashes) | set(record['inputs'])):
+            if hashes.get(filepath) != record['inputs'].get(filepath):
+                return 'input %s changed' %(filepath)
+        for artifact in record['artifacts']:
+            if not os.path.isfile(artifact):
+                return 'artifact %s is missing' %(artifact)
+        return None
+
+    def record(self, name, inputs, parameters, artifacts):
+        '''
+        Records a freshly built output. The manifest is written by save().
+        '''
+        hashes = self.get_input_hashes(inputs)
+        with self.lock:
+            self.outputs[name] = {'inputs' : hashes,
+                                  'parameters' : get_parameter_hash(parameters),
+                                  'artifacts' : sorted(set(artifacts))}
+
+    def get_artifacts(self, name):
+        '''
+        Returns the artifacts recorded for the output name.
+        '''
+        with self.lock:
+            record = self.outputs.get(name)
+        if record is None:
+            return []
+        return list(record['artifacts'])
+
+    def save(self):
+        '''
+        Writes the manifest.
+        '''
+        with self.lock:
+            manifest = {'version' : self.version,
+                        'files' : self.files,
+                        'outputs' : self.outputs}
+            with open(self.manifest_path, 'w') as fp:
+                json.dump(manifest, fp, indent=4, sort_keys=True)
+
+#-----------------------------------------------------------------------------#
+
+class Prefetcher(object):
+    '''
+    Iterates over (item, loader(item)) pairs while a background thread loads
+    the next items. This lets the reading of one metric or group overlap
+    with the plotting of the previous one. At most depth loaded items wait in
+    the queue (plus the one being loaded), so memory stays capped. With
+    depth=0 the items are loaded inline, in order, with no thread.
+    '''
+    def __init__(self, items, loader, depth=1, name='prefetch'):
+        self.items = list(items)
+        self.loader = loader
+        self.depth = depth
+        self.name = name
+        self.read_time = 0.
+        self.wait_time = 0.
+
+    def __iter__(self):
+        if self.depth <= 0:
+            for item in self.items:
+                start = time.time()
+                data = self.loader(item)
+                elapsed = time.time() - start
+                self.read_time += elapsed
+                self.wait_time += elapsed
+                yield item, data
+                # drop the consumed item before the next one is loaded
+                data = None
+            return
+
+        loaded = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+
+        def produce():
+            for item in self.items:
+                if stop.is_set():
+                    return
+                start = time.time()
+                try:
+                    data = self.loader(item)
+                except Exception:
+                    # keep the traceback of the loader for the consumer
+                    loaded.put((item, None, sys.exc_info()))
+                    return
+                self.read_time += time.time() - start
+                loaded.put((item, data, None))
+
+        thread = threading.Thread(target=produce, name=self.name)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            for _ in self.items:
+                start = time.time()
+                item, data, exc_info = loaded.get()
+                self.wait_time += time.time() - start
+                if exc_info is not None:
+                    reraise(exc_info)
+                yield item, data
+                data = None
+        finally:
+            # let the loader thread finish if the consumer stops early
+            stop.set()
+            while thread.is_alive():
+                try:
+                    loaded.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+    def get_overlap(self):
+        '''
+        Returns a dict with the total read time, the time the consumer spent
+        waiting for data, and the read time hidden behind other work.
+        '''
+        hidden = max(self.read_time - self.wait_time, 0.)
+        if self.read_time > 0:
+            fraction = hidden/self.read_time
+        else:
+            fraction = 0.
+        return {'read_time' : self.read_time,
+                'wait_time' : self.wait_time,
+                'overlap_time' : hidden,
+                'overlap_fraction' : fraction}
+
+    def log_overlap(self, logger=None):
+        '''
+        Writes the overlap achieved by the prefetcher to the log.
+        '''
+        if logger is None:
+            logger = logging.getLogger("analysis.utils.prefetch")
+        overlap = self.get_overlap()
+        logger.info("%s: %.2f s of %.2f s of reading overlapped with other "
+                %(self.name, overlap['overlap_time'], overlap['read_time'])
+                + "work (%.0f%%), %.2f s spent waiting for data"
+                %(100*overlap['overlap_fraction'], overlap['wait_time']))
+        return overlap
+
+#-----------------------------------------------------------------------------#
+
+class TaskGraph(object):
+    '''
+    A small dependency-driven task scheduler. Tasks are added with the names
+    of the tasks they require and are run on a pool of worker threads as
+    soon as their requirements have finished, so independent tasks run
+    concurrently and every shared intermediate is computed exactly once.
+    Tasks marked exclusive (for example anything that draws with pyplot,
+    which is not thread safe) never run at the same time as each other. The
+    time taken by each task is written to the log.
+    '''
+    def __init__(self, name='tasks'):
+        self.name = name
+        self.tasks = {}
+        self.order = []
+        self.results = {}
+        self.timings = {}
+        self.exclusive_lock = threading.Lock()
+
+    def add_task(self, name, function, requires=(), exclusive=False):
+        '''
+        Adds a task. function is called with no arguments and its return
+        value can be read by later tasks with get(name).
+        '''
+        if name in self.tasks:
+            raise ValueError('task %s was added twice' %(name))
+        self.tasks[name] = {'function' : function,
+                            'requires' : list(requires),
+                            'exclusive' : exclusive}
+        self.order.append(name)
+
+    def __contains__(self, name):
+        return name in self.tasks
+
+    def prune(self, targets):
+        '''
+        Removes every task that is not one of targets and is not required,
+        directly or indirectly, by one of them.
+        '''
+        keep = set()
+        remaining = [name for name in targets if name in self.tasks]
+        while remaining:
+            name = remaining.pop()
+            if name in keep:
+                continue
+            keep.add(name)
+            remaining.extend(self.tasks[name]['requires'])
+        for name in list(self.order):
+            if name not in keep:
+                del self.tasks[name]
+                self.order.remove(name)
+
+    def get(self, name):
+        '''
+        Returns the result of a finished task.
+        '''
+        return self.results[name]
+
+    def check(self):
+        '''
+        Checks that every requirement is a known task and that the graph has
+        no cycles. Raises ValueError otherwise.
+        '''
+        for name in self.order:
+            for requirement in self.tasks[name]['requires']:
+                if requirement not in self.tasks:
+                    raise ValueError('task %s requires unknown task %s'
+                            %(name, requirement))
+        done = set()
+        remaining = list(self.order)
+        while remaining:
+            ready = [name for name in remaining if
+                    all(r in done for r in self.tasks[name]['requires'])]
+            if not ready:
+                raise ValueError('tasks %s have circular requirements'
+                        %(remaining))
+            done.update(ready)
+            remaining = [name for name in remaining if name not in done]
+
+    def run_task(self, name):
+        '''
+        Runs a single task and records its result and wall time. For
+        exclusive tasks the time spent waiting for the lock is not counted.
+        '''
+        task = self.tasks[name]
+        if task['exclusive']:
+            with self.exclusive_lock:
+                start = time.time()
+                with stage(name, 'task'):
+                    result = task['function']()
+                elapsed = time.time() - start
+        else:
+            start = time.time()
+            with stage(name, 'task'):
+                result = task['function']()
+            elapsed = time.time() - start
+        self.results[name] = result
+        self.timings[name] = elapsed
+        return result
+
+    def run(self, max_workers=1):
+        '''
+        Runs every task once its requirements have finished, with at most
+        max_workers tasks at a time. Tasks whose requirements failed are
+        skipped. The first error is raised again once all other tasks are
+        done. Returns the dict of task name : wall time in seconds.
+        '''
+        logger = logging.getLogger("analysis.utils.taskgraph")
+
+        self.check()
+        max_workers = max(1, int(max_workers))
+        logger.info("running %d %s tasks on %d worker(s)" %(len(self.order),
+            self.name, max_workers))
+
+        finished = queue.Queue()
+        running = set()
+        done = set()
+        failed = {}
+        skipped = set()
+        start = time.time()
+
+        def work(name):
+            try:
+                self.run_task(name)
+                finished.put((name, None))
+            except Exception as error:
+                logger.exception("task %s failed" %(name))
+                finished.put((name, error))
+
+        while len(done) + len(failed) + len(skipped) < len(self.order):
+            # skip anything that can no longer run
+            for name in self.order:
+                if name in done or name in failed or name in skipped or \
+                name in running:
+                    continue
+                requires = self.tasks[name]['requires']
+                if any(r in failed or r in skipped for r in requires):
+                    logger.warning("skipping task %s because a task it"
+                            %(name) + " requires did not finish")
+                    skipped.add(name)
+
+            # start every task that is ready, in the order they were added
+            for name in self.order:
+                if len(running) >= max_workers:
+                    break
+                if name in done or name in failed or name in skipped or \
+                name in running:
+                    continue
+                if all(r in done for r in self.tasks[name]['requires']):
+                    running.add(name)
+                    if max_workers == 1:
+                        work(name)
+                    else:
+                        thread = threading.Thread(target=work, args=(name,),
+                                name='%s: %s' %(self.name, name))
+                        thread.daemon = True
+                        thread.start()
+
+            if not running:
+                continue
+
+            name, error = finished.get()
+            running.discard(name)
+            if error is None:
+                done.add(name)
+                logger.info("task %s finished in %.2f s"
+                        %(name, self.timings[name]))
+            else:
+                failed[name] = error
+
+        total = time.time() - start
+        serial = sum(self.timings.values())
+        logger.info("%s tasks finished in %.2f s (%.2f s if run serially)"
+                %(self.name, total, serial))
+
+        if failed:
+            raise failed[[n for n in self.order if n in failed][0]]
+
+        return self.timings
+
+class LazyModule(object):
+    '''
+    Stands in for a module that is imported the first time one of its
+    attributes is used, so that modules which only sometimes plot do not pay
+    for importing matplotlib and seaborn when they start. setup is called
+    just before the import (for example to choose the matplotlib backend).
+    '''
+    def __init__(self, name, setup=None):
+        self.__dict__['_name'] = name
+        self.__dict__['_setup'] = setup
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                if self._setup is not None:
+                    self._setup()
+                self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        module = self._module if self._module is not None else self._load()
+        return getattr(module, attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        return '<lazy module %s%s>' %(self._name,
+                '' if self._module is None else ' (loaded)')
+
+def use_agg():
+    '''
+    Sets the Agg backend before pyplot is imported, so figures can be drawn
+    without a screen. If pyplot was already imported (in a notebook, say),
+    its backend is left alone.
+    '''
+    import matplotlib
+    if 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('agg')
+
+class LazyDict(MutableMapping):
+    '''
+    A dict whose contents are built by builder() the first time it is used,
+    for tables (like the plotting palettes) that are costly to compute when
+    a module is imported.
+    '''
+    def __init__(self, builder):
+        self.builder = builder
+        self.data = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.data is None:
+                self.data = dict(self.builder())
+        return self.data
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __delitem__(self, key):
+        del self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __repr__(self):
+        return repr(self.load())
+
 #-----------------------------------------------------------------------------#
 
 # A few useful dicts that can be used for convenience. metric_names is used for
@@ -5,13 +5,15 @@
 #
 # <+Description+>
 ###############################################################################
+from __future__ import (division, absolute_import, print_function, )
 #-----------------------------------------------------------------------------#
 import numpy as np
 import h5py
-import matplotlib as mpl
-mpl.use('agg')
-import matplotlib.pyplot as plt
 import os
+import logging
+from analysis import H5Output
+from analysis_utils import xscales, metric_names, LazyModule, use_agg
+plt = LazyModule('matplotlib.pyplot', setup=use_agg)
 
 ###############################################################################
 
@@ -70,6 +72,511 @@ class AnisotropyAnalysis(object):
 
 #-----------------------------------------------------------------------------#
 
+class AnisotropyHistograms(object):
+    '''
+    Streaming histogram engine for problem_anisotropies.h5 files. Histograms
+    for every metric and energy group of every file are built chunk by
+    chunk, so no metric is ever fully loaded into memory. Bin edges are
+    shared by all files for a given metric so histograms from different
+    problems (or different runs of a study) can be compared directly. Log
+    binning is used for metrics with a log xscale in analysis_utils.xscales
+    unless otherwise specified.
+
+    The data is read twice unless the bin edges are given: once to find the
+    range of each metric over all files (get_bin_edges) and once to fill the
+    histograms. The edges of a saved histogram file (load_histograms) can
+    be given to read the data only once.
+    '''
+    def __init__(self, anisotropy_files, num_bins=50, scales=None,
+            bin_edges=None, chunk_size=2**20, cutoff='full'):
+        '''
+        anisotropy_files can be a list of anisotropy files or a dict of
+        label : anisotropy file. Reader objects with the H5Output
+        conventions (for example a DenovoOutput for a flux file) can be given
+        in place of a filename. If bin_edges (a dict of metric : edges, for
+        example from a previously saved histogram file) is given, the range
+        finding pass is skipped and the data is only read once.
+        '''
+        if isinstance(anisotropy_files, dict):
+            self.files = dict(anisotropy_files)
+        else:
+            self.files = dict((os.path.abspath(str(path)), path) \
+                    for path in anisotropy_files)
+        self.num_bins = num_bins
+        self.scales = xscales.copy()
+        if scales:
+            self.scales.update(scales)
+        self.bin_edges = dict(bin_edges) if bin_edges else {}
+        self.chunk_size = chunk_size
+        self.cutoff = cutoff
+
+        self.metrics = None
+        self.groups = {}
+        self.histograms = {}
+
+    def get_reader(self, label):
+        '''
+        Returns the reader object used for the file with the given label.
+        '''
+        source = self.files[label]
+        if hasattr(source, 'iter_data_chunks'):
+            return source
+        return H5Output(source)
+
+    def get_metrics(self):
+        '''
+        Returns the metric names common to all of the anisotropy files. The
+        contributon flux is not histogrammed.
+        '''
+        metrics = None
+        for label in sorted(self.files):
+            names = self.get_reader(label).get_datanames()
+            file_metrics = [m for m in names['metric_names'] if m !=
+                    'contributon_flux']
+            self.groups[label] = list(names['energy_groups'])
+            if metrics is None:
+                metrics = file_metrics
+            else:
+                metrics = [m for m in metrics if m in file_metrics]
+        self.metrics = metrics
+        return metrics
+
+    def get_bin_edges(self):
+        '''
+        Returns a dict of metric : bin edges. Edges that were not supplied by
+        the user are found from the global range of each metric over all
+        files and groups with a chunked min/max pass. Log-scaled metrics only
+        use their positive values to set the range.
+        '''
+        logger = logging.getLogger("analysis.anisotropy.histograms")
+
+        if self.metrics is None:
+            self.get_metrics()
+
+        missing = [m for m in self.metrics if m not in self.bin_edges]
+        if not missing:
+            return self.bin_edges
+
+        logger.info("finding shared histogram ranges for %s" %(missing))
+        lows = dict((m, np.inf) for m in missing)
+        highs = dict((m, -np.inf) for m in missing)
+        for label in sorted(self.files):
+            h5file = self.get_reader(label)
+            for metric in missing:
+                for group in self.groups[label]:
+                    for chunk in h5file.iter_data_chunks(metric, group,
+                            chunk_size=self.chunk_size, cutoff=self.cutoff):
+                        chunk = chunk[np.isfinite(chunk)]
+                        if self.scales.get(metric) == 'log':
+                            chunk = chunk[chunk > 0]
+                        if chunk.size == 0:
+                            continue
+                        lows[metric] = min(lows[metric], chunk.min())
+                        highs[metric] = max(highs[metric], chunk.max())
+
+        for metric in missing:
+            low, high = lows[metric], highs[metric]
+            if not np.isfinite(low):
+                logger.warning("no usable values found for %s. Using a"
+                        %(metric) + " unit range for its bins.")
+                low, high = (1.0, 10.0) if self.scales.get(metric) == 'log' \
+                        else (0.0, 1.0)
+            if high <= low:
+                high = low*10.0 if self.scales.get(metric) == 'log' \
+                        else low + 1.0
+            if self.scales.get(metric) == 'log':
+                edges = np.logspace(np.log10(low), np.log10(high),
+                        self.num_bins + 1)
+            else:
+                edges = np.linspace(low, high, self.num_bins + 1)
+            self.bin_edges[metric] = edges
+
+        return self.bin_edges
+
+    def fill(self):
+        '''
+        Makes a chunked pass over every file and fills the histograms of
+        every metric and group. If the bin edges of some metrics were not
+        given, get_bin_edges first makes another chunked pass to find their
+        ranges, so the data of those metrics is read twice. Returns a dict of
+        label : metric : {'counts', 'below', 'above', 'nonfinite'} where
+        counts has dimensions of (no. groups, no. bins). Values outside the
+        shared edges (and non-positive values for log bins) are counted in
+        below and above so no data is silently dropped.
+        '''
+        logger = logging.getLogger("analysis.anisotropy.histograms")
+
+        edges = self.get_bin_edges()
+
+        for label in sorted(self.files):
+            logger.info("histogramming anisotropy data for %s" %(label))
+            h5file = self.get_reader(label)
+            groups = self.groups[label]
+            hists = {}
+            for metric in self.metrics:
+                log_bins = self.scales.get(metric) == 'log'
+                metric_edges = edges[metric]
+                num_bins = len(metric_edges) - 1
+                if log_bins:
+                    bin_range = (np.log10(metric_edges[0]),
+                                 np.log10(metric_edges[-1]))
+                else:
+                    bin_range = (metric_edges[0], metric_edges[-1])
+
+                counts = np.zeros([len(groups), num_bins], dtype=np.int64)
+                below = np.zeros(len(groups), dtype=np.int64)
+                above = np.zeros(len(groups), dtype=np.int64)
+                nonfinite = np.zeros(len(groups), dtype=np.int64)
+
+                for i, group in enumerate(groups):
+                    for chunk in h5file.iter_data_chunks(metric, group,
+                            chunk_size=self.chunk_size, cutoff=self.cutoff):
+                        finite = np.isfinite(chunk)
+                        nonfinite[i] += chunk.size - np.count_nonzero(finite)
+                        chunk = chunk[finite]
+                        if log_bins:
+                            below[i] += np.count_nonzero(chunk <= 0)
+                            chunk = np.log10(chunk[chunk > 0])
+                        # uniform bins (in log space for log metrics) keep
+                        # np.histogram on its fast path
+                        below[i] += np.count_nonzero(chunk < bin_range[0])
+                        above[i] += np.count_nonzero(chunk > bin_range[1])
+                        hist, _ = np.histogram(chunk, bins=num_bins,
+                                range=bin_range)
+                        counts[i] += hist
+
+                hists[metric] = {'counts': counts,
+                                 'below': below,
+                                 'above': above,
+                                 'nonfinite': nonfinite}
+            self.histograms[label] = hists
+
+        return self.histograms
+
+    def save(self, savepath):
+        '''
+        Saves the shared bin edges and the histogram counts to a compressed
+        hdf5 file at savepath. The file holds /edges/<metric> and, for each
+        file in label order, /run_<number>/<metric>/{counts,below,above,
+        nonfinite}, with the label, source file and energy groups in the
+        attributes of /run_<number>. That is all that is needed to plot the
+        histograms later (see load_histograms).
+        '''
+        logger = logging.getLogger("analysis.anisotropy.histograms")
+
+        if not self.histograms:
+            self.fill()
+
+        logger.info("saving anisotropy histograms to %s" %(savepath))
+        with h5py.File(str(savepath), 'w') as f:
+            f.attrs['cutoff'] = self.cutoff
+            edge_group = f.create_group('edges')
+            for metric in self.metrics:
+                dset = edge_group.create_dataset(metric,
+                        data=self.bin_edges[metric])
+                dset.attrs['scale'] = self.scales.get(metric, 'linear')
+            for num, label in enumerate(sorted(self.histograms)):
+                run_group = f.create_group('run_%03d' %num)
+                run_group.attrs['label'] = label
+                run_group.attrs['source'] = getattr(self.files[label],
+                        'outputlocation', self.files[label])
+                run_group.attrs['groups'] = [str(g) for g in
+                        self.groups[label]]
+                for metric, hist in self.histograms[label].items():
+                    metric_group = run_group.create_group(metric)
+                    for key, value in hist.items():
+                        metric_group.create_dataset(key, data=value,
+                                compression='gzip')
+        return savepath
+
+#-----------------------------------------------------------------------------#
+
+class AnisotropyDifferences(object):
+    '''
+    Streams matching (metric, group) slabs from two or more anisotropy files
+    and compares every file against the first (reference) file. This is
+    meant for parametric studies, where the anisotropy fields of neighbouring
+    study points (quad_order, pn_order, ...) should be compared without
+    loading whole files. Memory use is bounded by chunk_size.
+    '''
+    norm_names = ['L1', 'L2', 'max', 'relative L1', 'relative L2', 'count']
+
+    def __init__(self, anisotropy_files, chunk_size=2**20, cutoff='full',
+            relative_edges=None):
+        '''
+        anisotropy_files is an ordered list of files (or of (label, file)
+        pairs). The first one is the reference. relative_edges are the bin
+        edges for the histogram of the relative change (b-a)/|a|; by default
+        40 linear bins between -1 and 1 with under/overflow counts.
+        '''
+        files = []
+        for item in anisotropy_files:
+            if isinstance(item, (tuple, list)):
+                files.append((item[0], item[1]))
+            else:
+                files.append((os.path.abspath(str(item)), item))
+        if len(files) < 2:
+            raise ValueError('at least two anisotropy files are needed for'
+                    ' differencing')
+        self.files = files
+        self.chunk_size = chunk_size
+        self.cutoff = cutoff
+        if relative_edges is None:
+            relative_edges = np.linspace(-1.0, 1.0, 41)
+        self.relative_edges = np.asarray(relative_edges, dtype=np.float64)
+        self.differences = {}
+
+    def get_reader(self, source):
+        '''
+        Returns the reader object for a filename or reader object.
+        '''
+        if hasattr(source, 'iter_data_chunks'):
+            return source
+        return H5Output(source)
+
+    def get_common_names(self):
+        '''
+        Returns the metrics and groups present in every file. The contributon
+        flux is not differenced.
+        '''
+        logger = logging.getLogger("analysis.anisotropy.differences")
+
+        metrics, groups = None, None
+        for label, source in self.files:
+            names = self.get_reader(source).get_datanames()
+            file_metrics = [m for m in names['metric_names'] if m !=
+                    'contributon_flux']
+            file_groups = list(names['energy_groups'])
+            if metrics is None:
+                metrics, groups = file_metrics, file_groups
+            else:
+                dropped = [m for m in metrics if m not in file_metrics]
+                if dropped:
+                    logger.warning('%s does not have %s. They will not be'
+                            %(label, dropped) + ' compared.')
+                metrics = [m for m in metrics if m in file_metrics]
+                groups = [g for g in groups if g in file_groups]
+        return metrics, groups
+
+    def compute(self, difference_dir=None):
+        '''
+        Computes, for every file after the first, the per-group L1, L2 and max
+        difference to the reference, the same norms relative to the
+        reference, and a histogram of the pointwise relative change. Only
+        locations that are finite in both files are compared. If
+        difference_dir is given, a difference file (b-a) with the same layout
+        as the anisotropy file is written there for each comparison. Returns
+        a dict of label : {'metrics', 'group numbers', 'statistics', 'data',
+        'relative change histogram', 'relative change edges'}, where data
+        has dimensions of (no. metrics, no. groups, no. statistics).
+        '''
+        logger = logging.getLogger("analysis.anisotropy.differences")
+
+        metrics, groups = self.get_common_names()
+        ref_label, ref_source = self.files[0]
+        reference = self.get_reader(ref_source)
+        num_bins = len(self.relative_edges) - 1
+
+        for label, source in self.files[1:]:
+            logger.info("differencing anisotropies of %s against %s"
+                    %(label, ref_label))
+            other = self.get_reader(source)
+
+            data = np.zeros([len(metrics), len(groups),
+                len(self.norm_names)])
+            # two extra bins hold the under- and overflow
+            histograms = np.zeros([len(metrics), len(groups), num_bins + 2],
+                    dtype=np.int64)
+
+            diff_file = None
+            if difference_dir is not None:
+                name = '%s_minus_%s.h5' %(os.path.basename(str(label)),
+                        os.path.basename(str(ref_label)))
+                name = name.replace(os.sep, '_')
+                diff_path = os.path.join(difference_dir, name)
+                logger.info("writing difference file to %s" %(diff_path))
+                diff_file = h5py.File(diff_path, 'w')
+                diff_file.attrs['reference'] = str(ref_label)
+                diff_file.attrs['compared'] = str(label)
+
+            try:
+                for m, metric in enumerate(metrics):
+                    for g, group in enumerate(groups):
+                        shape = reference.get_shape(metric, group)
+                        if other.get_shape(metric, group) != shape:
+                            logger.error('%s %s has shape %s in %s and %s in'
+                                    %(metric, group, shape, ref_label,
+                                      other.get_shape(metric, group))
+                                    + ' %s. Not comparing it.' %(label))
+                            data[m, g, :] = np.nan
+                            continue
+
+                        dset = None
+                        if diff_file is not None:
+                            dset = diff_file.require_group(metric)\
+                                    .create_dataset(group, shape=shape,
+                                            dtype=np.float64)
+
+                        data[m, g, :], histograms[m, g, :] = \
+                            self.compare_group(reference, other, metric,
+                                    group, shape, dset)
+            finally:
+                if diff_file is not None:
+                    diff_file.close()
+
+            self.differences[label] = {
+                    'reference' : ref_label,
+                    'metrics' : metrics,
+                    'group numbers' : groups,
+                    'statistics' : self.norm_names,
+                    'data' : data,
+                    'relative change histogram' : histograms,
+                    'relative change edges' : self.relative_edges,
+                    }
+
+        return self.differences
+
+    def compare_group(self, reference, other, metric, group, shape,
+            dset=None):
+        '''
+        Compares a single metric and group of two files slab by slab. Returns
+        the array of norms (ordered as norm_names) and the relative change
+        histogram with under- and overflow in the first and last bins. If
+        dset is given, the difference is written into it as it is computed.
+        '''
+        l1, l2, maxdiff, ref_l1, ref_l2, count = 0., 0., 0., 0., 0., 0
+        edges = self.relative_edges
+        hist = np.zeros(len(edges) + 1, dtype=np.int64)
+        row_shape = tuple(shape[1:])
+        offset = 0
+
+        ref_chunks = reference.iter_data_chunks(metric, group,
+                chunk_size=self.chunk_size, cutoff=self.cutoff)
+        other_chunks = other.iter_data_chunks(metric, group,
+                chunk_size=self.chunk_size, cutoff=self.cutoff)
+
+        for a, b in zip(ref_chunks, other_chunks):
+            # difference in float64 so the norms do not lose precision when
+            # the data is read in float32
+            a = a.astype(np.float64, copy=False)
+            diff = np.subtract(b, a, dtype=np.float64)
+            if dset is not None:
+                rows = diff.size // max(int(np.prod(row_shape)), 1)
+                dset[offset:offset + rows] = diff.reshape((rows,) + row_shape)
+                offset += rows
+
+            valid = np.isfinite(diff)
+            diff = diff[valid]
+            a = a[valid]
+            if diff.size == 0:
+                continue
+
+            absdiff = np.abs(diff)
+            l1 += np.sum(absdiff, dtype=np.float64)
+            l2 += np.dot(diff, diff)
+            maxdiff = max(maxdiff, absdiff.max())
+            ref_l1 += np.sum(np.abs(a), dtype=np.float64)
+            ref_l2 += np.dot(a, a)
+            count += diff.size
+
+            nonzero = a != 0
+            relative = diff[nonzero]/np.abs(a[nonzero])
+            # searchsorted puts under- and overflow in the outer bins
+            hist += np.bincount(np.searchsorted(edges, relative,
+                side='right'), minlength=len(edges) + 1)
+
+        l2 = np.sqrt(l2)
+        ref_l2 = np.sqrt(ref_l2)
+        rel_l1 = l1/ref_l1 if ref_l1 > 0 else np.nan
+        rel_l2 = l2/ref_l2 if ref_l2 > 0 else np.nan
+        norms = np.array([l1, l2, maxdiff, rel_l1, rel_l2, count])
+
+        return norms, hist
+
+    def get_frame(self):
+        '''
+        Returns the per-group norms of every comparison as a long pandas
+        dataframe indexed by (label, metric, group).
+        '''
+        import pandas as pd
+
+        if not self.differences:
+            self.compute()
+
+        frames = []
+        for label in self.differences:
+            result = self.differences[label]
+            index = pd.MultiIndex.from_product([[label], result['metrics'],
+                result['group numbers']], names=['run', 'metric', 'group'])
+            values = result['data'].reshape(-1, len(self.norm_names))
+            frames.append(pd.DataFrame(values, index=index,
+                columns=self.norm_names))
+        return pd.concat(frames)
+
+def load_histograms(savepath):
+    '''
+    Reads a histogram file written by AnisotropyHistograms.save. Returns a
+    dict with the shared 'edges', the 'scales' of each metric, and the
+    'histograms' keyed by label and metric.
+    '''
+    edges = {}
+    scales = {}
+    histograms = {}
+    groups = {}
+    with h5py.File(str(savepath), 'r') as f:
+        for metric in f['edges']:
+            edges[metric] = f['edges'][metric][:]
+            scales[metric] = f['edges'][metric].attrs['scale']
+        for name in f:
+            if name == 'edges':
+                continue
+            label = f[name].attrs['label']
+            groups[label] = list(f[name].attrs['groups'])
+            histograms[label] = {}
+            for metric in f[name]:
+                histograms[label][metric] = dict((key,
+                    f[name][metric][key][:]) for key in f[name][metric])
+
+    return {'edges': edges,
+            'scales': scales,
+            'groups': groups,
+            'histograms': histograms}
+
+def plot_shared_histogram(edges, counts, savepath, metric='', scale='linear',
+        labels=None, plot_title='', density=True):
+    '''
+    Plots one or more histograms that share the bin edges given from their
+    counts only. counts can be a single count array or a list of them (for
+    example one per problem, summed over groups), with labels for the legend.
+    '''
+    counts_list = counts if isinstance(counts, list) else [counts]
+    widths = np.diff(edges)
+
+    fig = plt.figure()
+    for i, count in enumerate(counts_list):
+        weights = np.asarray(count, dtype=np.float64)
+        if density and weights.sum() > 0:
+            weights = weights/(weights.sum()*widths)
+        label = labels[i] if labels else None
+        # the left edge of each bin stands in for the data in that bin
+        plt.hist(edges[:-1], bins=edges, weights=weights, histtype='step',
+                linewidth=1, label=label)
+    if labels:
+        plt.legend()
+    plt.xscale(scale)
+    plt.yscale('log')
+    plt.xlabel('Ratio')
+    plt.ylabel('Frequency')
+    if plot_title:
+        plt.title(plot_title)
+    elif metric:
+        plt.title(r'Histogram of %s' %(metric_names.get(metric, metric)))
+    plt.grid(True)
+    plt.savefig('%s' %(savepath), bbox_inches='tight')
+    plt.close(fig)
+
+#-----------------------------------------------------------------------------#
+
 ###############################################################################
 # end of thesiscode/anisotropy.py
 ###############################################################################
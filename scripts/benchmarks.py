@@ -0,0 +1,214 @@
+###############################################################################
+# File  : thesiscode/scripts/benchmarks.py
+# Author: madicken
+# Date  : Mon Oct 19 10:02:41 2026
+#
+# Benchmarks for the analysis pipeline. Each benchmark runs its cases in a
+# separate process so that the peak memory (ru_maxrss) of one case does not
+# leak into the next.
+#    -- benchmark_precision runs a full Single_Run analysis with the
+#    anisotropy data read in float64 and in float32 and reports runtime and
+#    peak RSS for each.
+#    -- benchmark_memory_budget runs the same analysis under a series of
+#    memory budgets and reports the peak RSS of each next to its budget.
+#    -- benchmark_startup measures how long each thesiscode subcommand takes
+#    to start (interpreter start and imports) and which of the heavy
+#    libraries it loads.
+#
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import multiprocessing
+import subprocess
+import json
+import time
+import os
+import sys
+from instrumentation import get_peak_rss
+###############################################################################
+
+# the analysis flags used for a "full" Single_Run in the benchmarks.
+full_analysis = {'plot_boxes_for_metric' : True,
+                 'plot_boxes_for_energy' : True,
+                 'plot_violins_for_metric' : True,
+                 'plot_violins_for_energy' : True,
+                 'plot_strip_for_metric' : True,
+                 'plot_strip_for_energy' : True,
+                 'plot_FoM_convergence' : True,
+                 'plot_RE_by_bin' : True,
+                 'plot_tally_results' : True,
+                 'save_FoM_data' : True,
+                 'save_tally_data' : True,
+                 'plot_anisotropy_with_tallydata' : True,
+                 'plot_anisotropies_median' : True,
+                 'plot_anisotropies_mean' : True,
+                 }
+
+def _run_case(queue, function, args, kwargs):
+    '''
+    Runs a single benchmark case and puts its wall time, cpu time and peak
+    RSS on the queue, along with the error if the case raised one. Used as
+    the target of a benchmark process.
+    '''
+    start_wall = time.time()
+    start_cpu = time.clock() if hasattr(time, 'clock') else time.process_time()
+    error = None
+    try:
+        function(*args, **kwargs)
+    except Exception as e:
+        error = '%s: %s' %(type(e).__name__, e)
+    end_cpu = time.clock() if hasattr(time, 'clock') else time.process_time()
+    queue.put({'wall time (s)' : time.time() - start_wall,
+               'cpu time (s)' : end_cpu - start_cpu,
+               'peak rss (MiB)' : get_peak_rss(),
+               'error' : error})
+
+def run_isolated(function, *args, **kwargs):
+    '''
+    Runs function(*args, **kwargs) in a fresh process and returns a dict of
+    its wall time, cpu time and peak RSS.
+    '''
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_case,
+            args=(queue, function, args, kwargs))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def single_run_analysis(path, dtype=None, memory_budget=None,
+        **analysis_kwargs):
+    '''
+    Runs a full Single_Run analysis of the run at path with the given
+    anisotropy precision and memory budget.
+    '''
+    from single_run import Single_Run
+
+    run = Single_Run(path, dtype=dtype, memory_budget=memory_budget)
+    run.do_single_analysis(**analysis_kwargs)
+
+def benchmark_precision(path, dtypes=(np.float64, np.float32),
+        analysis_kwargs=None, repeats=1):
+    '''
+    Benchmarks a full Single_Run analysis of the cadisangle run at path for
+    each anisotropy precision in dtypes. Outputs are written to an
+    analysis_benchmark directory so the run's own analysis is left alone.
+    Returns a pandas dataframe with one row per precision and repeat.
+    '''
+    import pandas as pd
+
+    if analysis_kwargs is None:
+        analysis_kwargs = dict(full_analysis)
+    analysis_kwargs.setdefault('analysis_directory_name', 'analysis_benchmark')
+
+    results = []
+    for dtype in dtypes:
+        for repeat in range(repeats):
+            result = run_isolated(single_run_analysis, path, dtype=dtype,
+                    **analysis_kwargs)
+            result['dtype'] = np.dtype(dtype).name
+            result['repeat'] = repeat
+            results.append(result)
+
+    frame = pd.DataFrame(results).set_index(['dtype', 'repeat'])
+    return frame
+
+def benchmark_memory_budget(path, budgets=('4G', '1G', '512M', '256M'),
+        analysis_kwargs=None):
+    '''
+    Benchmarks a full Single_Run analysis of the run at path under each
+    memory budget in budgets. Returns a pandas dataframe with one row per
+    budget giving the peak RSS, whether it stayed within the budget and
+    the error if the analysis could not be planned within it.
+    '''
+    import pandas as pd
+    from memory_plan import parse_memory
+
+    if analysis_kwargs is None:
+        analysis_kwargs = dict(full_analysis)
+    analysis_kwargs.setdefault('analysis_directory_name', 'analysis_benchmark')
+    analysis_kwargs.setdefault('incremental', False)
+
+    results = []
+    for budget in budgets:
+        result = run_isolated(single_run_analysis, path,
+                memory_budget=budget, **analysis_kwargs)
+        result['budget'] = budget
+        result['within budget'] = result['peak rss (MiB)'] <= \
+                parse_memory(budget)/2**20
+        results.append(result)
+
+    frame = pd.DataFrame(results).set_index('budget')
+    return frame
+
+# the modules that are slow to import, checked by benchmark_startup.
+heavy_modules = ['numpy', 'h5py', 'pandas', 'matplotlib', 'matplotlib.pyplot',
+                 'seaborn', 'scipy']
+
+# run in a fresh interpreter: loads a thesiscode subcommand (or the modules
+# given) and prints the import time and the heavy modules loaded.
+startup_case = '''
+import time, sys, json
+start = time.time()
+import cli
+if %(command)r is not None:
+    cli.load_command(%(command)r)
+for name in %(modules)r:
+    __import__(name)
+%(extra)s
+print(json.dumps({'import time (s)' : time.time() - start,
+    'loaded' : [m for m in %(heavy)r if m in sys.modules]}))
+'''
+
+def benchmark_startup(commands=('analyze', 'compare', 'study', 'fom',
+        'aggregate'), repeats=5):
+    '''
+    Measures the startup time of each thesiscode subcommand: a fresh
+    interpreter that imports cli and the modules the subcommand needs,
+    without running it. 'plotting' is the same with matplotlib.pyplot,
+    seaborn and the plotting palettes loaded, which is what every
+    subcommand paid before the plotting imports were made lazy. Returns a
+    pandas dataframe with the best wall time of repeats runs for each.
+    '''
+    import pandas as pd
+
+    cases = [(command, command, [], '') for command in commands]
+    cases.append(('help', None, [], ''))
+    cases.append(('plotting', None, ['plotting_utils'],
+        'sys.modules["plotting_utils"].styles.load()'))
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for name, command, modules, extra in cases:
+        code = startup_case %{'command' : command, 'modules' : modules,
+                'extra' : extra, 'heavy' : heavy_modules}
+        best = None
+        for repeat in range(repeats):
+            start = time.time()
+            output = subprocess.check_output([sys.executable, '-c', code],
+                    cwd=here)
+            wall = time.time() - start
+            if best is None or wall < best[0]:
+                best = (wall, json.loads(output.decode('utf-8').strip()
+                    .splitlines()[-1]))
+        wall, case = best
+        results.append({'command' : name, 'wall time (s)' : wall,
+                        'import time (s)' : case['import time (s)'],
+                        'heavy modules' : ', '.join(case['loaded'])})
+
+    return pd.DataFrame(results).set_index('command')
+
+#-----------------------------------------------------------------------------#
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(benchmark_startup().to_string(float_format='%.3f'))
+        sys.exit(0)
+    print(benchmark_precision(os.path.expanduser(sys.argv[1])).to_string(
+        float_format='%.2f'))
+    print(benchmark_memory_budget(os.path.expanduser(sys.argv[1])).to_string(
+        float_format='%.2f'))
+
+###############################################################################
+# end of thesiscode/scripts/benchmarks.py
+###############################################################################
@@ -0,0 +1,562 @@
+###############################################################################
+# File  : thesiscode/scripts/cli.py
+# Author: madicken
+# Date  : Mon Oct 19 20:42:17 2026
+#
+# cli is the command line entry point of the analysis scripts (run it as
+# scripts/thesiscode or python cli.py):
+#    -- thesiscode analyze RUN runs a Single_Run analysis of a run directory.
+#    -- thesiscode compare [LABEL=]RUN ... compares any number of runs.
+#    -- thesiscode study ADVANTG_INPUT makes a parametric study (StudyMaker),
+#    one variable at a time or as a product, list or Latin hypercube sweep,
+#    and its submission scripts: sequential, a job array or runs packed by
+#    estimated runtime (submission.py).
+#    -- thesiscode fom RUN prints the figures of merit of a run.
+#    -- thesiscode aggregate ROOT aggregates every run of a study and saves
+#    its FOM ratio tables (Study_Runs), with the adjusted FOMs under every
+#    cost model.
+#    -- thesiscode converge OUTPUT predicts when the tallies of an MCNP run
+#    reach a target relative error, and follows a running job with --follow.
+#    -- thesiscode timing ROOT tabulates the deterministic timing of a study,
+#    fits its strong scaling and predicts the walltime of new configurations.
+#    -- thesiscode runtime ROOT ... trains the runtime model of the advantg and
+#    MCNP runs (runtime_model.py) on the finished runs, reports its accuracy
+#    on held out runs and saves it for thesiscode study --estimator.
+#
+# Only argparse is imported up front. Each subcommand imports the modules it
+# needs when it runs, so a small query such as fom never imports matplotlib,
+# and thesiscode --help returns at once.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import argparse
+import importlib
+import logging
+import sys
+import os
+###############################################################################
+
+# the module each command needs, imported by load_command.
+command_modules = {'analyze' : 'single_run',
+                   'compare' : 'compare_runs',
+                   'study' : 'studymaker',
+                   'fom' : 'analysis',
+                   'aggregate' : 'study_runs',
+                   'converge' : 'convergence',
+                   'timing' : 'timing_analytics',
+                   'runtime' : 'runtime_model'}
+
+# option : do_single_analysis keyword for the outputs of thesiscode analyze.
+analysis_outputs = [('boxes-for-metric', 'plot_boxes_for_metric'),
+                    ('boxes-for-energy', 'plot_boxes_for_energy'),
+                    ('violins-for-metric', 'plot_violins_for_metric'),
+                    ('violins-for-energy', 'plot_violins_for_energy'),
+                    ('strip-for-metric', 'plot_strip_for_metric'),
+                    ('strip-for-energy', 'plot_strip_for_energy'),
+                    ('fom-convergence', 'plot_FoM_convergence'),
+                    ('re-by-bin', 'plot_RE_by_bin'),
+                    ('tally-results', 'plot_tally_results'),
+                    ('save-fom-data', 'save_FoM_data'),
+                    ('save-tally-data', 'save_tally_data'),
+                    ('anisotropy-with-tallydata',
+                        'plot_anisotropy_with_tallydata'),
+                    ('anisotropies-median', 'plot_anisotropies_median'),
+                    ('anisotropies-mean', 'plot_anisotropies_mean'),
+                    ('save-data', 'save_data_json')]
+
+# option : do_compare_analysis keyword for the outputs of thesiscode compare.
+compare_outputs = [('tally-results', 'plot_tally_results'),
+                   ('tally-error', 'plot_tally_error'),
+                   ('fom-table', 'make_fomtable'),
+                   ('timing-table', 'make_timingtable'),
+                   ('tally-table', 'make_tallytable'),
+                   ('check-table', 'make_checktable'),
+                   ('save-data', 'save_data'),
+                   ('corrs', 'plot_compare_corrs'),
+                   ('corrs-median', 'plot_compare_corrs_median'),
+                   ('corrs-mean', 'plot_compare_corrs_mean')]
+
+def load_command(name):
+    '''
+    Imports the module command name needs and returns the function that
+    runs it.
+    '''
+    importlib.import_module(command_modules[name])
+    return commands[name]
+
+def get_outputs(args, outputs):
+    '''
+    Returns the keyword arguments that turn on the outputs chosen on the
+    command line (all of them with --all).
+    '''
+    kwargs = {}
+    for option, keyword in outputs:
+        if args.all or getattr(args, option.replace('-', '_')):
+            kwargs[keyword] = True
+    return kwargs
+
+def print_stale(stale):
+    '''
+    Prints the outputs a dry run would rebuild.
+    '''
+    if not stale:
+        print('all outputs are up to date')
+    for name in sorted(stale):
+        print('%s: %s' %(name, stale[name]))
+
+def analyze(args):
+    from single_run import Single_Run
+
+    run = Single_Run(os.path.expanduser(args.run), method_type=args.method,
+            dtype=args.dtype, memory_budget=args.memory_budget)
+    kwargs = get_outputs(args, analysis_outputs)
+    if not kwargs:
+        logging.getLogger("analysis.cli").warning("no outputs were chosen; "
+                + "see thesiscode analyze --help")
+    result = run.do_single_analysis(
+            analysis_directory_name=args.analysis_dir,
+            tally_number=args.tally, select_anisotropies=args.select,
+            prefetch_depth=args.prefetch_depth,
+            reuse_processed=args.reuse_processed,
+            max_workers=args.max_workers,
+            render_processes=args.render_processes,
+            incremental=args.incremental, dry_run=args.dry_run,
+            trace=args.trace, **kwargs)
+    if args.dry_run:
+        print_stale(result)
+
+def get_runs(specs):
+    '''
+    Returns a list of (label, folder) pairs from LABEL=FOLDER arguments. A
+    bare folder is labelled with its name.
+    '''
+    runs = []
+    for spec in specs:
+        if '=' in spec and not os.path.isdir(spec):
+            label, folder = spec.split('=', 1)
+        else:
+            folder = spec
+            label = os.path.basename(os.path.normpath(
+                os.path.expanduser(spec)))
+        runs.append((label, folder))
+    return runs
+
+def compare(args):
+    from compare_runs import Compare_Runs
+
+    runs = Compare_Runs(runs=get_runs(args.runs), reference=args.reference,
+            problem_name=args.name, reuse_processed=args.reuse_processed,
+            load_processes=args.load_processes,
+            analysis_dir=args.analysis_dir)
+    result = runs.do_compare_analysis(saveformat=args.format,
+            render_processes=args.render_processes,
+            incremental=args.incremental, dry_run=args.dry_run,
+            trace=args.trace, **get_outputs(args, compare_outputs))
+    if args.dry_run:
+        print_stale(result)
+
+def study(args):
+    from studymaker import StudyMaker
+
+    logging.basicConfig(format='%(levelname)s -- %(name)s : %(message)s')
+
+    points = None
+    if args.points:
+        import json
+
+        with open(os.path.expanduser(args.points)) as fp:
+            points = json.load(fp)
+    sweep = args.sweep.replace('-', ' ')
+    if points is not None and sweep == 'one at a time':
+        sweep = 'points'
+    maker = StudyMaker(args.input, xs_libs=args.xs_libs,
+            quad_type=args.quad_type, quad_order=args.quad_order,
+            pn_order=args.pn_order, x_blocks=args.x_blocks,
+            y_blocks=args.y_blocks, z_blocks=args.z_blocks, sweep=sweep,
+            points=points, samples=args.samples, seed=args.seed)
+    maker.make_study()
+    estimate = None
+    if args.estimator:
+        from runtime_model import RuntimeEstimator
+
+        estimate = RuntimeEstimator.load(args.estimator).get_estimate(
+                'mcnp' if args.mcnp else 'advantg', args.input)
+    if args.submission_script and args.array:
+        maker.make_array_script(args.submission_script, mcnpscript=args.mcnp,
+                flavor=args.scheduler, estimate=estimate,
+                walltime=args.walltime)
+    elif args.submission_script and (args.walltime or args.scripts):
+        maker.make_packed_scripts(args.submission_script,
+                mcnpscript=args.mcnp, estimate=estimate,
+                walltime=args.walltime, scripts=args.scripts,
+                cores_per_run=args.cores_per_run)
+    elif args.submission_script:
+        maker.make_submission_script(args.submission_script,
+                mcnpscript=args.mcnp)
+
+def read_saved_foms(filenames, directories, tally_number):
+    '''
+    Returns the FOM table saved by a Single_Run analysis if its MCNP output,
+    timing and omnibus files are unchanged, and None otherwise.
+    '''
+    from processed_data import read_saved_run_data
+
+    data = read_saved_run_data(filenames, directories, tally_number,
+            keys=['frames/fom_frame'])
+    if data is None:
+        return None
+    return data['frames']['fom_frame']
+
+def fom(args):
+    from analysis_utils import get_paths
+    from analysis import FOMAnalysis
+
+    # warnings go to stderr, the table to stdout.
+    logging.basicConfig(format='%(levelname)s -- %(name)s : %(message)s')
+
+    paths = get_paths(os.path.expanduser(args.run),
+            analysis_dirname=args.analysis_dir)
+    if paths is None:
+        raise SystemExit('%s is not a run directory' %(args.run))
+    filenames, directories = paths
+    if filenames['mcnp_output_file'] is None:
+        raise SystemExit('no MCNP output file found in %s' %(args.run))
+
+    frame = None
+    if args.reuse_processed:
+        frame = read_saved_foms(filenames, directories, args.tally)
+    if frame is None:
+        if filenames['timing_file'] is not None:
+            foms = FOMAnalysis(filenames['mcnp_output_file'], args.tally,
+                    deterministic_timing_file=filenames['timing_file'],
+                    omnibus_output_file=filenames['omni_out_file'])
+        else:
+            foms = FOMAnalysis(filenames['mcnp_output_file'], args.tally)
+        frame = foms.fom_frame
+
+    if args.format == 'tex':
+        print(frame.to_latex(float_format=lambda x: '%.2f' %x))
+    else:
+        print(frame.to_string(float_format=lambda x: '%.2f' %x))
+
+def aggregate(args):
+    from study_runs import Study_Runs
+
+    study_runs = Study_Runs(args.root, tally_numbers=args.tally,
+            layout=args.layout, processes=args.processes,
+            reuse_processed=args.reuse_processed,
+            analysis_dir=args.analysis_dir,
+            measure_efficiency=args.measure_efficiency)
+    study_runs.save_data()
+    for savepath in study_runs.save_tables(reference=args.reference,
+            saveformat=args.format):
+        print(savepath)
+
+def print_prediction(tallynumber, prediction):
+    '''
+    Prints a one line summary of a convergence prediction and what to do
+    with the job.
+    '''
+    if prediction['converged']:
+        advice = 'reached the target, the job can be stopped'
+    elif not prediction['will converge']:
+        advice = 'will not converge: %s' %('; '.join(prediction['problems']))
+    else:
+        advice = 'needs %.3g more histories, about %.1f more minutes' %(
+                prediction['histories remaining'],
+                prediction['time remaining'])
+    print('tally %s at %.6g histories: error %.4f, %s' %(tallynumber,
+        prediction['nps'], prediction['error'], advice))
+
+def converge(args):
+    from convergence import (predict_convergence, get_prediction_frame,
+            follow_convergence)
+    from mcnpoutput import TrackLengthTally
+
+    logging.basicConfig(format='%(levelname)s -- %(name)s : %(message)s')
+
+    if args.follow:
+        for tallynumber, prediction in follow_convergence(args.output,
+                args.tally, target_error=args.target,
+                interval=args.interval, timeout=args.timeout):
+            print_prediction(tallynumber, prediction)
+            sys.stdout.flush()
+        return
+
+    predictions = {}
+    for tallynumber in args.tally:
+        trends = TrackLengthTally(args.output, tallynumber).get_fom_data()
+        predictions[tallynumber] = predict_convergence(trends,
+                target_error=args.target)
+    frame = get_prediction_frame(predictions)
+    print(frame.transpose().to_string(float_format=lambda x: '%.4g' %x))
+
+def timing(args):
+    from timing_analytics import Timing_Runs
+
+    timing_runs = Timing_Runs(args.root, processes=args.processes,
+            analysis_dir=args.analysis_dir)
+    for savepath in timing_runs.save_tables(saveformat=args.format):
+        print(savepath)
+    for cores, x_blocks, y_blocks, z_blocks in args.predict:
+        prediction = timing_runs.predict(cores, x_blocks, y_blocks,
+                z_blocks, problem=args.problem)
+        efficiency = timing_runs.get_parallel_efficiency(cores, x_blocks,
+                y_blocks, z_blocks, problem=args.problem)
+        print('%d cores, %dx%dx%d blocks: %s, parallel efficiency %.2f, '
+                %(cores, x_blocks, y_blocks, z_blocks, ', '.join(
+                    '%s %.0f s' %(phase, prediction[phase]) for phase in
+                    ['advantg', 'denovo', 'omega', 'dispose', 'total']),
+                    efficiency) + 'request walltime=%s'
+                %(timing_runs.suggest_walltime(cores, x_blocks, y_blocks,
+                    z_blocks, problem=args.problem, margin=args.margin)))
+
+def runtime(args):
+    from runtime_model import RuntimeEstimator
+
+    logging.basicConfig(format='%(levelname)s -- %(name)s : %(message)s')
+
+    estimator = RuntimeEstimator.from_roots(args.roots,
+            processes=args.processes)
+    savepath = args.save
+    if savepath is None:
+        savepath = os.path.join(os.path.abspath(os.path.expanduser(
+            args.roots[0])), 'analysis_timing', 'runtime_model.h5')
+    print(estimator.get_coefficients().to_string(float_format='%.3g',
+        na_rep='--'))
+    print('')
+    print(estimator.accuracy_report(holdout=args.holdout,
+        seed=args.seed).to_string(float_format='%.3g', na_rep='--'))
+    print('')
+    print(estimator.save(savepath))
+
+commands = {'analyze' : analyze,
+            'compare' : compare,
+            'study' : study,
+            'fom' : fom,
+            'aggregate' : aggregate,
+            'converge' : converge,
+            'timing' : timing,
+            'runtime' : runtime}
+
+def add_output_options(parser, outputs):
+    group = parser.add_argument_group('outputs')
+    group.add_argument('--all', action='store_true',
+            help='make every output')
+    for option, keyword in outputs:
+        group.add_argument('--%s' %(option), action='store_true',
+                help='sets %s' %(keyword))
+
+def add_run_options(parser):
+    parser.add_argument('--render-processes', type=int, default=0,
+            help='render figures on this many worker processes')
+    parser.add_argument('--no-incremental', dest='incremental',
+            action='store_false',
+            help='rebuild every output, even if its inputs are unchanged')
+    parser.add_argument('--dry-run', action='store_true',
+            help='list the outputs that would be rebuilt and stop')
+    parser.add_argument('--trace', action='store_true',
+            help='write a trace.json of the time and memory of every stage')
+    parser.add_argument('--reuse-processed', action='store_true',
+            help='reuse the saved processed data where it is still valid')
+
+def make_parser():
+    '''
+    Returns the argument parser for thesiscode and its subcommands.
+    '''
+    parser = argparse.ArgumentParser(prog='thesiscode',
+            description='Analysis of the angle-informed variance reduction '
+            + 'runs.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    analyze_parser = subparsers.add_parser('analyze',
+            help='analyze a single run')
+    analyze_parser.add_argument('run', help='run directory')
+    analyze_parser.add_argument('--method', default='',
+            help='method type of the run (detected if not given)')
+    analyze_parser.add_argument('--analysis-dir', default='analysis',
+            help='name of the analysis directory in the run')
+    analyze_parser.add_argument('--tally', default='44',
+            help='MCNP tally number')
+    analyze_parser.add_argument('--select', default='full',
+            choices=['full', 'mean', 'median'],
+            help='anisotropy values plotted in the distributions')
+    analyze_parser.add_argument('--dtype', default=None,
+            choices=['float32', 'float64'],
+            help='precision the anisotropy data is read in')
+    analyze_parser.add_argument('--memory-budget', default=None,
+            help="memory budget for the analysis, for example '4G'")
+    analyze_parser.add_argument('--prefetch-depth', type=int, default=0,
+            help='anisotropy items read ahead of the one being plotted')
+    analyze_parser.add_argument('--max-workers', type=int, default=1,
+            help='analysis tasks run at the same time')
+    add_run_options(analyze_parser)
+    add_output_options(analyze_parser, analysis_outputs)
+
+    compare_parser = subparsers.add_parser('compare',
+            help='compare any number of runs')
+    compare_parser.add_argument('runs', nargs='+', metavar='[LABEL=]RUN',
+            help='run directories, each optionally labelled')
+    compare_parser.add_argument('--reference', default=None,
+            help='label of the run the anisotropy correlations are taken '
+            + 'against (the first cadis run by default)')
+    compare_parser.add_argument('--load-processes', type=int, default=0,
+            help='analyze the runs on this many processes (with '
+            + '--reuse-processed)')
+    compare_parser.add_argument('--analysis-dir', default=None,
+            help='directory for the comparison (analysis_compare in the '
+            + 'first run by default)')
+    compare_parser.add_argument('--name', default='',
+            help='problem name used in the plot titles')
+    compare_parser.add_argument('--format', default='txt',
+            choices=['txt', 'tex'], help='format of the tables')
+    add_run_options(compare_parser)
+    add_output_options(compare_parser, compare_outputs)
+
+    study_parser = subparsers.add_parser('study',
+            help='make a parametric study from an advantg input')
+    study_parser.add_argument('input', help='advantg python input')
+    for option, kind in [('xs-libs', str), ('quad-type', str),
+            ('quad-order', int), ('pn-order', int), ('x-blocks', int),
+            ('y-blocks', int), ('z-blocks', int)]:
+        study_parser.add_argument('--%s' %(option), nargs='+', default=[],
+                type=kind,
+                help='values of %s in the study' %(option.replace('-', '_')))
+    study_parser.add_argument('--sweep', default='one-at-a-time',
+            choices=['one-at-a-time', 'product', 'points', 'latin-hypercube'],
+            help='how the values are combined into study points')
+    study_parser.add_argument('--points', default=None,
+            help='json file with a list of study points, for example '
+            + '[{"quad_order": 4, "pn_order": 1}]')
+    study_parser.add_argument('--samples', type=int, default=None,
+            help='number of points of a latin-hypercube sweep')
+    study_parser.add_argument('--seed', type=int, default=0,
+            help='seed of the latin-hypercube sample')
+    study_parser.add_argument('--submission-script', default=None,
+            help='PBS script to extend with a run of every study')
+    study_parser.add_argument('--mcnp', action='store_true',
+            help='the submission script runs MCNP instead of advantg')
+    study_parser.add_argument('--array', action='store_true',
+            help='write a job array with a task per study point')
+    study_parser.add_argument('--scheduler', default='torque',
+            choices=['torque', 'pbspro'], help='job array syntax')
+    study_parser.add_argument('--walltime', default=None,
+            help='pack the runs into scripts of at most this walltime '
+            + '(with --array, the most a task asks for)')
+    study_parser.add_argument('--scripts', type=int, default=None,
+            help='pack the runs into this many scripts')
+    study_parser.add_argument('--cores-per-run', type=int, default=None,
+            help='cores of one run, to run ppn/cores runs side by side')
+    study_parser.add_argument('--estimator', default=None,
+            help='runtime model (thesiscode runtime) that estimates the '
+            + 'runtime of each point for the walltime and packing')
+
+    fom_parser = subparsers.add_parser('fom',
+            help='print the figures of merit of a run')
+    fom_parser.add_argument('run', help='run directory')
+    fom_parser.add_argument('--analysis-dir', default='analysis',
+            help='name of the analysis directory in the run')
+    fom_parser.add_argument('--tally', default='44',
+            help='MCNP tally number')
+    fom_parser.add_argument('--format', default='txt',
+            choices=['txt', 'tex'], help='format of the table')
+    fom_parser.add_argument('--no-reuse', dest='reuse_processed',
+            action='store_false',
+            help='parse the MCNP output even if saved FOMs are current')
+
+    aggregate_parser = subparsers.add_parser('aggregate',
+            help='aggregate every run of a study into FOM ratio tables')
+    aggregate_parser.add_argument('root', help='study root directory')
+    aggregate_parser.add_argument('--tally', nargs='+', default=['44'],
+            help='MCNP tally numbers')
+    aggregate_parser.add_argument('--layout', default='method/problem',
+            choices=['method/problem', 'problem/method'],
+            help='directory layout of the runs under the root')
+    aggregate_parser.add_argument('--reference', default='cadis',
+            help='method the FOM ratios are taken against')
+    aggregate_parser.add_argument('--processes', type=int, default=0,
+            help='read the runs on this many processes')
+    aggregate_parser.add_argument('--no-reuse', dest='reuse_processed',
+            action='store_false',
+            help='parse every run even if its saved data is current')
+    aggregate_parser.add_argument('--measure-efficiency',
+            action='store_true',
+            help='add the adjusted FOMs charged at the parallel efficiency '
+            + 'measured from the timing of the study')
+    aggregate_parser.add_argument('--analysis-dir', default=None,
+            help='directory for the outputs (analysis_study in the root '
+            + 'by default)')
+    aggregate_parser.add_argument('--format', default='txt',
+            choices=['txt', 'tex'], help='format of the tables')
+
+    converge_parser = subparsers.add_parser('converge',
+            help='predict when the tallies of an MCNP run converge')
+    converge_parser.add_argument('output', help='MCNP output file')
+    converge_parser.add_argument('--tally', nargs='+', default=['44'],
+            help='MCNP tally numbers')
+    converge_parser.add_argument('--target', type=float, default=0.05,
+            help='target relative error')
+    converge_parser.add_argument('--follow', action='store_true',
+            help='follow a running job, predicting from every new '
+            + 'fluctuation chart')
+    converge_parser.add_argument('--interval', type=float, default=60,
+            help='seconds between reads of the output with --follow')
+    converge_parser.add_argument('--timeout', type=float, default=None,
+            help='stop following after this many seconds')
+
+    timing_parser = subparsers.add_parser('timing',
+            help='tabulate and model the deterministic timing of a study')
+    timing_parser.add_argument('root', help='study root directory')
+    timing_parser.add_argument('--predict', nargs=4, type=int,
+            action='append', default=[], metavar=('CORES', 'X', 'Y', 'Z'),
+            help='predict the walltime with this many cores and x, y and z '
+            + 'blocks (can be repeated)')
+    timing_parser.add_argument('--problem', default=None,
+            help='problem to predict for, if the study has several')
+    timing_parser.add_argument('--margin', type=float, default=1.25,
+            help='factor on the predicted time for the walltime request')
+    timing_parser.add_argument('--processes', type=int, default=0,
+            help='read the runs on this many processes')
+    timing_parser.add_argument('--analysis-dir', default=None,
+            help='directory for the tables (analysis_timing in the root by '
+            + 'default)')
+    timing_parser.add_argument('--format', default='txt',
+            choices=['txt', 'tex'], help='format of the tables')
+
+    runtime_parser = subparsers.add_parser('runtime',
+            help='train the runtime model of study points on finished runs')
+    runtime_parser.add_argument('roots', nargs='+',
+            help='directories of finished runs')
+    runtime_parser.add_argument('--save', default=None,
+            help='file for the model (analysis_timing/runtime_model.h5 in '
+            + 'the first root by default)')
+    runtime_parser.add_argument('--holdout', type=float, default=0.25,
+            help='fraction of the runs held out for the accuracy report')
+    runtime_parser.add_argument('--seed', type=int, default=0,
+            help='seed of the choice of held out runs')
+    runtime_parser.add_argument('--processes', type=int, default=0,
+            help='read the runs on this many processes')
+
+    return parser
+
+def main(argv=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+
+    if args.command == 'analyze' and args.dtype is not None:
+        import numpy as np
+        args.dtype = np.dtype(args.dtype).type
+
+    load_command(args.command)(args)
+    return 0
+
+#-----------------------------------------------------------------------------#
+if __name__ == '__main__':
+    sys.exit(main())
+
+###############################################################################
+# end of thesiscode/scripts/cli.py
+###############################################################################
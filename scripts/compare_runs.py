@@ -10,57 +10,152 @@ from __future__ import (division, absolute_import, print_function, )
 import numpy as np
 
 from single_run import Single_Run
-from analysis_utils import format_logger
-from plotting_utils import energy_histogram, styles
+from analysis import calculate_foms, calculate_ratios
+from analysis_utils import (format_logger, Provenance, LazyModule, use_agg,
+        get_paths, get_method_type)
+from processed_data import write_processed_data, schema_version
+from statistics_store import StatisticsStore
+from statistical_checks import get_check_frame, format_check_frame
+from instrumentation import (traced, stage, enable_tracing, disable_tracing,
+        write_trace)
+from plotting_utils import energy_histogram, styles, color_palette
+from collections import OrderedDict
+import multiprocessing
 import logging
 import os
-import matplotlib as mpl
-mpl.use('agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
-import pickle
+plt = LazyModule('matplotlib.pyplot', setup=use_agg)
 
 ###############################################################################
 
+def load_run(job):
+    '''
+    Analyzes the run in folder (job is a tuple of folder and method type)
+    and saves its processed data, so that Compare_Runs can read it back.
+    Used on a process pool by Compare_Runs.load_runs.
+    '''
+    folder, method_type = job
+    data = Single_Run(folder, method_type=method_type)
+    data.do_single_analysis(reuse_processed=True, save_data_json=True)
+    return folder
+
 class Compare_Runs(object):
     def __init__(self, cadisanglefolder='', cadisfolder='', analogfolder='',
-            problem_name=''):
-
-        # initialize logger
-        cadisanglefolder = os.path.expanduser(cadisanglefolder)
-
-        logger = logging.getLogger("analysis")
+            problem_name='', reuse_processed=True, runs=None, reference=None,
+            load_processes=0, analysis_dir=None):
+        '''
+        Compares any number of runs. runs is a mapping (or list of pairs) of
+        label : run folder, for example {'cadisangle p3' : ...,
+        'cadisangle p5' : ..., 'cadis' : ..., 'analog' : ...}. The labels
+        are used in the legends and tables, in the order given. The method
+        type of each run is detected from its folder. The older keywords
+        cadisanglefolder, cadisfolder and analogfolder are the same as runs
+        with those three labels.
+
+        reference is the label of the run the anisotropy correlation plots
+        compare the angle-informed runs against (by default the first cadis
+        run). Outputs are saved in analysis_dir, by default the
+        analysis_compare directory of the first run.
+
+        If reuse_processed is True, each run saves its processed data and
+        later comparisons reuse it instead of reparsing the run (see
+        Single_Run.load_processed_data). With load_processes other than 0
+        the runs are then analyzed on a pool of that many processes (None
+        for one per cpu) and read back from their processed data.
+
+        The runs are only analyzed, and the compare directory and its log
+        only created, when they are first needed (see runs), so that a dry
+        run of do_compare_analysis leaves the runs alone.
+        '''
 
-        if os.path.isdir(cadisanglefolder):
-            dirpath = cadisanglefolder+'/analysis_compare'
-            if os.path.isdir(dirpath):
-                logfile = '%s/compare_analysis.log' %dirpath
-            else:
-                os.makedirs(dirpath)
-                logfile = '%s/compare_analysis.log' %dirpath
-            self.analysis_dir = dirpath
+        if runs is None:
+            runs = [(label, folder) for label, folder in
+                    [('cadisangle', cadisanglefolder), ('cadis', cadisfolder),
+                     ('analog', analogfolder)] if folder]
+            method_types = dict((label, label) for label, folder in runs)
         else:
-            logger.error('%s is not a known directory' %cadisanglefolder)
-
-        if logger.handlers:
-            logger = logger
+            method_types = {}
+        self.folders = OrderedDict((label, os.path.expanduser(folder)) for
+                label, folder in (runs.items() if hasattr(runs, 'items')
+                    else runs))
+        self.method_types = method_types
+
+        first_folder = list(self.folders.values())[0] if self.folders else ''
+        if analysis_dir is not None:
+            dirpath = os.path.expanduser(analysis_dir)
+        elif os.path.isdir(first_folder):
+            dirpath = first_folder+'/analysis_compare'
         else:
-            logfile = '%s/compare_analysis.log' %dirpath
-            logger = format_logger("analysis", logfile)
+            dirpath = None
+        self.analysis_dir = dirpath
 
-        logger.info("Initiated %s analysis" %__name__)
+        self.reuse_processed = reuse_processed
+        self.load_processes = load_processes
 
-        self.cadisangledata = self.get_data(cadisanglefolder, 'cadisangle')
-        self.cadisdata = self.get_data(cadisfolder, 'cadis')
-        self.analogdata = self.get_data(analogfolder, 'analog')
-        if not self.analysis_dir:
-            self.analysis_dir = self.cadisangledata.directories['analysis_directory']
+        self._runs = None
+        self._run_files = None
+        self._reference = reference
         self.problem_name = problem_name
 
         self.saveformat = 'txt'
         pass
 
+    @property
+    def runs(self):
+        '''
+        OrderedDict of label : Single_Run for every run compared. The compare
+        directory and its log are created and the runs analyzed (see
+        load_runs) the first time it is used.
+        '''
+        if self._runs is None:
+            self.start_log()
+            logger = logging.getLogger("analysis")
+            logger.info("Initiated %s analysis" %__name__)
+            self._runs = self.load_runs()
+        return self._runs
+
+    @property
+    def reference(self):
+        '''
+        The label of the run the anisotropy correlations are compared
+        against, by default the first cadis run (see get_reference).
+        '''
+        if self._reference is None:
+            self._reference = self.get_reference()
+        return self._reference
+
+    def start_log(self, dry_run=False):
+        '''
+        Creates the compare directory and logs to compare_analysis.log in it,
+        unless the analysis logger is already set up. With dry_run nothing
+        is created and the log is only printed to the screen.
+        '''
+        logger = logging.getLogger("analysis")
+        if self.analysis_dir is None:
+            self.analysis_dir = list(self.get_run_files().values())[0][1][
+                    'analysis_directory']
+        if dry_run != True and not os.path.isdir(self.analysis_dir):
+            os.makedirs(self.analysis_dir)
+
+        if not logger.handlers:
+            if dry_run == True:
+                format_logger("analysis")
+            else:
+                format_logger("analysis",
+                        '%s/compare_analysis.log' %self.analysis_dir)
+
+    @property
+    def cadisangledata(self):
+        return self.runs.get('cadisangle')
+
+    @property
+    def cadisdata(self):
+        return self.runs.get('cadis')
+
+    @property
+    def analogdata(self):
+        return self.runs.get('analog')
+
     def get_data(self, folderpath, method_type=''):
         '''
         convenience function to obtain single_run data for a given method
@@ -70,12 +165,121 @@ class Compare_Runs(object):
 
         if folderpath:
             data = Single_Run(folderpath, method_type=method_type)
-            data.do_single_analysis()
+            data.do_single_analysis(reuse_processed=self.reuse_processed,
+                    save_data_json=self.reuse_processed)
         else:
             data = None
 
         return data
 
+    def load_runs(self):
+        '''
+        Returns an OrderedDict of label : Single_Run for every run compared.
+        With reuse_processed and load_processes other than 0, the runs are
+        first analyzed on a process pool, each saving its processed data,
+        and then read back here from that data. A folder given under
+        several labels is only analyzed once.
+        '''
+        logger = logging.getLogger("analysis.compare")
+
+        jobs = []
+        for label, folder in self.folders.items():
+            job = (folder, self.method_types.get(label, ''))
+            if job not in jobs:
+                jobs.append(job)
+
+        if self.reuse_processed == True and self.load_processes != 0 and \
+                len(jobs) > 1:
+            processes = self.load_processes
+            if processes is not None:
+                processes = min(processes, len(jobs))
+            logger.info("analyzing %d runs on %s processes" %(len(jobs),
+                processes or 'all'))
+            with stage('load runs', 'io', processes=str(processes)):
+                pool = multiprocessing.Pool(processes)
+                try:
+                    pool.map(load_run, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+
+        loaded = {}
+        runs = OrderedDict()
+        for label, folder in self.folders.items():
+            job = (folder, self.method_types.get(label, ''))
+            if job not in loaded:
+                with stage('load %s' %(label), 'io'):
+                    loaded[job] = self.get_data(*job)
+            runs[label] = loaded[job]
+        return runs
+
+    def get_run_files(self):
+        '''
+        Returns an OrderedDict of label : (filenames, directories, method
+        type) for every run compared, found without analyzing the runs or
+        creating their analysis directories.
+        '''
+        if self._run_files is None:
+            self._run_files = OrderedDict()
+            for label, folder in self.folders.items():
+                filenames, directories = get_paths(folder,
+                        create_analysis_dir=False)
+                method_type = self.method_types.get(label) or \
+                        get_method_type(filenames, directories)
+                self._run_files[label] = (filenames, directories,
+                        method_type)
+        return self._run_files
+
+    def get_reference(self):
+        '''
+        Returns the label of the first cadis run, the default reference of
+        the anisotropy correlation plots, or None if there is none.
+        '''
+        for label, (filenames, directories, method_type) in \
+                self.get_run_files().items():
+            if method_type == 'cadis':
+                return label
+        return None
+
+    def get_angle_runs(self):
+        '''
+        Returns the labels of the runs with an anisotropy file, in order.
+        '''
+        return [label for label, data in self.runs.items() if label !=
+                self.reference and data.filenames.get('anisotropy_file')]
+
+    def get_styles(self):
+        '''
+        Returns a dict of label : plotting style for every run. Runs of the
+        same method type share its line style, and get colors spread over
+        the palette if there are several of them.
+        '''
+        labels = list(self.runs)
+        method_types = [self.runs[label].method_type for label in labels]
+        palette = color_palette['purples_ex']
+        run_styles = {}
+        for label, method_type in zip(labels, method_types):
+            style = dict(styles.get(method_type, {'ls' : ':'}))
+            style['label'] = label
+            same = [other for other, other_type in zip(labels, method_types)
+                    if other_type == method_type]
+            if len(same) > 1 or 'color' not in style:
+                shades = np.linspace(3, len(palette) - 1, len(same))
+                style['color'] = palette[int(shades[same.index(label)])]
+            run_styles[label] = style
+        return run_styles
+
+    def get_run_inputs(self, keys=('mcnp_output_file', 'timing_file')):
+        '''
+        Returns the paths of the given input files of every run compared.
+        '''
+        inputs = []
+        for filenames, directories, method_type in \
+                self.get_run_files().values():
+            inputs.extend(filenames[key] for key in keys if
+                    filenames.get(key))
+        return inputs
+
     def plot_tally_result(self, savepath=None, **kwargs):
         '''
         Plots a histogram of the tally result for all methods.
@@ -95,59 +299,63 @@ class Compare_Runs(object):
                 %self.problem_name, savepath=savepath)
         return
 
+    @traced('Compare_Runs.plot_compare', 'plotting')
     def plot_compare(self, compare_type='tallied_result',
                      savepath=None, y_label='', title='', ignore_analog=False):
         '''
         Plotting function to plot multiple energy histograms on a single
-        figure.
+        figure, one for each run.
         '''
         logger = logging.getLogger("analysis.compare")
 
-        # gets the tally data for each method.
+        # gets the tally data for each run as one (runs, bins) array.
+        labels = list(self.runs)
         energy_groups = \
-            self.cadisangledata.MCNP_data['tally_data']['energy_groups']
-        cadang = self.cadisangledata.MCNP_data['tally_data'][compare_type]
-        cad = self.cadisdata.MCNP_data['tally_data'][compare_type]
-        analog = self.analogdata.MCNP_data['tally_data'][compare_type]
-
-        # check to see if results are identical. Modify them with a warning log
-        # message if they do.
-        if np.sum(np.abs(cad - cadang)) < 10e-20:
-            logger.warning("""The results for cadis and cadisangle seem to be
-                    identical. Plotting cadis at 1.05 higher than actual
-                    results.""")
-            cad = cad*1.05
-        if np.sum(np.abs(analog - cadang)) < 10e-20:
-            logger.warning(""" The results for analog and cadisangle seem to be
-                    identical. Plotting analog at 1.10 higher than actual
-                    results.""")
-            analog = analog*1.10
+            self.runs[labels[0]].MCNP_data['tally_data']['energy_groups']
+        values = np.array([self.runs[label].MCNP_data['tally_data']
+            [compare_type] for label in labels], dtype=float)
+
+        # check to see if results are identical to the first run. Modify them
+        # with a warning log message if they do.
+        identical = np.abs(values - values[0]).sum(axis=1) < 10e-20
+        identical[0] = False
+        for number in np.flatnonzero(identical):
+            logger.warning("""The results for %s and %s seem to be
+                    identical. Plotting %s at %.2f higher than actual
+                    results.""" %(labels[number], labels[0], labels[number],
+                        1 + 0.05*number))
+        values *= (1 + 0.05*np.arange(len(labels))*identical)[:, None]
+
+        # runs with 100 percent error somewhere are left out of the relative
+        # error plot, as are analog runs if ignore_analog is set.
+        skip = np.zeros(len(labels), dtype=bool)
+        if compare_type == 'relative_error':
+            skip = (values >= .999).any(axis=1)
+            for number in np.flatnonzero(skip):
+                logger.warning(""" The relative error results for %s has 100
+                        percent error in some locations. Not plotting %s
+                        results in relative error plot. """ %(labels[number],
+                            labels[number]))
+        if ignore_analog == True:
+            skip |= np.array([self.runs[label].method_type == 'analog' for
+                label in labels])
 
         # open figure object
         fig = plt.figure()
 
-        if compare_type == 'relative_error' and analog.any() >= .999:
-            logger.warning(""" The relative error results for analog has 100
-                    percent error in some locations. Not plotting analog results
-                    in relative error plot. """)
-            ignore_analog=True
-
-
-        # plot a histogram on the figure for each method type.
-        energy_histogram(energy_groups, cadang, None,
-                **styles[self.cadisangledata.method_type])
-        energy_histogram(energy_groups, cad, None,
-                **styles[self.cadisdata.method_type])
-        if ignore_analog == False:
-            energy_histogram(energy_groups, analog, None,
-                **styles[self.analogdata.method_type])
+        # plot a histogram on the figure for each run.
+        run_styles = self.get_styles()
+        for number, label in enumerate(labels):
+            if not skip[number]:
+                energy_histogram(energy_groups, values[number], None,
+                        **run_styles[label])
 
         plt.legend()
 
         if title:
             plt.title('%s' %title)
         elif self.problem_name:
-            plt.title('%s' %problem_name)
+            plt.title('%s' %self.problem_name)
 
         if y_label:
             plt.ylabel('%s' %y_label)
@@ -161,43 +369,129 @@ class Compare_Runs(object):
             return fig
         return
 
+    @traced('Compare_Runs.make_table', 'statistics')
     def make_table(self, framename):
         '''
         Merges pandas dataframes from results into a super-dataframe with
-        results from all methods. Returns dataframe.
+        results from all runs, keyed by run label. Returns dataframe.
         '''
         logger = logging.getLogger("analysis.compare")
         logger.debug('composite frame of %s being created' %framename)
 
-        cad = self.cadisdata.frames[framename].transpose()
-        cad_label = self.cadisdata.method_type
-        cadom = self.cadisangledata.frames[framename].transpose()
-        cadom_label = self.cadisangledata.method_type
-        analog = self.analogdata.frames[framename].transpose()
-        analog_label = self.analogdata.method_type
-
-        alldata = [cad, cadom, analog]
-        keys = [cad_label, cadom_label, analog_label]
-
-        newtable = pd.concat(alldata, keys=keys)
+        newtable = pd.concat([data.frames[framename].transpose() for data in
+            self.runs.values()], keys=list(self.runs))
         newtable = newtable.transpose()
 
         return newtable
 
+    def make_check_table(self):
+        '''
+        Returns the pass/fail matrix of the ten MCNP statistical checks of
+        the tally of every run, indexed by run label, with the checks of all
+        runs evaluated together.
+        '''
+        charts = [data.MCNP_data['fom_trends'] for data in
+                self.runs.values()]
+        return get_check_frame(charts, [(label,) for label in self.runs],
+                ['run'])
+
     def do_compare_analysis(self, plot_tally_results=False, plot_tally_error=False,
             make_fomtable=False, make_timingtable=False,
             make_tallytable=False, save_data=False, plot_compare_corrs=False,
             plot_compare_corrs_median=False, plot_compare_corrs_mean=False,
-            saveformat='txt', **kwargs):
+            make_checktable=False, saveformat='txt', render_processes=0,
+            incremental=True, dry_run=False, trace=False, **kwargs):
         '''
         Driver function for the compare solutions.
+
+        make_checktable saves a table of the ten MCNP statistical checks of
+        the tally of every run (see statistical_checks.py).
+
+        If render_processes is not zero, the anisotropy correlation plots are
+        rendered on a RenderPool of that many worker processes (None for one
+        per cpu) while the statistics for the next cutoff are calculated.
+
+        The inputs and parameters of every output are recorded in
+        provenance.json in the compare directory. If incremental is True,
+        outputs whose recorded inputs, parameters and artifacts are all
+        still current are skipped. With dry_run=True nothing is built: the
+        outputs that would be rebuilt are logged and returned as a dict of
+        output name : reason.
+
+        If trace is True, the time and memory of every stage of the
+        comparison are written to trace.json in the compare directory (see
+        instrumentation.py).
         '''
 
+        if trace == True and dry_run != True:
+            enable_tracing()
+            try:
+                with stage('do_compare_analysis', 'analysis'):
+                    result = self.do_compare_analysis(
+                            plot_tally_results=plot_tally_results,
+                            plot_tally_error=plot_tally_error,
+                            make_fomtable=make_fomtable,
+                            make_timingtable=make_timingtable,
+                            make_tallytable=make_tallytable,
+                            save_data=save_data,
+                            plot_compare_corrs=plot_compare_corrs,
+                            plot_compare_corrs_median=plot_compare_corrs_median,
+                            plot_compare_corrs_mean=plot_compare_corrs_mean,
+                            make_checktable=make_checktable,
+                            saveformat=saveformat,
+                            render_processes=render_processes,
+                            incremental=incremental, **kwargs)
+                write_trace(self.analysis_dir+'/trace.json')
+            finally:
+                disable_tracing()
+            return result
+
         self.saveformat=saveformat
 
+        # the runs are analyzed when an output first needs them, so a dry
+        # run only reads the provenance.
+        self.start_log(dry_run=dry_run)
         logger = logging.getLogger("analysis.compare")
 
-        if plot_tally_results == True:
+        provenance = Provenance(self.analysis_dir+'/provenance.json')
+        mcnp_inputs = self.get_run_inputs()
+        # the adjusted FOMs charge the deterministic time at the core count
+        # from the omnibus output.
+        fom_inputs = self.get_run_inputs(keys=['mcnp_output_file',
+            'timing_file', 'omni_out_file'])
+        anisotropy_inputs = mcnp_inputs + \
+                self.get_run_inputs(keys=['anisotropy_file'])
+        methods = [[label, method_type] for label, (filenames, directories,
+            method_type) in self.get_run_files().items()] + \
+                    [['reference', self.reference]]
+        stale = {}
+        building = {}
+
+        def rebuild(name, inputs, parameters={}):
+            # returns True if the output name has to be built now
+            parameters = dict(parameters, problem_name=self.problem_name,
+                    methods=methods)
+            if incremental != True:
+                reason = 'incremental analysis is off'
+            else:
+                reason = provenance.check(name, inputs, parameters)
+            if reason is None:
+                logger.info("skipping %s, its inputs are unchanged" %(name))
+                return False
+            stale[name] = reason
+            if dry_run == True:
+                logger.info("would rebuild %s: %s" %(name, reason))
+                return False
+            building[name] = (inputs, parameters)
+            return True
+
+        def built(name, artifacts):
+            inputs, parameters = building[name]
+            provenance.record(name, inputs, parameters,
+                    [os.path.abspath(artifact) for artifact in artifacts])
+
+        if plot_tally_results == True and \
+        rebuild('tally_result', mcnp_inputs, {'kwargs' : kwargs}):
             if self.problem_name:
                 newname = self.problem_name.replace(' ','_')
                 newname = newname.lower()
@@ -208,8 +502,10 @@ class Compare_Runs(object):
 
             logger.info("plotting tally results at %s" %savepath)
             self.plot_tally_result(savepath=savepath, **kwargs)
+            built('tally_result', [savepath])
 
-        if plot_tally_error == True:
+        if plot_tally_error == True and \
+        rebuild('tally_error', mcnp_inputs, {'kwargs' : kwargs}):
             if self.problem_name:
                 newname = self.problem_name.replace(' ','_')
                 newname = newname.lower()
@@ -220,8 +516,10 @@ class Compare_Runs(object):
 
             logger.info("plotting tally error at %s" %savepath)
             self.plot_tally_error(savepath=savepath, **kwargs)
+            built('tally_error', [savepath])
 
-        if make_fomtable == True:
+        if make_fomtable == True and \
+        rebuild('fom_table', fom_inputs, {'saveformat' : saveformat}):
             fomtable = self.make_table('fom_frame')
 
             if self.problem_name:
@@ -234,28 +532,24 @@ class Compare_Runs(object):
 
             if self.saveformat == 'tex' or self.saveformat == 'latex':
                 savepath = savepath+'.tex'
-                table = fomtable.to_latex(float_format='%.3g')
-                table = table.decode("utf-8").replace(r"inf", \
-                        "--").encode("utf-8")
-                table = table.decode("utf-8").replace(r"NaN", \
-                        "--").encode("utf-8")
+                table = fomtable.to_latex(float_format='%.3g', na_rep='--')
             elif self.saveformat == 'txt' or self.saveformat == 'str' or \
             self.saveformat == 'text':
                 savepath = savepath+'.txt'
-                table = fomtable.to_string(float_format='%.3g')
-                table = table.decode("utf-8").replace(r"NaN", \
-                        "--").encode("utf-8")
+                table = fomtable.to_string(float_format='%.3g', na_rep='--')
             else:
                 logger.warning('''%s is not a recognized save type. Saving as
                         text instead''' %self.saveformat)
                 savepath == savepath+'.txt'
-                table = fomtable.to_string(float_format='%.2f')
+                table = fomtable.to_string(float_format='%.2f', na_rep='--')
 
             logger.info("saving fom table to %s" %savepath)
             with open(savepath, 'w') as fp:
                 fp.write(table)
+            built('fom_table', [savepath])
 
-        if make_timingtable == True:
+        if make_timingtable == True and \
+        rebuild('timing_table', fom_inputs, {'saveformat' : saveformat}):
             timingtable = self.make_table('timing_frame')
 
             if self.problem_name:
@@ -268,26 +562,27 @@ class Compare_Runs(object):
 
             if self.saveformat == 'tex' or self.saveformat == 'latex':
                 savepath = savepath+'.tex'
-                table = timingtable.to_latex(float_format='%.2f')
-                table = table.decode("utf-8").replace(r"NaN", \
-                        "--").encode("utf-8")
+                table = timingtable.to_latex(float_format='%.2f',
+                        na_rep='--')
             elif self.saveformat == 'txt' or self.saveformat == 'str' or \
             self.saveformat == 'text':
                 savepath = savepath+'.txt'
-                table = timingtable.to_string(float_format='%.2f')
-                table = table.decode("utf-8").replace(r"NaN", \
-                        "--").encode("utf-8")
+                table = timingtable.to_string(float_format='%.2f',
+                        na_rep='--')
             else:
                 logger.warning('''%s is not a recognized save type. Saving as
                         text instead''' %self.saveformat)
                 savepath == savepath+'.txt'
-                table = timingtable.to_string(float_format='%.2f')
+                table = timingtable.to_string(float_format='%.2f',
+                        na_rep='--')
 
             logger.info("saving fom table to %s" %savepath)
             with open(savepath, 'w') as fp:
                 fp.write(table)
+            built('timing_table', [savepath])
 
-        if make_tallytable == True:
+        if make_tallytable == True and \
+        rebuild('tally_table', mcnp_inputs, {'saveformat' : saveformat}):
             tallytable = self.make_table('tally_frame')
 
             if self.problem_name:
@@ -314,126 +609,153 @@ class Compare_Runs(object):
             logger.info("saving tally convergence table to %s" %savepath)
             with open(savepath, 'w') as fp:
                 fp.write(table)
+            built('tally_table', [savepath])
 
-        if plot_compare_corrs==True or plot_compare_corrs_median==True or \
-                plot_compare_corrs_mean==True:
-            from plotting_utils import statscatter
-            from analysis import H5Output
-            from analysis_utils import (metric_names, group_names, xscales,
-                    selection_names)
-
-            anisotropy_filename = self.cadisangledata.filenames['anisotropy_file']
-            anisotropy_file = H5Output(anisotropy_filename)
-            datanames = anisotropy_file.get_datanames()
-
-            err_cad = self.cadisdata.MCNP_data['tally_data']['relative_error']
-            bins_cad = self.cadisdata.MCNP_data['tally_data']['energy_groups']
-            time_cad = self.cadisdata.MCNP_data['timing']['mcrun_time']['time']
-            foms_cad = 1/((err_cad*err_cad)*time_cad)
+        if make_checktable == True and \
+        rebuild('check_table', mcnp_inputs, {'saveformat' : saveformat}):
+            checktable = self.make_check_table()
 
+            if self.problem_name:
+                newname = self.problem_name.replace(' ','_')
+                newname = newname.lower()
+                savepath = self.analysis_dir+'/%s_tally_checks_compare' \
+                           %newname
+            else:
+                savepath = self.analysis_dir+'/tally_checks_compare'
 
-            err_cadang = self.cadisangledata.MCNP_data['tally_data']['relative_error']
-            bins_cadang = self.cadisangledata.MCNP_data['tally_data']['energy_groups']
-            time_cadang = self.cadisangledata.MCNP_data['timing']['mcrun_time']['time']
-            foms_cadang = 1/((err_cadang*err_cadang)*time_cadang)
+            table = format_check_frame(checktable)
+            if self.saveformat == 'tex' or self.saveformat == 'latex':
+                savepath = savepath+'.tex'
+                table = table.to_latex()
+            else:
+                savepath = savepath+'.txt'
+                table = table.to_string()
 
-            err = err_cadang/err_cad
-            foms = foms_cadang/foms_cad
+            logger.info("saving tally statistical checks table to %s"
+                    %savepath)
+            with open(savepath, 'w') as fp:
+                fp.write(table)
+            built('check_table', [savepath])
+
+        corrs = {}
+        for cutoff, flag in [('full', plot_compare_corrs),
+                ('median', plot_compare_corrs_median),
+                ('mean', plot_compare_corrs_mean)]:
+            corrs[cutoff] = flag == True and rebuild('correlations_%s'
+                    %(cutoff), anisotropy_inputs, {'cutoff' : cutoff})
+
+        if any(corrs.values()) and self.reference is None:
+            logger.warning("no cadis run to compare the anisotropy "
+                    + "correlations against. Not plotting them.")
+        elif any(corrs.values()):
+            from render_pool import RenderPool
+            from analysis import H5Output
+            from analysis_utils import (metric_names, group_names, xscales,
+                    selection_names)
 
-            if np.array_equal(bins_cadang,bins_cad):
-                bins = bins_cadang
-            else:
-                logger.warning('''The bins between cadisangle and CADIS do not match.
+            # the errors and FOMs of every angle-informed run relative to
+            # the reference run, one row per run.
+            angle_runs = self.get_angle_runs()
+            reference = self.runs[self.reference]
+            tally = lambda data: data.MCNP_data['tally_data']
+            bins_ref = tally(reference)['energy_groups']
+            errs = np.array([tally(self.runs[label])['relative_error'] for
+                label in [self.reference] + angle_runs], dtype=float)
+            times = np.array([self.runs[label].MCNP_data['timing']
+                ['mcrun_time']['time'] for label in [self.reference] +
+                angle_runs], dtype=float)
+            all_foms = calculate_foms(errs, times[:, None])
+            err = calculate_ratios(errs[1:], errs[0])
+            foms = calculate_ratios(all_foms[1:], all_foms[0])
+            bins = bins_ref
+
+            for label in angle_runs:
+                bins_run = tally(self.runs[label])['energy_groups']
+                if not np.array_equal(bins_run, bins_ref):
+                    logger.warning('''The bins between %s and %s do not match.
                         There will likely be issues with plotting the anisotropies
-                        The cadis bins are: %s \n \n and the cadisangle bins are: %s
-                        ''' %(np.array_str(bins_cad), np.array_str(bins_cadang)))
+                        The %s bins are: %s \n \n and the %s bins are: %s
+                        ''' %(label, self.reference, self.reference,
+                            np.array_str(bins_ref), label,
+                            np.array_str(bins_run)))
 
             # because in the deterministic calculation, the first group is the
             # highest energy, check that MC data is in the same order.
             if bins[-1] > bins[0]:
                 logger.debug('''tally bins not in the same order as
                         deterministic result. Reversing order for consistency.''')
-                err = err[::-1]
+                err = err[:, ::-1]
                 bins = bins[::-1]
-                foms = foms[::-1]
+                foms = foms[:, ::-1]
             else:
                 logger.debug('''Monte Carlo and deterministic results in same
                         energy order.''')
 
-
-            if plot_compare_corrs == True:
-                logger.info("calculating anisotropy statistics for metrics")
-                anisotropy_data = anisotropy_file.get_data_statistics()
-
-                # plot the anisotropy stats
-                logger.info("plotting anisotropy correlations ")
-                data = anisotropy_data['data']
-                for metric in anisotropy_data['metrics']:
-                    loc1 = self.analysis_dir+'/%s_err_stats_full.pdf' %(metric)
-                    loc2 = self.analysis_dir+'/%s_fom_stats_full.pdf' %(metric)
-                    name = metric_names[metric]
-                    scale = xscales[metric]
-                    metric_location = anisotropy_data['metrics'].index(metric)
-                    metric_data = anisotropy_data['data'][metric_location]
-                    x1 = metric_data[:,0]
-                    x2 = metric_data[:,1]
-                    x4 = metric_data[:,3]
-                    statscatter(x1,x2,x4, err, savepath=loc1, metric_name=name,
-                            scale=scale, y_name=r'I$_{RE}$')
-                    statscatter(x1,x2,x4, foms, savepath=loc2, metric_name=name,
-                            scale=scale, y_name=r'I$_{FOM}$')
-
-            if plot_compare_corrs_median == True:
-                logger.info("calculating anisotropy statistics for metrics" +
-                        " at values above the median")
-                anisotropy_data = anisotropy_file.get_data_statistics(
-                        filter_data=True, cutoff='median')
-
-                # plot the anisotropy stats
-                logger.info("plotting anisotropy correlations ")
-                data = anisotropy_data['data']
-                for metric in anisotropy_data['metrics']:
-                    loc1 = self.analysis_dir+'/%s_err_stats_median.pdf' %(metric)
-                    loc2 = self.analysis_dir+'/%s_fom_stats_median.pdf' %(metric)
-                    name = metric_names[metric]
-                    scale = xscales[metric]
-                    metric_location = anisotropy_data['metrics'].index(metric)
-                    metric_data = anisotropy_data['data'][metric_location]
-                    x1 = metric_data[:,0]
-                    x2 = metric_data[:,1]
-                    x4 = metric_data[:,3]
-                    statscatter(x1,x2,x4, err, savepath=loc1, metric_name=name,
-                            scale=scale, y_name=r'I$_{RE}$')
-                    statscatter(x1,x2,x4, foms, savepath=loc2, metric_name=name,
-                            scale=scale, y_name=r'I$_{FOM}$')
-
-
-            if plot_compare_corrs_mean == True:
-                logger.info("calculating anisotropy statistics for metrics" +
-                        " at values above the mean")
-                anisotropy_data = anisotropy_file.get_data_statistics(
-                        filter_data=True, cutoff='mean')
-
-                # plot the anisotropy stats
-                logger.info("plotting anisotropy correlations ")
-                data = anisotropy_data['data']
-                for metric in anisotropy_data['metrics']:
-                    loc1 = self.analysis_dir+'/%s_err_stats_mean.pdf' %(metric)
-                    loc2 = self.analysis_dir+'/%s_fom_stats_mean.pdf' %(metric)
-                    name = metric_names[metric]
-                    scale = xscales[metric]
-                    metric_location = anisotropy_data['metrics'].index(metric)
-                    metric_data = anisotropy_data['data'][metric_location]
-                    x1 = metric_data[:,0]
-                    x2 = metric_data[:,1]
-                    x4 = metric_data[:,3]
-                    statscatter(x1,x2,x4, err, savepath=loc1, metric_name=name,
-                            scale=scale, y_name=r'I$_{RE}$')
-                    statscatter(x1,x2,x4, foms, savepath=loc2, metric_name=name,
-                            scale=scale, y_name=r'I$_{FOM}$')
-
-        if save_data == True:
-            datasave = self.analysis_dir+'/compare_data.pkl'
+            with RenderPool(processes=render_processes) as render_pool:
+                for cutoff in ['full', 'median', 'mean']:
+                    if corrs[cutoff] != True:
+                        continue
+                    artifacts = []
+                    for number, label in enumerate(angle_runs):
+                        data = self.runs[label]
+                        # the statistics calculated by the single run analysis
+                        # are read from its store, the anisotropy file is only
+                        # opened if they are not there.
+                        store = data.statistics_store
+                        if store is None:
+                            store = StatisticsStore(
+                                    data.directories['analysis_directory']
+                                    + '/anisotropy_statistics.h5')
+                        filepath = data.filenames['anisotropy_file']
+                        anisotropy_data = store.get(filepath, cutoff)
+                        if anisotropy_data is None:
+                            logger.info("calculating %s anisotropy statistics "
+                                    %(cutoff) + "for metrics of %s" %(label))
+                            anisotropy_data = store.get_statistics(
+                                    H5Output(filepath, dtype=data.dtype),
+                                    cutoff=cutoff)
+                        else:
+                            logger.info("reusing %s anisotropy statistics "
+                                    %(cutoff) + "of %s" %(label))
+
+                        # the single angle-informed run of a three-way
+                        # comparison keeps the plot names without a label.
+                        if len(angle_runs) == 1:
+                            prefix = self.analysis_dir+'/'
+                        else:
+                            prefix = self.analysis_dir+'/%s_' %(
+                                    label.replace(' ', '_').lower())
+
+                        # plot the anisotropy stats
+                        logger.info("plotting anisotropy correlations ")
+                        for metric in anisotropy_data['metrics']:
+                            loc1 = prefix+'%s_err_stats_%s.pdf' %(metric,
+                                    cutoff)
+                            loc2 = prefix+'%s_fom_stats_%s.pdf' %(metric,
+                                    cutoff)
+                            name = metric_names[metric]
+                            scale = xscales[metric]
+                            metric_location = \
+                                    anisotropy_data['metrics'].index(metric)
+                            metric_data = \
+                                    anisotropy_data['data'][metric_location]
+                            x1 = metric_data[:,0]
+                            x2 = metric_data[:,1]
+                            x4 = metric_data[:,3]
+                            render_pool.submit('statscatter', x1=x1, x2=x2,
+                                    x4=x4, y=err[number], savepath=loc1,
+                                    metric_name=name, scale=scale,
+                                    y_name=r'I$_{RE}$')
+                            render_pool.submit('statscatter', x1=x1, x2=x2,
+                                    x4=x4, y=foms[number], savepath=loc2,
+                                    metric_name=name, scale=scale,
+                                    y_name=r'I$_{FOM}$')
+                            artifacts.extend([loc1, loc2])
+                    built('correlations_%s' %(cutoff), artifacts)
+
+        if save_data == True and rebuild('save_data', fom_inputs,
+                {'schema_version' : schema_version}):
+            datasave = self.analysis_dir+'/compare_data.h5'
 
             all_data = {}
             try:
@@ -446,11 +768,20 @@ class Compare_Runs(object):
             except NameError:
                 all_data['fom table']=self.make_table('fom_frame')
 
-            logger.info("saving compare data to pickle file")
+            try:
+                all_data['check table']=checktable
+            except NameError:
+                all_data['check table']=self.make_check_table()
+
+            logger.info("saving compare data to %s" %(datasave))
+            write_processed_data(datasave, all_data, kind='compare runs')
+            built('save_data', [datasave])
+
+        if dry_run == True:
+            return stale
 
-            with open(datasave, 'w') as fp:
-                pickle.dump(all_data, fp)
-                fp.close()
+        # only written once every figure has been rendered
+        provenance.save()
 
 ###############################################################################
 # end of thesiscode/scripts/compare_runs.py
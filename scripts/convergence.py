@@ -0,0 +1,255 @@
+###############################################################################
+# File  : thesiscode/scripts/convergence.py
+# Author: madicken
+# Date  : Tue Oct 20 11:26:08 2026
+#
+# convergence predicts from the tally fluctuation chart (nps, mean, error,
+# vov, slope and fom, as read by TrackLengthTally.get_fom_data) how long an
+# MCNP run needs to reach a target relative error, so that jobs can be
+# stopped or resized early.
+#    -- predict_convergence fits the relative error trend R = c N^p over the
+#    last part of the chart (p should be -1/2), checks that the FOM is
+#    stable, and estimates the histories and the computer time needed to
+#    reach the target error. Runs whose error does not decrease, whose VOV
+#    is increasing or whose history score tail is too heavy (slope below 3)
+#    are flagged as never converging. A VOV that is still above 0.1 but
+#    not increasing is only a warning, as it is early in most runs.
+#    -- get_prediction_frame puts the predictions of several tallies or runs
+#    into a dataframe.
+#    -- OutputFollower and follow_convergence read the output file of a
+#    running job as it grows and predict again from every new fluctuation
+#    chart (MCNP prints one at each dump).
+#
+# Times are in the units of the MCNP FOM, minutes of computer time.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import pandas as pd
+import logging
+import time
+import os
+import re
+from mcnpoutput import TrackLengthTally
+###############################################################################
+
+# limits of the convergence checks. A VOV below 0.1 that decreases, and a
+# slope of at least 3, are the MCNP guidelines for a reliable confidence
+# interval. The VOV counts as increasing if it grows faster than N^0.1. The
+# FOM should vary by less than 10% over the fitted part of the chart and the
+# error should decrease at least as fast as N^-0.25.
+limits = {'vov' : 0.1,
+          'vov exponent' : 0.1,
+          'slope' : 3.0,
+          'fom variation' : 0.1,
+          'error exponent' : -0.25}
+
+# marks the end of the run in an MCNP output file.
+run_done = re.compile(r'mcrun\s+is\s+done')
+
+def fit_power_law(nps, values):
+    '''
+    Least squares fit of values = c*nps**p in log space. Points where either
+    is not positive are left out. Returns (c, p), or (nan, nan) if there are
+    fewer than two points.
+    '''
+    nps = np.asarray(nps, dtype=float)
+    values = np.asarray(values, dtype=float)
+    with np.errstate(invalid='ignore'):
+        usable = (nps > 0) & (values > 0)
+    if usable.sum() < 2:
+        return np.nan, np.nan
+    p, log_c = np.polyfit(np.log(nps[usable]), np.log(values[usable]), 1)
+    return np.exp(log_c), p
+
+def predict_convergence(trends, target_error=0.05, mc_time=None,
+        fit_fraction=0.5):
+    '''
+    Returns a dict predicting when the tally with the fluctuation chart
+    trends (as from TrackLengthTally.get_fom_data) reaches target_error:
+    - 'error', 'nps': the current relative error and histories
+    - 'converged': whether the error is already at or below the target
+    - 'error exponent': p of the fit R = c N^p, ideally -0.5
+    - 'fom', 'fom variation', 'fom exponent': the mean FOM, its relative
+      standard deviation and its trend N^q over the fitted part of the chart
+    - 'histories needed', 'histories remaining': from the error fit
+    - 'time', 'time needed', 'time remaining': computer time, the needed
+      time from the mean FOM, 1/(target^2 FOM)
+    - 'will converge': False if any of the 'problems' are found, in which
+      case the histories and time needed are inf
+    - 'problems', 'warnings': lists of the failed checks
+    The fit uses the last fit_fraction of the chart. mc_time is the computer
+    time of the run so far, taken from the last FOM if not given.
+    '''
+    nps = np.asarray(trends['nps'], dtype=float)
+    error = np.asarray(trends['error'], dtype=float)
+    vov = np.asarray(trends['vov'], dtype=float)
+    slope = np.asarray(trends['slope'], dtype=float)
+    fom = np.asarray(trends['fom'], dtype=float)
+
+    # the fitted part of the chart, at least the last two rows.
+    start = min(int(len(nps)*(1 - fit_fraction)), max(len(nps) - 2, 0))
+    fitted = slice(start, None)
+
+    c, error_exponent = fit_power_law(nps[fitted], error[fitted])
+    vov_exponent = fit_power_law(nps[fitted], vov[fitted])[1]
+    fom_exponent = fit_power_law(nps[fitted], fom[fitted])[1]
+    fom_mean = np.mean(fom[fitted])
+    fom_variation = np.std(fom[fitted])/fom_mean if fom_mean > 0 else np.nan
+
+    problems = []
+    warnings = []
+    if not error_exponent < 0:
+        problems.append('the relative error is not decreasing')
+    elif error_exponent > limits['error exponent']:
+        warnings.append('the relative error decreases as N^%.2f, slower '
+                %(error_exponent) + 'than 1/sqrt(N)')
+    if vov_exponent > limits['vov exponent']:
+        problems.append('the VOV is increasing')
+    elif vov[-1] >= limits['vov']:
+        warnings.append('the VOV is %.3g, not yet below %.3g' %(vov[-1],
+            limits['vov']))
+    # a slope of 0 means MCNP did not have enough history scores to fit one.
+    if 0 < slope[-1] < limits['slope']:
+        problems.append('the slope of the history score tail is %.3g, '
+                %(slope[-1]) + 'below %.3g' %(limits['slope']))
+    if fom_variation > limits['fom variation']:
+        warnings.append('the FOM varies by %.0f%%' %(100*fom_variation))
+
+    if mc_time is None:
+        mc_time = 1/(error[-1]**2*fom[-1]) if error[-1] > 0 and \
+                fom[-1] > 0 else np.nan
+    will_converge = not problems
+    if will_converge:
+        histories_needed = (target_error/c)**(1/error_exponent)
+        time_needed = 1/(target_error**2*fom_mean) if fom_mean > 0 else \
+                np.nan
+    else:
+        histories_needed = np.inf
+        time_needed = np.inf
+
+    return {'target error' : target_error,
+            'error' : error[-1],
+            'nps' : nps[-1],
+            'converged' : bool(error[-1] <= target_error),
+            'error exponent' : error_exponent,
+            'vov' : vov[-1],
+            'slope' : slope[-1],
+            'fom' : fom_mean,
+            'fom variation' : fom_variation,
+            'fom exponent' : fom_exponent,
+            'histories needed' : histories_needed,
+            'histories remaining' : max(histories_needed - nps[-1], 0),
+            'time' : mc_time,
+            'time needed' : time_needed,
+            'time remaining' : max(time_needed - mc_time, 0),
+            'will converge' : will_converge,
+            'problems' : problems,
+            'warnings' : warnings}
+
+def get_prediction_frame(predictions, name='tally'):
+    '''
+    Returns a dataframe of a dict of predictions (from predict_convergence)
+    with one row per key, in a index named name. The problems and warnings
+    are joined into one string each.
+    '''
+    columns = ['target error', 'error', 'nps', 'converged', 'error exponent',
+            'vov', 'slope', 'fom', 'fom variation', 'histories needed',
+            'histories remaining', 'time', 'time needed', 'time remaining',
+            'will converge', 'problems', 'warnings']
+    rows = []
+    for key in predictions:
+        row = dict(predictions[key])
+        row['problems'] = '; '.join(row['problems'])
+        row['warnings'] = '; '.join(row['warnings'])
+        rows.append(row)
+    frame = pd.DataFrame(rows, index=pd.Index(list(predictions), name=name))
+    return frame.reindex(columns=columns)
+
+class OutputFollower(object):
+    '''
+    Follows the output file of a running MCNP job. Each call to poll() reads
+    what was written since the last call and returns the fluctuation chart
+    trends of the tallies that have a new chart. Only the text from the
+    last chart header on is kept between calls.
+    '''
+    header = re.compile(r'1tally\s+fluctuation\s+charts')
+
+    def __init__(self, outputpath, tallynumbers=('44',)):
+        self.outputpath = str(outputpath)
+        self.tallies = [TrackLengthTally(self.outputpath, tallynumber) for
+                tallynumber in tallynumbers]
+        self.offset = 0
+        self.buffer = ''
+        self.trends = {}
+        self.done = False
+
+    def poll(self):
+        '''
+        Returns a dict of the new fluctuation chart trends by tally number.
+        Sets done once the run has finished.
+        '''
+        if not os.path.isfile(self.outputpath):
+            return {}
+        size = os.path.getsize(self.outputpath)
+        if size < self.offset:
+            # the file was replaced, by a restart for example.
+            self.offset = 0
+            self.buffer = ''
+        if size == self.offset:
+            return {}
+        with open(self.outputpath, 'r') as fp:
+            fp.seek(self.offset)
+            text = self.buffer + fp.read()
+            self.offset = fp.tell()
+
+        found = {}
+        for tally in self.tallies:
+            trends = tally.parse_fom_data(text, latest=True)
+            if trends is None:
+                continue
+            previous = self.trends.get(tally.tallynumber)
+            if previous is None or previous['nps'][-1] != trends['nps'][-1]:
+                found[tally.tallynumber] = trends
+                self.trends[tally.tallynumber] = trends
+
+        if run_done.search(text):
+            self.done = True
+        starts = [match.start() for match in self.header.finditer(text)]
+        self.buffer = text[starts[-1]:] if starts else text[-256:]
+        return found
+
+def follow_convergence(outputpath, tallynumbers=('44',), target_error=0.05,
+        interval=60, timeout=None):
+    '''
+    Follows the output file of a running job and yields (tally number,
+    prediction) for every new fluctuation chart, polling every interval
+    seconds. Stops when the run has finished, when every tally has reached
+    the target or will never converge, or after timeout seconds.
+    '''
+    logger = logging.getLogger("analysis.convergence")
+
+    follower = OutputFollower(outputpath, tallynumbers)
+    settled = {}
+    started = time.time()
+    while True:
+        for tallynumber, trends in sorted(follower.poll().items()):
+            prediction = predict_convergence(trends, target_error)
+            settled[tallynumber] = prediction['converged'] or \
+                    not prediction['will converge']
+            yield tallynumber, prediction
+        if follower.done:
+            logger.info("%s has finished" %(outputpath))
+            return
+        if len(settled) == len(follower.tallies) and all(settled.values()):
+            logger.info("every tally has converged or will not converge")
+            return
+        if timeout is not None and time.time() - started > timeout:
+            logger.info("stopped following %s after %d s" %(outputpath,
+                timeout))
+            return
+        time.sleep(interval)
+
+###############################################################################
+# end of thesiscode/scripts/convergence.py
+###############################################################################
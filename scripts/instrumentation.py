@@ -0,0 +1,322 @@
+###############################################################################
+# File  : thesiscode/scripts/instrumentation.py
+# Author: madicken
+# Date  : Mon Oct 19 18:05:26 2026
+#
+# instrumentation records where the analysis spends its time and memory.
+#    -- stage is a context manager and traced a decorator that time a stage
+#    of the analysis (a reader, a statistic, a plot). Each stage records its
+#    wall time, cpu time, bytes read, the RSS at its entry and exit and its
+#    own peak RSS.
+#
+# The peak RSS of a stage is the high water mark (VmHWM) since its entry:
+# the mark is reset at every stage entry (writing 5 to /proc/self/clear_refs)
+# after it is folded into the peaks of the stages still open, so that nested
+# stages do not hide the peak of the stage around them. Where the mark can
+# not be reset, the stage records how much it raised the process peak
+# (ru_maxrss) instead. Memory, the bytes read and (without RUSAGE_THREAD, as
+# on python 2.7) the cpu time are counted for the whole process, so a stage
+# that ran while a stage of another thread was open lists them under
+# 'process-wide' in its event.
+#    -- enable_tracing and disable_tracing turn the recording on and off.
+#    When it is off, stage and traced do nothing but check a flag.
+#    -- write_trace writes the recorded stages as a Chrome trace event file
+#    that can be opened in chrome://tracing or https://ui.perfetto.dev.
+#
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import functools
+import threading
+import resource
+import logging
+import json
+import time
+import sys
+import os
+###############################################################################
+
+# per thread cpu time where the platform has it, process cpu time otherwise.
+rusage_who = getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF)
+
+def get_peak_rss():
+    '''
+    Returns the peak resident set size of this process in MiB, including
+    the peaks before the stages reset the high water mark.
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    if sys.platform == 'darwin':
+        peak = peak/2**20
+    else:
+        peak = peak/2**10
+    return max(peak, tracer.reset_peak)
+
+def read_status(field):
+    '''
+    Returns a memory field of /proc/self/status, such as VmRSS or VmHWM, in
+    MiB, or None where that is not available.
+    '''
+    try:
+        with open('/proc/self/status', 'r') as fp:
+            for line in fp:
+                if line.startswith(field+':'):
+                    return int(line.split()[1])/2**10
+    except (IOError, OSError):
+        pass
+    return None
+
+def get_rss():
+    '''
+    Returns the current resident set size of this process in MiB, or None
+    where that is not available.
+    '''
+    return read_status('VmRSS')
+
+def reset_peak_rss():
+    '''
+    Resets the high water mark of the resident set size (VmHWM) of this
+    process to its current size. Returns False if that is not possible.
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+    except (IOError, OSError):
+        return False
+    return True
+
+def get_cpu_time():
+    '''
+    Returns the user and system cpu time used so far, in seconds.
+    '''
+    usage = resource.getrusage(rusage_who)
+    return usage.ru_utime + usage.ru_stime
+
+def get_bytes_read():
+    '''
+    Returns the number of bytes this process has read so far (rchar in
+    /proc/self/io), or None where that is not available.
+    '''
+    try:
+        with open('/proc/self/io', 'r') as fp:
+            for line in fp:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+class Tracer(object):
+    '''
+    Collects the trace events of this process. There is one tracer per
+    process, the module-level tracer.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.thread_names = {}
+        self.lock = threading.Lock()
+        # the stages open in any thread, whether VmHWM can be reset and the
+        # largest mark reset, which ru_maxrss forgets with it.
+        self.open_stages = []
+        self.can_reset = None
+        self.reset_peak = 0
+
+    def open(self, stage):
+        '''
+        Starts measuring the peak RSS of stage: the high water mark so far
+        is folded into the peaks of the stages already open, then reset.
+        '''
+        with self.lock:
+            self.mark_shared(stage)
+            if self.can_reset is not False:
+                mark = read_status('VmHWM')
+                for other in self.open_stages:
+                    other.fold_peak(mark)
+                self.can_reset = mark is not None and reset_peak_rss()
+                if self.can_reset:
+                    self.reset_peak = max(self.reset_peak, mark)
+            self.open_stages.append(stage)
+
+    def close(self, stage):
+        '''
+        Stops measuring stage, folding the high water mark into its peak and
+        the peaks of the other stages open.
+        '''
+        with self.lock:
+            self.open_stages.remove(stage)
+            self.mark_shared(stage)
+            if self.can_reset:
+                mark = read_status('VmHWM')
+                stage.fold_peak(mark)
+                for other in self.open_stages:
+                    other.fold_peak(mark)
+
+    def mark_shared(self, stage):
+        # stages of different threads that are open at the same time share
+        # the process-wide counters.
+        for other in self.open_stages:
+            if other.thread != stage.thread:
+                other.shared = True
+                stage.shared = True
+
+    def add(self, event):
+        thread = threading.current_thread()
+        with self.lock:
+            self.thread_names[(event['pid'], event['tid'])] = thread.name
+            self.events.append(event)
+
+    def extend(self, events, thread_names={}):
+        '''
+        Adds events recorded in another process (for example a render pool
+        worker).
+        '''
+        with self.lock:
+            self.events.extend(events)
+            self.thread_names.update(thread_names)
+
+tracer = Tracer()
+
+def enable_tracing():
+    '''
+    Starts recording trace events, dropping any recorded before.
+    '''
+    with tracer.lock:
+        tracer.events = []
+        tracer.thread_names = {}
+    tracer.enabled = True
+
+def disable_tracing():
+    '''
+    Stops recording trace events and returns the events recorded.
+    '''
+    tracer.enabled = False
+    with tracer.lock:
+        return list(tracer.events)
+
+class Stage(object):
+    '''
+    Context manager that records a single stage as a complete ('X') trace
+    event, followed by a counter ('C') event with the RSS at its exit.
+    '''
+    def __init__(self, name, category='analysis', args=None):
+        self.name = name
+        self.category = category
+        self.args = args or {}
+        self.thread = threading.current_thread().ident
+        self.shared = False
+        self.peak = None
+
+    def fold_peak(self, mark):
+        if mark is not None and (self.peak is None or mark > self.peak):
+            self.peak = mark
+
+    def __enter__(self):
+        self.rss = get_rss()
+        self.max_rss = get_peak_rss()
+        tracer.open(self)
+        self.bytes_read = get_bytes_read()
+        self.cpu_time = get_cpu_time()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.time()
+        cpu_time = get_cpu_time() - self.cpu_time
+        bytes_read = get_bytes_read()
+        tracer.close(self)
+        rss = get_rss()
+
+        args = dict(self.args)
+        args['cpu time (s)'] = cpu_time
+        if self.rss is not None and rss is not None:
+            args['rss at entry (MiB)'] = self.rss
+            args['rss at exit (MiB)'] = rss
+        if self.peak is not None:
+            args['peak rss (MiB)'] = self.peak
+        else:
+            args['peak rss increase (MiB)'] = get_peak_rss() - self.max_rss
+        if bytes_read is not None and self.bytes_read is not None:
+            args['bytes read'] = bytes_read - self.bytes_read
+        if self.shared:
+            shared = ['rss at entry (MiB)', 'rss at exit (MiB)',
+                    'peak rss (MiB)', 'peak rss increase (MiB)', 'bytes read']
+            if rusage_who == resource.RUSAGE_SELF:
+                shared.append('cpu time (s)')
+            args['process-wide'] = [key for key in shared if key in args]
+        if exc_type is not None:
+            args['error'] = exc_type.__name__
+
+        pid = os.getpid()
+        tid = threading.current_thread().ident
+        tracer.add({'name' : self.name, 'cat' : self.category, 'ph' : 'X',
+                    'ts' : self.start*1e6, 'dur' : (end - self.start)*1e6,
+                    'pid' : pid, 'tid' : tid, 'args' : args})
+        if rss is not None:
+            tracer.add({'name' : 'rss', 'ph' : 'C', 'ts' : end*1e6,
+                        'pid' : pid, 'tid' : tid, 'args' : {'MiB' : rss}})
+        return False
+
+class NoStage(object):
+    '''
+    Stands in for Stage when tracing is disabled.
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+no_stage = NoStage()
+
+def stage(name, category='analysis', **args):
+    '''
+    Returns a context manager that records the code in its block as the
+    stage name. Extra keyword arguments are stored with the event.
+    '''
+    if not tracer.enabled:
+        return no_stage
+    return Stage(name, category, args)
+
+def traced(name=None, category='analysis'):
+    '''
+    Decorator that records every call of a function as a stage. The stage
+    is named after the function unless name is given.
+    '''
+    def decorator(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with Stage(label, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def write_trace(savepath, events=None):
+    '''
+    Writes the recorded events (or the given events) to savepath in the
+    Chrome trace event format.
+    '''
+    logger = logging.getLogger("analysis.instrumentation")
+
+    with tracer.lock:
+        if events is None:
+            events = list(tracer.events)
+        thread_names = dict(tracer.thread_names)
+
+    metadata = []
+    for (pid, tid), thread_name in sorted(thread_names.items()):
+        metadata.append({'name' : 'thread_name', 'ph' : 'M', 'pid' : pid,
+                         'tid' : tid, 'args' : {'name' : thread_name}})
+
+    with open(savepath, 'w') as fp:
+        json.dump({'traceEvents' : metadata + events,
+                   'displayTimeUnit' : 'ms'}, fp)
+    logger.info("wrote %d trace events to %s" %(len(events), savepath))
+
+###############################################################################
+# end of thesiscode/scripts/instrumentation.py
+###############################################################################
@@ -12,6 +12,8 @@
 #       container object.
 #       - get_fom_data gets the tally figure of merit statistics as a function
 #       of particle count. This is relevant also for further FOM analyses.
+#       - parse_fom_data reads the same statistics from the text of an
+#       output file, optionally from its latest chart.
 #
 ###############################################################################
 from __future__ import (division, absolute_import, print_function, )
@@ -19,6 +21,7 @@ from __future__ import (division, absolute_import, print_function, )
 import numpy as np
 import os
 import re
+from instrumentation import traced
 ###############################################################################
 
 class TrackLengthTally(object):
@@ -32,6 +35,7 @@ class TrackLengthTally(object):
         self.tallynumber = tallynumber
         return
 
+    @traced('TrackLengthTally.get_timing_data', 'read')
     def get_timing_data(self):
         '''
         This function parses out the relevant timing data for the problem. It
@@ -65,6 +69,7 @@ class TrackLengthTally(object):
                  'mcrun_time':mcrun_time}
     	return times
 
+    @traced('TrackLengthTally.get_tally_result', 'read')
     def get_tally_result(self):
         '''Function used to get the tally result from the mcnp output. This
         function will return a dictionary of numpy arrays with the tally
@@ -114,6 +119,7 @@ class TrackLengthTally(object):
         return tally_data
 
 
+    @traced('TrackLengthTally.get_fom_data', 'read')
     def get_fom_data(self):
         '''
         Function that scrapes specified tally statistical results, including
@@ -127,11 +133,33 @@ class TrackLengthTally(object):
         f = open(self.outputpath, 'r')
         alllines = f.read()
 
+        tally_trends = self.parse_fom_data(alllines)
+        if tally_trends is None:
+            raise ValueError('no fluctuation chart for tally %s in %s'
+                    %(self.tallynumber, self.outputpath))
+        return tally_trends
+
+    def parse_fom_data(self, alllines, latest=False):
+        '''
+        Parses the fluctuation chart of the tally from the text of an output
+        file and returns the same dictionary as get_fom_data. The first chart
+        in the text is read, or with latest=True the last complete one (a
+        running job prints a chart at every dump). Returns None if the text
+        has no complete chart for the tally.
+        '''
+
         # First pull in the fom data for the specified tally number including
         # tally header information.
         str1="1tally(\s*)fluctuation(\s*)charts(.+?)tally(\s*)%s(.+?)dump(.+?)" %(self.tallynumber)
         pattern=re.compile(str1,  flags=re.DOTALL)
-        results=pattern.search(alllines)
+        if latest == True:
+            results = None
+            for results in pattern.finditer(alllines):
+                pass
+        else:
+            results=pattern.search(alllines)
+        if results is None:
+            return None
 
         # Now pull out the specific tally numerical results for the FOM and
         # particle count from that tally
@@ -152,6 +180,10 @@ class TrackLengthTally(object):
         for item in range(len(tally_data)-1):
             splitresults = tally_data[item].split()
 
+            # skip the blank lines between the chart and the next table
+            if not splitresults:
+                continue
+
             # The first line we read in is the labels for each column. Don't
             # include this information in the aformentioned numpy arrays but
             # save it in the tally_labels variable
@@ -0,0 +1,367 @@
+###############################################################################
+# File  : thesiscode/scripts/memory_plan.py
+# Author: madicken
+# Date  : Mon Oct 19 19:31:54 2026
+#
+# memory_plan chooses how a Single_Run analysis reads the anisotropy data so
+# that the process stays under a memory budget.
+#    -- MemoryPlan estimates the memory needed by each requested output from
+#    the mesh size, the number of groups and metrics and the precision, and
+#    picks the precision, chunk size, sampling of the plotted data, prefetch
+#    depth and number of workers that fit in the budget. If an output can
+#    not be made within the budget it raises MemoryError with the estimate.
+#    -- parse_memory reads budgets such as 2**31, '2G' or '512MiB'.
+#    -- warm_up_plotting draws one small figure of each kind the analysis
+#    will draw, so that the plotting libraries and their caches are resident
+#    when the memory in use is measured. MemoryPlan.plan calls it (and logs
+#    it) unless it is given warm_up=False.
+#
+# The plotting libraries are the largest fixed cost: importing matplotlib,
+# seaborn and scipy and drawing the first figure of each kind took about 80
+# MiB (from 70 MiB after importing single_run to 152 MiB), far more than the
+# data of a small run. So the plan measures the memory in use after the
+# warm up rather than estimating it. The data estimates are upper bounds of
+# what was measured on a 400k cell, 10 group file: reading a metric costs
+# its matrix plus one group read, and plotting a matrix with seaborn costs
+# up to 16 bytes per value on top of the matrix.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import resource
+import tempfile
+import logging
+import shutil
+import sys
+import os
+import re
+###############################################################################
+
+units = {'' : 1, 'b' : 1,
+         'k' : 2**10, 'kb' : 2**10, 'kib' : 2**10,
+         'm' : 2**20, 'mb' : 2**20, 'mib' : 2**20,
+         'g' : 2**30, 'gb' : 2**30, 'gib' : 2**30,
+         't' : 2**40, 'tb' : 2**40, 'tib' : 2**40}
+
+def parse_memory(value):
+    '''
+    Returns a memory size in bytes. value is a number of bytes or a string
+    with a unit, such as '2G', '1.5 GiB' or '512M'.
+    '''
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    match = re.match(r'^\s*([0-9.]+)\s*([a-zA-Z]*)\s*$', str(value))
+    if match is None or match.group(2).lower() not in units:
+        raise ValueError('%s is not a recognized memory size' %(value))
+    return int(float(match.group(1))*units[match.group(2).lower()])
+
+def format_memory(size):
+    '''
+    Returns a memory size in bytes as a string in MiB.
+    '''
+    return '%.0f MiB' %(size/2**20)
+
+def get_current_rss():
+    '''
+    Returns the current resident set size of this process in bytes. Where
+    /proc is not available the peak RSS is returned instead.
+    '''
+    try:
+        with open('/proc/self/statm', 'r') as fp:
+            pages = int(fp.read().split()[1])
+        return pages*resource.getpagesize()
+    except (IOError, OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname()[0] == 'Darwin' else peak*2**10
+
+# input flag : the plotting_utils figures it draws, for warm_up_plotting.
+figure_kinds = {'violins_for_metric' : ['violinbyenergy'],
+                'boxes_for_metric' : ['boxbyenergy'],
+                'strip_for_metric' : ['stripbyenergy'],
+                'violins_for_energy' : ['violinbymetric'],
+                'boxes_for_energy' : ['boxbymetric'],
+                'strip_for_energy' : ['stripbymetric'],
+                'fom_convergence' : ['energy_histogram'],
+                'relative_error_by_bin' : ['energy_histogram'],
+                'tally_result' : ['energy_histogram'],
+                'plot_anisotropy_correlations' : ['statscatter'],
+                'plot_anisotropy_corrs_median' : ['statscatter'],
+                'plot_anisotropy_corrs_mean' : ['statscatter']}
+
+def warm_up_plotting(kinds):
+    '''
+    Draws one small figure of each plotting_utils kind in kinds to a
+    temporary directory, which imports the plotting libraries and fills
+    their caches the way the analysis will.
+    '''
+    import plotting_utils
+
+    data = np.linspace(1, 2, 40).reshape(10, 4)
+    values = np.linspace(1, 2, 10)
+    tmpdir = tempfile.mkdtemp()
+    savepath = os.path.join(tmpdir, 'warm_up.pdf')
+    try:
+        for kind in sorted(set(kinds)):
+            function = getattr(plotting_utils, kind)
+            if kind == 'energy_histogram':
+                function(np.logspace(-3, 1, 11), values, savepath)
+            elif kind == 'statscatter':
+                function(values, values, values, values, savepath)
+            elif kind.endswith('bymetric'):
+                function(data=data, plot_title='', x_title='',
+                        x_names=['a', 'b', 'c', 'd'], y_title='',
+                        savepath=savepath, log_scale=True)
+            else:
+                function(data=data, plot_title='', x_title='', y_title='',
+                        savepath=savepath, log_scale=True)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+class MemoryPlan(object):
+    '''
+    Memory plan for the anisotropy part of a Single_Run analysis. Built from
+    the budget (bytes), the number of mesh cells per group, the number of
+    groups and metrics, the precision asked for and the input flags. After
+    plan() the chosen settings are attributes:
+    - dtype: the precision the data is read in
+    - chunk_size: values per slab for chunked reads
+    - sample_rows: mesh cells sampled for the violin and box plots (None
+      for all of them)
+    - chunked_samples: whether the strip plot samples are drawn chunk by
+      chunk instead of from the full matrix
+    - cache_filters: whether the filter matrices are kept between reads
+    - prefetch_depth, max_workers, render_processes
+    '''
+    # float64 copies of the plotted matrix made by pandas and seaborn
+    # (measured up to 2, kept at 3 for the cast of float32 data)
+    plot_copies = 3
+    # fewest mesh cells worth plotting a distribution of
+    min_sample_rows = 1500
+    # mesh cells sampled for a strip plot, and the bytes each plotted value
+    # of a strip plot takes (measured up to 92)
+    strip_samples = 1500
+    strip_value_cost = 128
+    # memory the plotting libraries take once every kind of figure has been
+    # drawn (measured 82 MiB). A budget that can not hold them is refused
+    # before they are loaded.
+    plotting_libraries = 96*2**20
+    # growth beyond the memory in use after warm_up_plotting while the
+    # figures are drawn: caches for their text, and the transient of saving
+    # a figure (measured 23 MiB)
+    plotting_reserve = 40*2**20
+
+    def __init__(self, budget, cells, num_groups, num_metrics,
+            dtype=np.float64, file_itemsize=8):
+        self.budget = parse_memory(budget)
+        self.cells = int(cells)
+        self.num_groups = int(num_groups)
+        self.num_metrics = int(num_metrics)
+        self.requested_dtype = np.dtype(dtype).type
+        self.file_itemsize = file_itemsize
+
+        self.in_use = get_current_rss()
+        self.available = self.budget - self.in_use
+        self.estimates = {}
+
+        self.dtype = self.requested_dtype
+        self.chunk_size = 2**20
+        self.sample_rows = None
+        self.chunked_samples = False
+        self.cache_filters = True
+        self.prefetch_depth = 0
+        self.max_workers = 1
+        self.render_processes = 0
+
+    def read_cost(self, itemsize):
+        '''
+        Memory used while reading one group of one metric: the values, read
+        in the analysis precision, the contributon flux as stored while its
+        filter matrix is built, the filter matrix and the filtered product.
+        '''
+        return self.cells*(self.file_itemsize + 3*itemsize)
+
+    def statistics_cost(self, itemsize):
+        '''
+        Memory used by the statistics of one group: the read plus the copy
+        np.median makes.
+        '''
+        return self.read_cost(itemsize) + self.cells*itemsize
+
+    def matrix_cost(self, rows, columns, itemsize):
+        '''
+        Memory used by a plotted (rows, columns) matrix, including the copies
+        made while plotting it.
+        '''
+        return rows*columns*(itemsize + self.plot_copies*8)
+
+    def chunk_cost(self, itemsize):
+        '''
+        Memory used by a chunked read: one slab and the full filter matrix of
+        the group.
+        '''
+        return self.chunk_size*(self.file_itemsize + 3*itemsize) + \
+                self.cells*itemsize
+
+    def fail(self, output, needed):
+        raise MemoryError('%s needs about %s but the memory budget of %s '
+                %(output, format_memory(needed), format_memory(self.budget))
+                + 'leaves %s (%s already in use).'
+                %(format_memory(max(0, self.available)),
+                    format_memory(self.in_use)))
+
+    def plan(self, input_flags, prefetch_depth=0, max_workers=1,
+            render_processes=0, warm_up=True):
+        '''
+        Chooses the settings for the outputs requested in input_flags.
+        Raises MemoryError if one of them can not be made within the budget.
+        Returns self.
+
+        If plots are requested and warm_up is True, warm_up_plotting draws a
+        small figure of each kind first (importing the plotting libraries)
+        so that their memory is measured. With warm_up False nothing is
+        drawn and plotting_libraries is charged for them instead, unless
+        they are already loaded.
+        '''
+        logger = logging.getLogger("analysis.memory_plan")
+
+        plots = [flag for flag in input_flags if input_flags[flag] == True and
+                flag in figure_kinds]
+        if plots:
+            # the libraries are measured once they are loaded, but a budget
+            # they can not fit in is refused before loading them.
+            if 'matplotlib.pyplot' not in sys.modules and self.in_use + \
+                    self.plotting_libraries > self.budget:
+                self.fail('the plotting libraries', self.plotting_libraries)
+            kinds = sorted(set(kind for flag in plots for kind in
+                figure_kinds[flag]))
+            loaded = self.in_use
+            # memory the libraries will still take, on top of self.in_use
+            to_load = 0
+            if warm_up == True:
+                logger.info("warming up the plotting libraries with one "
+                        + "figure each of %s" %(', '.join(kinds)))
+                warm_up_plotting(kinds)
+                self.in_use = get_current_rss()
+            elif 'matplotlib.pyplot' not in sys.modules:
+                to_load = self.plotting_libraries
+            self.available = self.budget - self.in_use - to_load - \
+                    self.plotting_reserve
+            self.estimates['plotting libraries'] = self.in_use - loaded + \
+                    to_load + self.plotting_reserve
+
+        if self.available <= 0:
+            self.fail('the analysis', self.plotting_reserve)
+
+        distributions = []
+        if any(input_flags.get(flag) == True for flag in
+                ['violins_for_metric', 'boxes_for_metric']):
+            distributions.append(('metric distributions', self.num_groups))
+        if any(input_flags.get(flag) == True for flag in
+                ['violins_for_energy', 'boxes_for_energy']):
+            distributions.append(('energy distributions', self.num_metrics))
+        strips = input_flags.get('strip_for_metric') == True or \
+                input_flags.get('strip_for_energy') == True
+        statistics = any(input_flags.get(flag) == True for flag in
+                ['plot_anisotropy_correlations',
+                 'plot_anisotropy_corrs_median', 'plot_anisotropy_corrs_mean'])
+
+        # keep the requested precision if every output fits in it in full,
+        # otherwise read in float32.
+        def full_cost(itemsize):
+            costs = [self.read_cost(itemsize)]
+            for name, columns in distributions:
+                costs.append(self.matrix_cost(self.cells, columns, itemsize)
+                        + self.read_cost(itemsize))
+            if statistics:
+                costs.append(self.statistics_cost(itemsize))
+            return max(costs)
+
+        itemsize = np.dtype(self.requested_dtype).itemsize
+        if full_cost(itemsize) > self.available:
+            self.dtype = np.float32
+            itemsize = 4
+
+        # filter matrices are rebuilt for each read instead of cached, and
+        # slabs are sized to use at most a quarter of the budget.
+        self.cache_filters = False
+        slab = self.file_itemsize + 3*itemsize
+        self.chunk_size = int(min(2**20, max(2**10,
+            (self.available - self.cells*itemsize)//(4*slab))))
+
+        if statistics:
+            needed = self.statistics_cost(itemsize)
+            self.estimates['anisotropy statistics'] = needed
+            if needed > self.available:
+                self.fail('the anisotropy statistics', needed)
+
+        # the distributions are plotted from a sample of the mesh cells if
+        # the full matrix does not fit.
+        largest = 0
+        for name, columns in distributions:
+            fixed = self.read_cost(itemsize)
+            per_row = self.matrix_cost(1, columns, itemsize)
+            rows = int((self.available - fixed)//per_row)
+            if rows < self.min_sample_rows:
+                self.fail('the %s' %(name), fixed +
+                        self.matrix_cost(self.min_sample_rows, columns,
+                            itemsize))
+            if rows < self.cells:
+                self.sample_rows = rows if self.sample_rows is None else \
+                        min(rows, self.sample_rows)
+            rows = min(rows, self.cells)
+            self.estimates[name] = fixed + self.matrix_cost(rows, columns,
+                    itemsize)
+            largest = max(largest, rows*columns*itemsize)
+
+        if strips:
+            self.chunked_samples = True
+            needed = self.chunk_cost(itemsize) + self.strip_samples*max(
+                    self.num_groups, self.num_metrics)*self.strip_value_cost
+            self.estimates['strip plot samples'] = needed
+            if needed > self.available:
+                self.fail('the strip plot samples', needed)
+
+        # prefetched items wait in memory next to the one being plotted.
+        peak = max([self.estimates[name] for name in self.estimates if
+            name != 'plotting libraries'] + [0])
+        if largest > 0:
+            spare = max(0, self.available - peak)
+            self.prefetch_depth = int(min(prefetch_depth, spare//largest))
+        else:
+            self.prefetch_depth = prefetch_depth
+
+        # concurrent tasks each need their own peak.
+        self.max_workers = int(max(1, min(max_workers,
+            self.available//max(peak, 1))))
+
+        # render pool workers are separate processes whose memory is not
+        # covered by the budget.
+        self.render_processes = 0
+        if render_processes != 0:
+            logger.info("rendering in this process to stay within the memory"
+                    + " budget")
+
+        logger.info(self.describe())
+        return self
+
+    def describe(self):
+        '''
+        Returns a summary of the plan for the log.
+        '''
+        lines = ['memory budget %s, %s in use, %s available'
+                %(format_memory(self.budget), format_memory(self.in_use),
+                    format_memory(self.available))]
+        for name in sorted(self.estimates):
+            lines.append('  %s: about %s' %(name,
+                format_memory(self.estimates[name])))
+        lines.append('  precision %s, chunks of %d values, %s, %s'
+                %(np.dtype(self.dtype).name, self.chunk_size,
+                    'all mesh cells plotted' if self.sample_rows is None else
+                    '%d mesh cells sampled for plots' %(self.sample_rows),
+                    'prefetch depth %d, %d worker(s)' %(self.prefetch_depth,
+                        self.max_workers)))
+        return '\n'.join(lines)
+
+###############################################################################
+# end of thesiscode/scripts/memory_plan.py
+###############################################################################
@@ -6,16 +6,18 @@
 # This script contains a few different plotting utilities that are used
 # frequently in the analysis of the data from my dissertation.
 #
+# matplotlib, seaborn and the palettes below are loaded the first time a
+# plot is drawn, not when this module is imported.
+#
 ###############################################################################
 from __future__ import (division, absolute_import, print_function, )
 #-----------------------------------------------------------------------------#
 import numpy as np
-import matplotlib as mpl
-mpl.use('agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib import gridspec
+from analysis_utils import LazyModule, LazyDict, use_agg
 import logging
+plt = LazyModule('matplotlib.pyplot', setup=use_agg)
+sns = LazyModule('seaborn', setup=use_agg)
+gridspec = LazyModule('matplotlib.gridspec')
 ###############################################################################
 
 # Default Values for various things
@@ -234,17 +236,19 @@ def statscatter(x1, x2, x4, y, savepath, metric_name='default metric name',
 if __name__ == '__main__':
     main()
 
-color_palette = {'purples':sns.cubehelix_palette(12)[5:10],
-                 'groups':[sns.diverging_palette(10, 240, n=27),
-                     sns.diverging_palette(10, 240, n=27),
-                     sns.diverging_palette(10, 240, n=27),
-                     sns.diverging_palette(10, 240, n=27),
-                     '0.5'],
-                 'greens':sns.cubehelix_palette(rot=-.4, n_colors=12)[4:9],
-                 'purples_ex':sns.cubehelix_palette(12),
-                 'g_ex': sns.color_palette("GnBu_d", n_colors=16)}
+def make_color_palette():
+    return {'purples':sns.cubehelix_palette(12)[5:10],
+            'groups':[sns.diverging_palette(10, 240, n=27),
+                sns.diverging_palette(10, 240, n=27),
+                sns.diverging_palette(10, 240, n=27),
+                sns.diverging_palette(10, 240, n=27),
+                '0.5'],
+            'greens':sns.cubehelix_palette(rot=-.4, n_colors=12)[4:9],
+            'purples_ex':sns.cubehelix_palette(12),
+            'g_ex': sns.color_palette("GnBu_d", n_colors=16)}
 
-styles = {
+def make_styles():
+    return {
         'cadis' : {'ls':'-.',
                    'color':color_palette['purples_ex'][6],
                    'label': 'cadis'},
@@ -256,6 +260,10 @@ styles = {
                      'label':'analog'},
         }
 
+# both are built the first time they are used.
+color_palette = LazyDict(make_color_palette)
+styles = LazyDict(make_styles)
+
 ###############################################################################
 # end of thesiscode/scripts/plotting_utils.py
 ###############################################################################
@@ -0,0 +1,232 @@
+###############################################################################
+# File  : thesiscode/scripts/processed_data.py
+# Author: madicken
+# Date  : Mon Oct 19 16:48:12 2026
+#
+# processed_data stores the processed data of a run (Single_Run) or of a
+# comparison (Compare_Runs) in a versioned hdf5 file instead of a pickle.
+#    -- Each piece of the processed data (the FOM table, the tally arrays,
+#    the fluctuation chart trends, the timing breakdown, the anisotropy
+#    statistics for each cutoff, ...) is its own dataset or group, so a
+#    reader can load only the pieces it needs.
+#    -- write_processed_data writes a nested dict of arrays, scalars,
+#    strings, lists and pandas dataframes. read_processed_data rebuilds the
+#    same nested dict, or only the requested keys.
+#    -- read_saved_run_data reads the processed data a Single_Run analysis
+#    saved for a run, if the input files it was made from are unchanged.
+#
+# The file layout follows the dict: every dict is a group, every value a
+# dataset or group whose 'kind' attribute says how to rebuild it. The root
+# group holds the schema version and the kind of processed data.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import pandas as pd
+import h5py
+import json
+import numbers
+import logging
+import os
+from analysis_utils import get_fingerprints
+###############################################################################
+
+# version of the file layout. Files with a different version are not read.
+schema_version = 1
+
+def _to_text(value):
+    '''
+    Returns a value read from a string dataset as text.
+    '''
+    if isinstance(value, np.ndarray):
+        value = value[()]
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return value
+
+def _write_text(group, name, text, kind):
+    dataset = group.create_dataset(name, data=np.string_(text.encode('utf-8')))
+    dataset.attrs['kind'] = kind
+    return dataset
+
+def _write_labels(group, name, labels):
+    '''
+    Writes index or column labels as json. Tuples (from a MultiIndex) are
+    written as lists.
+    '''
+    _write_text(group, name, json.dumps(list(labels.tolist())), 'labels')
+    if labels.names is not None:
+        group[name].attrs['names'] = json.dumps(list(labels.names))
+
+def _read_labels(dataset):
+    labels = json.loads(_to_text(dataset[()]))
+    names = json.loads(_to_text(dataset.attrs.get('names', 'null')))
+    if labels and isinstance(labels[0], list):
+        return pd.MultiIndex.from_tuples([tuple(label) for label in labels],
+                names=names)
+    return pd.Index(labels, name=names[0] if names else None)
+
+def _write_frame(group, name, frame):
+    '''
+    Writes a dataframe as a group with one dataset per column, so single
+    columns can be read without the rest of the table.
+    '''
+    subgroup = group.create_group(name)
+    subgroup.attrs['kind'] = 'frame'
+    _write_labels(subgroup, 'index', frame.index)
+    _write_labels(subgroup, 'columns', frame.columns)
+    for number in range(frame.shape[1]):
+        column = frame.iloc[:, number]
+        if column.dtype == object:
+            _write_text(subgroup, 'column_%03d' %(number),
+                    json.dumps(column.tolist()), 'list')
+        else:
+            subgroup.create_dataset('column_%03d' %(number),
+                    data=column.values)
+
+def _read_frame(group):
+    index = _read_labels(group['index'])
+    columns = _read_labels(group['columns'])
+    data = []
+    for number in range(len(columns)):
+        dataset = group['column_%03d' %(number)]
+        if dataset.attrs.get('kind') == 'list':
+            data.append(json.loads(_to_text(dataset[()])))
+        else:
+            data.append(dataset[()])
+    frame = pd.DataFrame(dict(zip(range(len(columns)), data)), index=index)
+    frame.columns = columns
+    return frame
+
+def _write_value(group, name, value):
+    '''
+    Writes a single value of the processed data dict under name in group.
+    '''
+    name = str(name)
+    if '/' in name:
+        raise ValueError('processed data key %s can not contain /' %(name))
+
+    if isinstance(value, dict):
+        subgroup = group.create_group(name)
+        subgroup.attrs['kind'] = 'dict'
+        for key in value:
+            _write_value(subgroup, key, value[key])
+    elif isinstance(value, pd.DataFrame):
+        _write_frame(group, name, value)
+    elif value is None:
+        subgroup = group.create_group(name)
+        subgroup.attrs['kind'] = 'none'
+    elif isinstance(value, (list, tuple)):
+        _write_text(group, name, json.dumps(list(value)), 'list')
+    elif isinstance(value, (str, type(u''))):
+        _write_text(group, name, value, 'string')
+    elif isinstance(value, (np.ndarray, np.generic, numbers.Number)):
+        dataset = group.create_dataset(name, data=value)
+        dataset.attrs['kind'] = 'array'
+    else:
+        raise TypeError('can not store %s of type %s as processed data'
+                %(name, type(value).__name__))
+
+def _read_value(obj):
+    '''
+    Rebuilds the value stored in a group or dataset.
+    '''
+    kind = _to_text(obj.attrs.get('kind', 'array'))
+    if kind == 'dict':
+        return dict((key, _read_value(obj[key])) for key in obj)
+    elif kind == 'frame':
+        return _read_frame(obj)
+    elif kind == 'none':
+        return None
+    elif kind == 'list':
+        return json.loads(_to_text(obj[()]))
+    elif kind == 'string':
+        return _to_text(obj[()])
+    return obj[()]
+
+def write_processed_data(savepath, data, kind='single run'):
+    '''
+    Writes the nested dict data to the hdf5 file savepath, replacing it if
+    it exists. kind names the producer of the data (single run or compare
+    runs).
+    '''
+    logger = logging.getLogger("analysis.processed_data")
+
+    with h5py.File(savepath, 'w') as f:
+        f.attrs['schema_version'] = schema_version
+        f.attrs['kind'] = kind
+        for key in data:
+            _write_value(f, key, data[key])
+    logger.debug("wrote %s processed data to %s" %(kind, savepath))
+
+def get_schema_version(savepath):
+    '''
+    Returns the schema version of a processed data file.
+    '''
+    with h5py.File(savepath, 'r') as f:
+        return int(f.attrs.get('schema_version', 0))
+
+def read_processed_data(savepath, keys=None):
+    '''
+    Reads a processed data file written by write_processed_data and returns
+    the same nested dict. If keys is given, only those entries are read.
+    A key can be a path into the nested dict, for example
+    'frames/fom_frame', in which case only that piece is read and it is
+    returned under the same nested keys. Raises ValueError if the file has
+    a different schema version.
+    '''
+    with h5py.File(savepath, 'r') as f:
+        version = int(f.attrs.get('schema_version', 0))
+        if version != schema_version:
+            raise ValueError('%s has processed data schema version %d, not %d'
+                    %(savepath, version, schema_version))
+        if keys is None:
+            return dict((key, _read_value(f[key])) for key in f)
+
+        data = {}
+        for key in keys:
+            if key not in f:
+                raise KeyError('%s has no processed data %s' %(savepath, key))
+            parts = key.split('/')
+            level = data
+            for part in parts[:-1]:
+                level = level.setdefault(part, {})
+            level[parts[-1]] = _read_value(f[key])
+        return data
+
+def read_saved_run_data(filenames, directories, tally_number='44',
+        keys=None, inputs=('mcnp_output_file', 'timing_file',
+            'omni_out_file')):
+    '''
+    Returns the processed data (or only keys) that Single_Run saved in the
+    analysis directory of a run, if it was made for tally_number from the
+    same inputs files as the ones in filenames (compared by fingerprint).
+    Returns None if there is no such data or it is out of date.
+    '''
+    logger = logging.getLogger("analysis.processed_data")
+
+    analysis_dir = directories['analysis_directory']
+    varsave = analysis_dir+'/processed_data.json'
+    datasave = analysis_dir+'/processed_data.h5'
+    if not (os.path.isfile(varsave) and os.path.isfile(datasave)):
+        return None
+    with open(varsave, 'r') as fp:
+        saved = json.load(fp)
+    saved_prints = saved.get('fingerprints', {})
+    if str(saved.get('tally number')) != str(tally_number) or \
+            saved_prints.get(inputs[0]) is None:
+        return None
+    current = get_fingerprints(filenames, inputs)
+    if any(saved_prints.get(key) != current[key] for key in inputs):
+        logger.debug("processed data in %s is out of date" %(analysis_dir))
+        return None
+
+    try:
+        return read_processed_data(datasave, keys=keys)
+    except (KeyError, ValueError, IOError) as e:
+        logger.debug("can not reuse %s: %s" %(datasave, e))
+        return None
+
+###############################################################################
+# end of thesiscode/scripts/processed_data.py
+###############################################################################
@@ -0,0 +1,239 @@
+###############################################################################
+# File  : thesiscode/scripts/render_pool.py
+# Author: madicken
+# Date  : Mon Oct 19 14:20:37 2026
+#
+# render_pool renders the figures from plotting_utils in separate processes.
+#    -- RenderPool takes plot jobs (the name of a plotting_utils function and
+#    its keyword arguments) and renders them on a pool of worker processes
+#    that each use the Agg backend. Large arrays are written once to a
+#    scratch directory and passed to the workers as file references that
+#    are memory mapped, not as pickled copies.
+#    -- render_job renders a single job. It is also used inline when the
+#    pool has no worker processes.
+# Use the pool as a context manager: on leaving the block it waits for the
+# jobs and closes, or, if the block raised, stops the workers at once. Either
+# way the worker processes and the scratch arrays do not outlive it.
+#
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import multiprocessing
+import tempfile
+import shutil
+import logging
+import os
+from collections import OrderedDict
+from instrumentation import (tracer, stage, enable_tracing, disable_tracing,
+        Stage)
+###############################################################################
+
+class ArrayReference(object):
+    '''
+    Stands in for a numpy array that was saved to a .npy file. Workers load
+    it with load(), which memory maps the file instead of reading it.
+    '''
+    def __init__(self, path):
+        self.path = str(path)
+
+    def load(self):
+        return np.load(self.path, mmap_mode='r')
+
+def init_worker():
+    '''
+    Sets the Agg backend in a worker process before anything is drawn.
+    '''
+    import matplotlib as mpl
+    mpl.use('agg')
+
+def render_job(job):
+    '''
+    Renders a single plot job, a tuple of (function name, kwargs) where the
+    function is looked up in plotting_utils. Any ArrayReference in kwargs
+    (or in a list in kwargs) is loaded first. A job submitted while tracing
+    is on has a third element, True, and the job is then traced in the
+    worker. Returns the savepath, the trace events recorded in the worker
+    and their thread names.
+    '''
+    import plotting_utils
+
+    function_name, kwargs = job[:2]
+    trace = len(job) > 2 and job[2]
+    if trace:
+        enable_tracing()
+    function = getattr(plotting_utils, function_name)
+
+    resolved = {}
+    for key, value in kwargs.items():
+        if isinstance(value, ArrayReference):
+            value = value.load()
+        elif isinstance(value, list):
+            value = [item.load() if isinstance(item, ArrayReference) else
+                    item for item in value]
+        resolved[key] = value
+
+    with stage('render %s' %(function_name), 'plotting',
+            savepath=str(kwargs.get('savepath'))):
+        function(**resolved)
+    if trace:
+        return kwargs.get('savepath'), disable_tracing(), tracer.thread_names
+    return kwargs.get('savepath'), [], {}
+
+class RenderPool(object):
+    '''
+    Pool of processes that render plotting_utils figures. Jobs are submitted
+    with submit(function_name, **kwargs) and wait() blocks until all of them
+    are rendered. With processes=0 every job is rendered inline as it is
+    submitted, which is the same as calling the plotting function directly.
+    '''
+    def __init__(self, processes=0, scratch_dir=None, array_threshold=2**14,
+            cache_size=8):
+        '''
+        processes is the number of worker processes (None for one per cpu).
+        Arrays with more than array_threshold elements are passed by file
+        reference through scratch_dir (a temporary directory by default).
+        The last cache_size arrays written are remembered so that an array
+        shared by several plots is only written once.
+        '''
+        self.processes = processes
+        self.array_threshold = array_threshold
+        self.cache_size = cache_size
+        self.scratch_root = scratch_dir
+        self.scratch_dir = None
+        self.references = OrderedDict()
+        self.written = 0
+        self.results = []
+        if processes == 0:
+            self.pool = None
+        else:
+            self.pool = multiprocessing.Pool(processes, initializer=init_worker)
+
+    def reference(self, array):
+        '''
+        Returns a file reference for a large array, saving it to the scratch
+        directory unless it is one of the recently written arrays.
+        '''
+        key = id(array)
+        if key in self.references:
+            return self.references[key][1]
+        if self.scratch_dir is None:
+            self.scratch_dir = tempfile.mkdtemp(prefix='render_pool_',
+                    dir=self.scratch_root)
+        path = os.path.join(self.scratch_dir, 'array_%06d.npy'
+                %(self.written))
+        np.save(path, np.ascontiguousarray(array))
+        self.written += 1
+        reference = ArrayReference(path)
+        # the cached arrays are kept alive so that their ids are not reused
+        # by another array. The files stay on disk until cleanup.
+        self.references[key] = (array, reference)
+        if len(self.references) > self.cache_size:
+            self.references.popitem(last=False)
+        return reference
+
+    def prepare(self, kwargs):
+        '''
+        Replaces the large arrays in kwargs with file references.
+        '''
+        prepared = {}
+        for key, value in kwargs.items():
+            if isinstance(value, np.ndarray) and \
+            value.size > self.array_threshold:
+                value = self.reference(value)
+            elif isinstance(value, list) and any(isinstance(item, np.ndarray)
+                    and item.size > self.array_threshold for item in value):
+                value = [self.reference(item) if isinstance(item, np.ndarray)
+                        and item.size > self.array_threshold else item
+                        for item in value]
+            prepared[key] = value
+        return prepared
+
+    def submit(self, function_name, **kwargs):
+        '''
+        Submits a plotting_utils function and its keyword arguments for
+        rendering.
+        '''
+        logger = logging.getLogger("analysis.render_pool")
+
+        if self.pool is None:
+            render_job((function_name, kwargs))
+            return
+        if tracer.enabled:
+            with Stage('prepare %s' %(function_name), 'plotting'):
+                job = (function_name, self.prepare(kwargs), True)
+        else:
+            job = (function_name, self.prepare(kwargs))
+        logger.debug("submitting %s for %s" %(function_name,
+            kwargs.get('savepath')))
+        self.results.append(self.pool.apply_async(render_job, (job,)))
+
+    def wait(self):
+        '''
+        Waits for every submitted job. Errors raised while rendering are
+        raised here. Returns the list of rendered savepaths.
+        '''
+        logger = logging.getLogger("analysis.render_pool")
+
+        results, self.results = self.results, []
+        rendered = []
+        for result in results:
+            savepath, events, thread_names = result.get()
+            tracer.extend(events, thread_names)
+            rendered.append(savepath)
+        if rendered:
+            logger.info("rendered %d figures on %s worker processes"
+                    %(len(rendered), self.processes or 'all'))
+        self.cleanup()
+        return rendered
+
+    def cleanup(self):
+        '''
+        Removes the scratch directory and forgets the saved arrays.
+        '''
+        if self.scratch_dir is not None:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        self.scratch_dir = None
+        self.references = OrderedDict()
+        self.written = 0
+
+    def close(self):
+        '''
+        Waits for the outstanding jobs and shuts the worker processes down.
+        '''
+        try:
+            self.wait()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+            self.cleanup()
+
+    def terminate(self):
+        '''
+        Stops the worker processes without waiting for the outstanding jobs,
+        for when the analysis that submitted them has failed.
+        '''
+        self.results = []
+        try:
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool.join()
+                self.pool = None
+        finally:
+            self.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+        return False
+
+###############################################################################
+# end of thesiscode/scripts/render_pool.py
+###############################################################################
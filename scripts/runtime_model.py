@@ -0,0 +1,528 @@
+###############################################################################
+# File  : thesiscode/scripts/runtime_model.py
+# Author: madicken
+# Date  : Wed Oct 21 15:02:11 2026
+#
+# runtime_model estimates how long the advantg and MCNP runs of a study
+# point take from the runs that have already finished, so that the
+# submission scripts (submission.py) can be packed and given a walltime.
+#    -- read_input_parameters reads the study variables (quadrature, quad
+#    and Pn order, blocks, cross section library) and the mesh size of an
+#    advantg input.
+#    -- read_run reads the parameters of a finished run, its cores, the
+#    wall seconds of its deterministic run (every phase of timing.json) and
+#    the computer time and particle histories of its MCNP run.
+#    -- RuntimeEstimator fits, for each stage, the power law
+#        log T = c0 + c1 log(cells) + c2 log(cores) + c3 log(quad order)
+#                + c4 log(groups) + c5 log(pn order + 1) + quadrature
+#    where the quadrature type (and the library, if its groups can not be
+#    read from its name) adds a constant per type. Features that do not vary
+#    in the training runs are left out. It is saved as processed data, gives
+#    estimate(point) in seconds, and reports its error on held out runs.
+#
+# The MCNP stage leaves out the cores, which are those of the deterministic
+# run, and adds c6 log(nps), the particle histories run. The nps of a point
+# is its 'nps', or that of the nps card of the MCNP input named by the
+# mcnp_input variable of the advantg input. Runs stopped by a ctme card
+# still have the histories they ran, but a point with only a ctme has no
+# nps and is estimated at the mean nps of the training runs.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import pandas as pd
+import multiprocessing
+import logging
+import ast
+import glob
+import os
+import re
+from analysis_utils import get_num_cores
+from instrumentation import stage
+###############################################################################
+
+stages = ['advantg', 'mcnp']
+
+# numeric features of the model, in the order they are kept when there are
+# fewer runs than features, and the features of each stage.
+features = ['cells', 'cores', 'quad order', 'groups', 'pn order', 'nps']
+stage_features = {'advantg' : [feature for feature in features if feature
+                      != 'nps'],
+                  'mcnp' : ['nps'] + [feature for feature in features if
+                      feature not in ('cores', 'nps')]}
+
+# advantg input variables that enter the model as a constant per value.
+categories = ['denovo_quadrature', 'anisn_library']
+
+# seconds in the time units of an MCNP output.
+mcnp_units = {'seconds' : 1, 'minutes' : 60, 'hours' : 3600}
+
+variable_pattern = re.compile(
+        r'"(\w+)"\s*:\s*("[^"]*"|\[[^\]]*\]|[-+.\w]+)')
+
+# the particle histories in an MCNP output (on the tally and dump lines),
+# and the nps card of an MCNP input.
+histories_pattern = re.compile(r'\bnps\s*=\s*(\d+)')
+nps_card_pattern = re.compile(r'^\s*nps\s+([-+.\deE]+)',
+        re.IGNORECASE | re.MULTILINE)
+
+def read_input_parameters(inputfile):
+    '''
+    Returns a dict of the "variable" : value entries of an advantg input,
+    with 'cells', the number of cells of its mesh (the product over the
+    axes of the sum of its mesh_x/y/z_ints), if it has one.
+    '''
+    with open(inputfile) as fp:
+        text = fp.read()
+    parameters = {}
+    for name, value in variable_pattern.findall(text):
+        try:
+            parameters[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            parameters[name] = value
+
+    cells = 1
+    for axis in ['x', 'y', 'z']:
+        ints = parameters.get('mesh_%s_ints' %(axis))
+        planes = parameters.get('mesh_%s' %(axis))
+        if isinstance(ints, list) and ints:
+            cells *= sum(ints)
+        elif isinstance(planes, list) and len(planes) > 1:
+            cells *= len(planes) - 1
+        else:
+            cells = None
+            break
+    if cells:
+        parameters['cells'] = cells
+    return parameters
+
+def find_input(path):
+    '''
+    Returns the advantg input of the run in path, the first python file
+    with denovo_ variables, or None.
+    '''
+    for inputfile in sorted(glob.glob(os.path.join(path, '*.py'))):
+        with open(inputfile) as fp:
+            if '"denovo_' in fp.read():
+                return inputfile
+    return None
+
+def get_groups(library):
+    '''
+    Returns the number of neutron plus photon groups of a library named like
+    27n19g, or None.
+    '''
+    match = re.search(r'(\d+)n(\d+)g', str(library or ''))
+    if match is None:
+        return None
+    return int(match.group(1)) + int(match.group(2))
+
+def get_cores(parameters):
+    '''
+    Returns the cores of a run or point, given as 'cores' or the product of
+    its denovo_x/y/z_blocks (1 where not set).
+    '''
+    if parameters.get('cores'):
+        return parameters['cores']
+    cores = 1
+    for axis in ['x', 'y', 'z']:
+        cores *= int(parameters.get('denovo_%s_blocks' %(axis)) or 1)
+    return cores
+
+def get_feature_values(parameters):
+    '''
+    Returns a dict of the numeric features of a run or study point from its
+    parameters (advantg input variables, 'cells', 'cores' and 'nps'), NaN
+    where they are not known.
+    '''
+    pn_order = parameters.get('denovo_pn_order')
+    values = {'cells' : parameters.get('cells'),
+              'cores' : get_cores(parameters),
+              'quad order' : parameters.get('denovo_quad_order'),
+              'groups' : get_groups(parameters.get('anisn_library')),
+              'pn order' : None if pn_order is None else pn_order + 1,
+              'nps' : parameters.get('nps')}
+    return dict((feature, np.nan if value is None else float(value)) for
+            feature, value in values.items())
+
+def read_mcnp_seconds(outputpath):
+    '''
+    Returns the computer time of an MCNP output in seconds, or None if the
+    run has not finished.
+    '''
+    from mcnpoutput import TrackLengthTally
+
+    try:
+        total = TrackLengthTally(outputpath).get_timing_data()['total_time']
+    except (IOError, IndexError, ValueError, UnboundLocalError):
+        # an unfinished run has no computer time line
+        return None
+    return total['time']*mcnp_units.get(total['units'], 1)
+
+def read_mcnp_histories(outputpath):
+    '''
+    Returns the particle histories an MCNP output ran, the last nps it
+    prints, or None if it prints none.
+    '''
+    histories = None
+    with open(outputpath) as fp:
+        for line in fp:
+            if 'nps' in line:
+                found = histories_pattern.findall(line)
+                if found:
+                    histories = int(found[-1])
+    return histories
+
+def read_nps_card(inputfile):
+    '''
+    Returns the histories of the nps card of an MCNP input, or None if it
+    has none (such as an input stopped by a ctme card).
+    '''
+    with open(inputfile) as fp:
+        found = nps_card_pattern.findall(fp.read())
+    if not found:
+        return None
+    try:
+        return int(float(found[-1]))
+    except ValueError:
+        return None
+
+def read_run(path):
+    '''
+    Reads a finished run. Returns a dict with its path, problem, study
+    variables, features and the seconds of each stage (NaN for a stage it
+    did not run), or None if it has neither timing.json nor an MCNP output.
+    '''
+    from timing_analytics import read_timing, phases
+
+    parameters = {}
+    problem = os.path.basename(os.path.normpath(path))
+    inputfile = find_input(path)
+    if inputfile is not None:
+        parameters = read_input_parameters(inputfile)
+        problem = os.path.splitext(os.path.basename(inputfile))[0]
+    for adj_dir in ['adj_solution', 'fwcadis_adj_solution']:
+        omnibus = os.path.join(path, adj_dir, 'omnibus.pp.json')
+        if os.path.isfile(omnibus):
+            parameters['cores'] = get_num_cores(omnibus)
+            break
+
+    times = {'advantg' : np.nan, 'mcnp' : np.nan}
+    if os.path.isfile(path+'/timing.json'):
+        timing = read_timing(path)
+        if timing is not None:
+            times['advantg'] = sum(timing[phase] for phase in phases)
+    if os.path.isfile(path+'/mcnp/out'):
+        seconds = read_mcnp_seconds(path+'/mcnp/out')
+        if seconds is not None:
+            times['mcnp'] = seconds
+            parameters['nps'] = read_mcnp_histories(path+'/mcnp/out')
+    if np.isnan(times['advantg']) and np.isnan(times['mcnp']):
+        return None
+
+    data = {'path' : path, 'problem' : problem}
+    data.update(get_feature_values(parameters))
+    for category in categories:
+        data[category] = parameters.get(category)
+    data.update(times)
+    return data
+
+def find_runs(root):
+    '''
+    Returns the sorted list of directories under root with a timing.json
+    file or an MCNP output. Directories inside a run are not searched.
+    '''
+    root = os.path.abspath(os.path.expanduser(root))
+    runs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if 'timing.json' in filenames or \
+                os.path.isfile(dirpath+'/mcnp/out'):
+            runs.append(dirpath)
+            dirnames[:] = []
+    return runs
+
+def get_design(frame, model):
+    '''
+    Returns the (runs, terms) design matrix of a fitted model for a frame of
+    runs or points. Unknown features are set to their training mean and
+    unknown categories to the first one.
+    '''
+    columns = [np.ones(len(frame))]
+    for feature, fill in zip(model['features'], model['fill']):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.log(frame[feature].values.astype(float))
+        columns.append(np.where(np.isfinite(values), values, fill))
+    for category in sorted(model['levels']):
+        values = frame[category].values
+        for level in model['levels'][category][1:]:
+            columns.append((values == level).astype(float))
+    return np.column_stack(columns)
+
+def get_finished(frame, stage):
+    '''
+    Returns the runs of frame that ran stage, those with a time.
+    '''
+    times = frame[stage].values.astype(float)
+    with np.errstate(invalid='ignore'):
+        return frame[np.isfinite(times) & (times > 0)]
+
+def fit_model(frame, stage):
+    '''
+    Fits the model of a stage to the runs of frame that ran it. Returns a
+    dict of the features, the levels of each category, the coefficients,
+    the training means of the features (logs), the number of runs and the
+    rms error of the fit in log space, or None if no run ran the stage.
+    '''
+    logger = logging.getLogger("analysis.runtime")
+
+    frame = get_finished(frame, stage)
+    if not len(frame):
+        return None
+    times = np.log(frame[stage].values.astype(float))
+
+    used = []
+    fill = []
+    for feature in stage_features[stage]:
+        values = frame[feature].values.astype(float)
+        if not (np.isfinite(values).all() and (values > 0).all()):
+            logger.debug("%s is not known for every %s run, left out"
+                    %(feature, stage))
+            continue
+        if np.ptp(np.log(values)) > 0:
+            used.append(feature)
+            fill.append(float(np.log(values).mean()))
+    levels = {}
+    for category in categories:
+        if category == 'anisn_library' and 'groups' in used:
+            continue
+        values = sorted(set(str(value) for value in frame[category] if
+            value is not None))
+        if len(values) > 1:
+            levels[category] = values
+
+    # no more terms than runs
+    terms = 1 + len(used) + sum(len(values) - 1 for values in
+            levels.values())
+    while terms > len(frame) and used:
+        used.pop()
+        fill.pop()
+        terms -= 1
+    while terms > len(frame) and levels:
+        dropped = sorted(levels)[-1]
+        terms -= len(levels.pop(dropped)) - 1
+
+    model = {'features' : used, 'levels' : levels, 'fill' : np.array(fill),
+            'runs' : len(frame)}
+    design = get_design(frame, model)
+    model['coefficients'] = np.linalg.lstsq(design, times, rcond=None)[0]
+    model['rms log error'] = float(np.sqrt(np.mean((design.dot(
+        model['coefficients']) - times)**2)))
+    logger.info("%s model of %d runs on %s, rms log error %.3g" %(stage,
+        len(frame), ', '.join(used + sorted(levels)) or 'no features',
+        model['rms log error']))
+    return model
+
+class RuntimeEstimator(object):
+    def __init__(self, runs, models=None):
+        '''
+        Fits the runtime model of every stage to runs, a frame of finished
+        runs as from read_runs, unless the fitted models are given (as when
+        the estimator is loaded).
+        '''
+        self.runs = runs
+        if models is None:
+            models = dict((stage, fit_model(runs, stage)) for stage in stages)
+        self.models = models
+
+    @classmethod
+    def from_roots(cls, roots, processes=0):
+        '''
+        Trains the estimator on every finished run under the roots. With
+        processes other than 0 the runs are read on a pool of that many
+        processes (None for one per cpu).
+        '''
+        return cls(read_runs(roots, processes))
+
+    @classmethod
+    def load(cls, savepath):
+        '''
+        Loads an estimator saved by save.
+        '''
+        from processed_data import read_processed_data
+
+        data = read_processed_data(os.path.expanduser(savepath))
+        models = {}
+        for stage in stages:
+            model = data['models'].get(stage)
+            if model is not None:
+                model['runs'] = int(model['runs'])
+                model['rms log error'] = float(model['rms log error'])
+            models[stage] = model
+        return cls(data['runs'], models)
+
+    def save(self, savepath):
+        '''
+        Saves the training runs and the fitted models as processed data.
+        '''
+        from processed_data import write_processed_data
+
+        logger = logging.getLogger("analysis.runtime")
+
+        savepath = os.path.expanduser(savepath)
+        if os.path.dirname(savepath) and \
+                not os.path.isdir(os.path.dirname(savepath)):
+            os.makedirs(os.path.dirname(savepath))
+        write_processed_data(savepath, {'runs' : self.runs,
+            'models' : self.models}, kind='runtime model')
+        logger.info("runtime model saved to %s" %(savepath))
+        return savepath
+
+    def get_model(self, stage):
+        '''
+        Returns the fitted model of stage. Raises ValueError if there is
+        none.
+        '''
+        if stage not in stages:
+            raise ValueError('%s is not a stage (they are %s)' %(stage,
+                ', '.join(stages)))
+        if self.models.get(stage) is None:
+            raise ValueError('no finished %s runs to estimate from' %(stage))
+        return self.models[stage]
+
+    def estimate(self, point, stage='advantg'):
+        '''
+        Returns the estimated seconds of a stage for a point, a dict of
+        advantg input variables (as a StudyMaker point, or the parameters of
+        a whole input) with 'cells', 'cores' and 'nps' if they are known.
+        '''
+        model = self.get_model(stage)
+        row = get_feature_values(point)
+        for category in categories:
+            value = point.get(category)
+            row[category] = None if value is None else str(value)
+        frame = pd.DataFrame([row])
+        return float(np.exp(get_design(frame, model).dot(
+            model['coefficients'])[0]))
+
+    def get_estimate(self, stage='advantg', input_file=None):
+        '''
+        Returns a function of a StudyMaker point giving its estimated
+        seconds, for submission.py. The variables the point does not set,
+        and the mesh, are taken from the advantg input_file of the study,
+        and the nps from the MCNP input it names.
+        '''
+        self.get_model(stage)
+        defaults = {}
+        if input_file is not None:
+            defaults = read_input_parameters(input_file)
+            mcnp_input = defaults.get('mcnp_input')
+            if 'nps' not in defaults and isinstance(mcnp_input, str):
+                mcnp_input = os.path.join(os.path.dirname(input_file),
+                        mcnp_input)
+                if os.path.isfile(mcnp_input):
+                    defaults['nps'] = read_nps_card(mcnp_input)
+
+        def estimate(point):
+            parameters = dict(defaults)
+            parameters.update(point)
+            return self.estimate(parameters, stage)
+        return estimate
+
+    def get_coefficients(self):
+        '''
+        Returns a frame of the fitted coefficients of every stage (the
+        exponent of each feature, the log factor of each category level),
+        with the number of runs and the rms log error of the fit.
+        '''
+        rows = []
+        columns = ['intercept'] + features
+        for stage in stages:
+            model = self.models.get(stage)
+            if model is None:
+                continue
+            names = ['intercept'] + list(model['features'])
+            for category in sorted(model['levels']):
+                levels = ['%s=%s' %(category, level) for level in
+                        model['levels'][category][1:]]
+                names.extend(levels)
+                columns.extend(level for level in levels if level not in
+                        columns)
+            row = dict(zip(names, model['coefficients']))
+            row.update({'stage' : stage, 'runs' : model['runs'],
+                'rms log error' : model['rms log error']})
+            rows.append(row)
+        columns += ['runs', 'rms log error']
+        if not rows:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame(rows).set_index('stage').reindex(columns=columns)
+
+    def accuracy_report(self, holdout=0.25, seed=0):
+        '''
+        Refits the model of each stage without a held out fraction of its
+        runs (chosen at random with seed) and returns a frame of the error
+        of the estimates of the held out runs: the median and largest
+        absolute relative error and the rms error in log space, NaN for a
+        stage with fewer than three runs.
+        '''
+        random = np.random.RandomState(seed)
+        rows = []
+        for stage in stages:
+            ran = get_finished(self.runs, stage)
+            tested = 0
+            if len(ran) >= 3:
+                tested = min(max(int(round(holdout*len(ran))), 1),
+                        len(ran) - 2)
+            row = {'train runs' : len(ran) - tested, 'test runs' : tested,
+                    'median error' : np.nan, 'max error' : np.nan,
+                    'rms log error' : np.nan}
+            if tested:
+                order = random.permutation(len(ran))
+                test = ran.iloc[order[:tested]]
+                model = fit_model(ran.iloc[order[tested:]], stage)
+                predicted = np.exp(get_design(test, model).dot(
+                    model['coefficients']))
+                actual = test[stage].values.astype(float)
+                errors = np.abs(predicted/actual - 1)
+                row.update({'median error' : float(np.median(errors)),
+                    'max error' : float(errors.max()),
+                    'rms log error' : float(np.sqrt(np.mean(np.log(
+                        predicted/actual)**2)))})
+            rows.append(row)
+        return pd.DataFrame(rows, index=pd.Index(stages, name='stage'))[[
+            'train runs', 'test runs', 'median error', 'max error',
+            'rms log error']]
+
+def read_runs(roots, processes=0):
+    '''
+    Returns a frame of every finished run under the roots, indexed by path,
+    with its problem, features, categories and the seconds of each stage.
+    '''
+    logger = logging.getLogger("analysis.runtime")
+
+    paths = []
+    for root in roots:
+        paths.extend(find_runs(root))
+    logger.info("reading %d runs" %(len(paths)))
+    with stage('read runtimes', 'read', runs=len(paths)):
+        if processes == 0 or len(paths) < 2:
+            results = [read_run(path) for path in paths]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(read_run, paths)
+            finally:
+                pool.close()
+                pool.join()
+
+    columns = ['problem'] + features + categories + stages
+    results = [data for data in results if data is not None]
+    if not results:
+        return pd.DataFrame(columns=columns)
+    frame = pd.DataFrame(results, index=pd.Index([data['path'] for data in
+        results], name='run'))
+    return frame[columns]
+
+###############################################################################
+# end of thesiscode/scripts/runtime_model.py
+###############################################################################
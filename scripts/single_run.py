@@ -8,22 +8,38 @@
 from __future__ import (division, absolute_import, print_function, )
 #-----------------------------------------------------------------------------#
 import numpy as np
-from analysis import MCNPOutput, FOMAnalysis, H5Output
-from plotting_utils import ( violinbyenergy, stripbyenergy, boxbyenergy,
-                           stripbymetric, violinbymetric,
-                           boxbymetric, names, energy_histogram, styles )
+from analysis import MCNPOutput, FOMAnalysis, H5Output, precision
+from plotting_utils import styles
+from render_pool import RenderPool, render_job
+from memory_plan import MemoryPlan
+from statistics_store import StatisticsStore
+from processed_data import (write_processed_data, read_processed_data,
+        schema_version)
+from instrumentation import (stage, enable_tracing, disable_tracing,
+        write_trace)
 from analysis_utils import (get_paths, verify_input_flags, format_logger,
-        metric_names, group_names, xscales, get_method_type, selection_names)
+        metric_names, group_names, xscales, get_method_type, selection_names,
+        Prefetcher, get_fingerprints, TaskGraph, dependencies, Provenance,
+        optional_dependencies)
 import json
 import pickle
 import os
 import logging
+import threading
 ###############################################################################
 
 class Single_Run(object):
 
     def __init__(self, base_directory_path, method_type='',
-        logfile_name='analysis.log'):
+        logfile_name='analysis.log', dtype=None, memory_budget=None):
+        '''
+        dtype sets the precision of the anisotropy data read for this run
+        (np.float32 or np.float64). If not given, the H5Output precision
+        policy in analysis.py is used.
+
+        memory_budget (bytes, or a string such as '4G') limits the memory
+        the analysis of this run may use, see do_single_analysis.
+        '''
 
         if method_type:
             method_name=method_type
@@ -52,11 +68,25 @@ class Single_Run(object):
         self.filenames = None
         self.input_flags = None
         self.datanames = None
+        self.dtype = dtype
+        self.memory_budget = memory_budget
+        self.memory_plan = None
 
         # set dataobjects
         self.foms = None
         self.MCNP_data = None
         self.anisotropy_data = None
+        self.statistics_store = None
+        self.frames = None
+        self.task_timings = None
+        self.render_pool = None
+
+        # provenance of the outputs
+        self.provenance = None
+        self.outputs = {}
+        self.artifacts = {}
+        self.current_output = threading.local()
+        self.stale_outputs = None
 
         pass
 
@@ -70,11 +100,56 @@ class Single_Run(object):
             save_FoM_data=False, save_tally_data=False,
             plot_anisotropy_with_tallydata=False,
             plot_anisotropies_median=False, plot_anisotropies_mean=False,
-            save_data_json=False, select_anisotropies='full'):
+            save_data_json=False, select_anisotropies='full',
+            prefetch_depth=0, reuse_processed=False, max_workers=1,
+            render_processes=0, incremental=True, dry_run=False, trace=False,
+            memory_budget=None):
         ''' This is the driver script to generate analysis data for a single run.
         The user can choose whether to overwrite previous data, which metrics to
         plot, and where to save that data. By default it will be saved in an
-        /analysis/ folder inside the run directory for the hybrid run. '''
+        /analysis/ folder inside the run directory for the hybrid run.
+
+        If prefetch_depth is larger than zero, the anisotropy data for the
+        next prefetch_depth metrics (or groups) is read on a background
+        thread while the current one is plotted. The overlap achieved is
+        written to the log.
+
+        If reuse_processed is True, the processed_data.pkl and
+        processed_data.json files from a previous analysis with
+        save_data_json=True are loaded, and any piece whose input files have
+        not changed since is reused instead of recomputed (see
+        load_processed_data).
+
+        The requested analyses are run as a task graph (see
+        build_task_graph). With max_workers larger than one, independent
+        tasks such as the statistics for different cutoffs run concurrently.
+        The time taken by each task is written to the log and kept in
+        task_timings.
+
+        If render_processes is not zero, the plotting_utils figures are
+        rendered on a RenderPool of that many worker processes (None for one
+        per cpu) while the analysis carries on. The FOM convergence plot is
+        still drawn in this process.
+
+        The inputs and parameters of every output are recorded in
+        provenance.json in the analysis directory. If incremental is True,
+        outputs whose recorded inputs, parameters and artifacts are all
+        still current are skipped and only the stale ones are rebuilt. With
+        dry_run=True nothing is run: the outputs that would be rebuilt are
+        logged and returned as a dict of output name : reason.
+
+        If trace is True, the wall time, cpu time, bytes read, RSS and peak
+        RSS of every reader, statistic, plot and task are recorded and
+        written to trace.json in the analysis directory, in the Chrome trace
+        event format (see instrumentation.py).
+
+        memory_budget (bytes, or a string such as '4G') overrides the budget
+        given to Single_Run. With a budget, a MemoryPlan chooses the
+        precision, chunk sizes, sampling of the plotted data, prefetch depth
+        and number of workers so the process stays under it, and filter
+        matrices are not kept between reads. If a requested output can not
+        be made within the budget, MemoryError is raised with an estimate
+        before any data is read. '''
 
         logger=logging.getLogger("analysis.single_run")
         logger.info("acquiring files and directories in directory %s"
@@ -125,322 +200,846 @@ class Single_Run(object):
         input_flags = verify_input_flags(input_flags, filenames, directories)
         self.input_flags = input_flags
 
-        if input_flags['strip_for_metric'] == True or \
-        input_flags['violins_for_metric'] == True or \
-        input_flags['boxes_for_metric'] == True or \
-        input_flags['strip_for_energy'] == True or \
-        input_flags['violins_for_energy'] == True or \
-        input_flags['boxes_for_energy'] == True or \
-        input_flags['plot_anisotropy_correlations'] == True or \
-        input_flags['plot_anisotropy_corrs_median'] == True or \
-        input_flags['plot_anisotropy_corrs_mean'] == True:
-            anisotropy_file = H5Output(filenames['anisotropy_file'])
-            datanames = anisotropy_file.get_datanames()
-            self.datanames=datanames
-
         analysis_dir = directories['analysis_directory']
 
-        if input_flags['strip_for_metric'] == True or \
-        input_flags['violins_for_metric'] == True or \
-        input_flags['boxes_for_metric'] == True:
-            logger.info("Starting plotting routines for single metric, all"
-                    + " energy groups")
+        if memory_budget is None:
+            memory_budget = self.memory_budget
+        if memory_budget is not None:
+            plan = self.plan_memory(memory_budget, input_flags,
+                    prefetch_depth, max_workers, render_processes)
+            prefetch_depth = plan.prefetch_depth
+            max_workers = plan.max_workers
+            render_processes = plan.render_processes
+        else:
+            self.memory_plan = None
 
-            metrics = datanames['metric_names']
-            if 'contributon_flux' in metrics:
-                metrics.remove('contributon_flux')
-            for metric in metrics:
-                groupdata =  anisotropy_file.get_data_by_metric(metric,
-                        cutoff=input_flags['select_anisotropies'])
-                subdata = anisotropy_file.get_dataset_by_metric(metric,
-                        num_samples = 1500,
-                        cutoff=input_flags['select_anisotropies'])
+        if trace == True and dry_run != True:
+            enable_tracing()
+            try:
+                with stage('do_single_analysis', 'analysis',
+                        run=self.base_directory_path):
+                    result = self.run_analysis(input_flags, analysis_dir,
+                            tally_number, prefetch_depth, reuse_processed,
+                            max_workers, render_processes, incremental,
+                            dry_run)
+                write_trace(analysis_dir+'/trace.json')
+            finally:
+                disable_tracing()
+            return result
 
-                # get the data for labelling the plot
-                if metric in metric_names:
-                    name = metric_names[metric]
-                else:
-                    name = metric
-                select = input_flags['select_anisotropies']
-                if select in selection_names:
-                    selection = selection_names[select]
-                else:
-                    selection = select
-                full_title = '%s Distribution, by Energy Group, %s' %(name,
-                        selection)
-
-                if input_flags['violins_for_metric'] == True:
-                    logger.info("plotting violins for all energies, %s" %(name))
-                    violinbyenergy(data=groupdata['data'],
-                                   plot_title=full_title,
-                                   x_title='Energy Group No.',
-                                   y_title='Relative Metric Distribution',
-                                   savepath=analysis_dir+'/%s_violin_%s.pdf'
-                                             %(metric, select),
-                                   log_scale=True)
-
-                if input_flags['boxes_for_metric'] == True:
-                    logger.info("plotting boxes for all energies, %s" %(name))
-                    boxbyenergy(data=groupdata['data'],
-                                   plot_title=full_title,
-                                   x_title='Energy Group No.',
-                                   y_title='Relative Metric Distribution',
-                                   savepath=analysis_dir+'/%s_box_%s.pdf'
-                                             %(metric, select),
-                                   log_scale=True)
-
-                if input_flags['strip_for_metric'] == True:
-                    logger.info("plotting strips for all energies, %s" %(name))
-                    stripbyenergy(data=subdata['data'],
-                                   plot_title=full_title,
-                                   x_title='Energy Group No.',
-                                   y_title='Relative Metric Distribution',
-                                   savepath=analysis_dir+'/%s_strip_%s.pdf'
-                                             %(metric, select),
-                                   log_scale=True)
-
-
-        if input_flags['strip_for_energy'] == True or \
-        input_flags['violins_for_energy'] == True or \
-        input_flags['boxes_for_energy'] == True:
-            logger.info("Starting plotting routines for monoenergic plots, all"
-                    + " metric types")
-            groups = datanames['energy_groups']
-            for group in groups:
-                groupdata =  anisotropy_file.get_data_by_energy(group,
-                        cutoff=input_flags['select_anisotropies'])
-                subdata = anisotropy_file.get_dataset_by_energy(group,
-                        num_samples = 1500,
-                        cutoff=input_flags['select_anisotropies'])
+        return self.run_analysis(input_flags, analysis_dir, tally_number,
+                prefetch_depth, reuse_processed, max_workers,
+                render_processes, incremental, dry_run)
 
-                # get the information to label the plots
-                if group in group_names:
-                    name = group_names[group]
-                else:
-                    name = group
-                select = input_flags['select_anisotropies']
-                if select in selection_names:
-                    selection = selection_names[select]
+    def run_analysis(self, input_flags, analysis_dir, tally_number='44',
+            prefetch_depth=0, reuse_processed=False, max_workers=1,
+            render_processes=0, incremental=True, dry_run=False):
+        '''
+        Runs the analyses requested in input_flags. Called by
+        do_single_analysis once the files and input flags are set, with the
+        same keyword arguments.
+        '''
+        logger=logging.getLogger("analysis.single_run")
+
+        reused = {}
+        if reuse_processed == True and dry_run != True:
+            reused = self.load_processed_data(analysis_dir, tally_number)
+        self.anisotropy_data = reused.get('anisotropy', {})
+        self.statistics_store = StatisticsStore(
+                analysis_dir+'/anisotropy_statistics.h5')
+
+        graph = self.build_task_graph(input_flags, tally_number=tally_number,
+                reused=reused, prefetch_depth=prefetch_depth)
+
+        self.provenance = Provenance(analysis_dir+'/provenance.json')
+        stale = self.get_stale_outputs(incremental=incremental)
+        self.stale_outputs = stale
+        if dry_run == True:
+            for name in self.outputs:
+                if name in stale:
+                    logger.info("would rebuild %s: %s" %(name, stale[name]))
                 else:
-                    selection = select
-                full_title = '%s Distribution, by Metric, %s' %(name,
-                        selection)
-
-                if input_flags['strip_for_energy'] == True:
-                    logger.info("plotting stripplots for all metrics, %s"
-                            %(name))
-                    stripbymetric(data=subdata['data'],
-                                   plot_title=full_title,
-                                   x_title='Metric Type',
-                                   x_names=groupdata['names'],
-                                   y_title='Relative Metric Distribution Density',
-                                   savepath=analysis_dir+'/%s_strip_%s.pdf'
-                                             %(group, select),
-                                   log_scale=True)
-
-                if input_flags['violins_for_energy'] == True:
-                    logger.info("plotting violinplots for all metrics, %s"
-                            %(group))
-                    violinbymetric(data=groupdata['data'],
-                                   plot_title=full_title,
-                                   x_title='Metric Type',
-                                   x_names=groupdata['names'],
-                                   y_title='Relative Metric Distribution',
-                                   savepath=analysis_dir+'/%s_violin_%s.pdf'
-                                             %(group, select),
-                                   log_scale=True)
-
-                if input_flags['boxes_for_energy'] == True:
-                    logger.info("plotting boxplots for all metrics, %s" %(name))
-                    boxbymetric(data=groupdata['data'],
-                                   plot_title=full_title,
-                                   x_title='Metric Type',
-                                   x_names=groupdata['names'],
-                                   y_title='Box of Metric Distribution',
-                                   savepath=analysis_dir+'/%s_boxes_%s.pdf'
-                                             %(group, select),
-                                   log_scale=True)
+                    logger.info("%s is up to date" %(name))
+            return stale
+
+        # the monte carlo data is always read, other Single_Run users need
+        # it even when every output is current.
+        graph.prune(list(stale) + ['mcnp_output_file'])
+
+        # the pool is started before the task graph so that its worker
+        # processes are forked before any task threads exist.
+        try:
+            with RenderPool(processes=render_processes) as self.render_pool:
+                graph.run(max_workers=max_workers)
+                self.task_timings = graph.timings
+        finally:
+            self.render_pool = None
+
+        # only written once every figure has been rendered
+        self.provenance.save()
+
+        return
+
+    def build_task_graph(self, input_flags, tally_number='44', reused={},
+            prefetch_depth=0):
+        '''
+        Builds the task graph for the analyses requested in input_flags. The
+        input files each flag depends on (the dependencies table in
+        analysis_utils) map to shared intermediate tasks: opening the
+        anisotropy file, and parsing the MCNP output into a FOMAnalysis. The
+        anisotropy statistics for each cutoff are also shared intermediates.
+        Every output (plot or saved table) is a task that requires the
+        intermediates it reads. The input files (including the
+        optional_dependencies it reads) and parameters of each output are
+        kept in self.outputs for its provenance record.
+        '''
+        logger=logging.getLogger("analysis.single_run")
+
+        graph = TaskGraph(name='single run')
+        filenames = self.filenames
+        directories = self.directories
+        self.outputs = {}
+
+        # intermediate tasks that read the input files.
+        file_tasks = {'anisotropy_file' : 'anisotropy_file',
+                      'mcnp_output_file' : 'mcnp_output_file',
+                      'timing_file' : 'mcnp_output_file'}
+
+        def requires(flag, *extra):
+            tasks = []
+            for filename in dependencies[flag]:
+                if file_tasks[filename] not in tasks:
+                    tasks.append(file_tasks[filename])
+            return tasks + list(extra)
+
+        def add_output(name, function, flags, parameters={}, extra=(),
+                inputs=None, tasks=None, exclusive=False):
+            if inputs is None:
+                inputs = []
+                for flag in flags:
+                    inputs.extend(filenames[filename] for filename in
+                            dependencies[flag] +
+                            optional_dependencies.get(flag, []) if
+                            filenames[filename])
+            parameters = dict(parameters, tally_number=tally_number,
+                    method_type=self.method_type,
+                    flags=dict((flag, input_flags[flag]) for flag in flags))
+            self.outputs[name] = (sorted(set(inputs)), parameters)
+            if tasks is None:
+                tasks = requires(flags[0], *extra)
+            graph.add_task(name, lambda: self.build_output(name, function),
+                    requires=tasks, exclusive=exclusive)
+
+        anisotropy_flags = [flag for flag in dependencies if
+                'anisotropy_file' in dependencies[flag] and
+                input_flags.get(flag) == True]
+        if anisotropy_flags:
+            graph.add_task('anisotropy_file', self.open_anisotropy_file)
 
         if filenames['mcnp_output_file'] is not None:
-            if filenames['timing_file'] is not None:
-                logger.debug("Calculating FOMs for Monte Carlo and adjusted"
-                        + " deterministic runtimes." )
-                FOM_init = FOMAnalysis(filenames['mcnp_output_file'], tally_number,
-                        deterministic_timing_file=filenames['timing_file'],
-                        omnibus_output_file=filenames['omni_out_file'])
-            else:
-                logger.debug("No timing file found. Calculating FOMs for"
-                        + " standard Monte Carlo without deterministic "
-                        + "timing adjustments")
-                FOM_init = FOMAnalysis(filenames['mcnp_output_file'],
-                        tally_number)
-
-            all_foms = FOM_init.calculate_all_foms()
-            MCNP_data = FOM_init.mc_data
-
-            self.foms = all_foms
-            self.MCNP_data = MCNP_data
-            self.frames = {'fom_frame': FOM_init.fom_frame,
-                           'tally_frame': FOM_init.tally_frame,
-                           'timing_frame': FOM_init.timing_frame}
+            # the FOMAnalysis object itself is needed for these outputs, so
+            # the monte carlo data is only reused when none of them are
+            # requested.
+            needs_fom_object = input_flags['fom_convergence'] == True or \
+                    input_flags['save_fom_data'] == True or \
+                    input_flags['save_tally_data'] == True
+            graph.add_task('mcnp_output_file',
+                    lambda: self.calculate_foms(tally_number, reused=reused,
+                        needs_fom_object=needs_fom_object))
         else:
             logger.warning("The MCNP output file was not found. Checked in"
                     + " %s. None of the analyses " %directories['mcnp_directory']
                     + "relevant to the Monte Carlo analysis can be performed.")
 
+        # plotting with pyplot is not thread safe, so all plotting tasks are
+        # exclusive. With a render pool they only submit the figures.
+        # plots made from sampled mesh cells are not the same outputs as
+        # plots of every cell.
+        select = {'select_anisotropies' : input_flags['select_anisotropies'],
+                  'sample_rows' : self.get_read_options()['sample_rows']}
+        metric_flags = ['violins_for_metric', 'boxes_for_metric',
+                'strip_for_metric']
+        if any(input_flags[flag] == True for flag in metric_flags):
+            add_output('metric_distributions',
+                    lambda: self.plot_metric_distributions(
+                        graph.get('anisotropy_file'), input_flags,
+                        prefetch_depth=prefetch_depth),
+                    metric_flags, select, exclusive=True)
+
+        energy_flags = ['violins_for_energy', 'boxes_for_energy',
+                'strip_for_energy']
+        if any(input_flags[flag] == True for flag in energy_flags):
+            add_output('energy_distributions',
+                    lambda: self.plot_energy_distributions(
+                        graph.get('anisotropy_file'), input_flags,
+                        prefetch_depth=prefetch_depth),
+                    energy_flags, select, exclusive=True)
 
         if input_flags['fom_convergence'] == True:
-            logger.info("plotting fom convergence for tally %s" %(tally_number))
-            imagename = 'fom_converge'
-            FOM_init.plot_fom_convergence(imagename)
+            add_output('fom_convergence',
+                    lambda: self.plot_fom_convergence(
+                        graph.get('mcnp_output_file'), tally_number),
+                    ['fom_convergence'], exclusive=True)
 
         if input_flags['relative_error_by_bin'] == True:
+            add_output('relative_error_by_bin',
+                    lambda: self.plot_tally_data('relative_error',
+                        tally_number),
+                    ['relative_error_by_bin'], exclusive=True)
+
+        if input_flags['tally_result'] == True:
+            add_output('tally_result',
+                    lambda: self.plot_tally_data('tallied_result',
+                        tally_number),
+                    ['tally_result'], exclusive=True)
+
+        if input_flags['save_fom_data'] == True:
+            add_output('save_fom_data',
+                    lambda: self.save_tally_tables(
+                        graph.get('mcnp_output_file'), tally_number,
+                        foms=True),
+                    ['save_fom_data'])
+
+        if input_flags['save_tally_data'] == True:
+            add_output('save_tally_data',
+                    lambda: self.save_tally_tables(
+                        graph.get('mcnp_output_file'), tally_number,
+                        convergence=True),
+                    ['save_tally_data'])
+
+        correlation_flags = [('full', 'plot_anisotropy_correlations'),
+                             ('median', 'plot_anisotropy_corrs_median'),
+                             ('mean', 'plot_anisotropy_corrs_mean')]
+        for cutoff, flag in correlation_flags:
+            if input_flags[flag] != True:
+                continue
+            # bind cutoff now, the lambdas are called after the loop ends.
+            graph.add_task('statistics_%s' %cutoff,
+                    lambda cutoff=cutoff: self.get_anisotropy_statistics(
+                        graph.get('anisotropy_file'), cutoff=cutoff),
+                    requires=['anisotropy_file'])
+            add_output('correlations_%s' %cutoff,
+                    lambda cutoff=cutoff: self.plot_anisotropy_correlations(
+                        graph.get('statistics_%s' %cutoff), cutoff=cutoff),
+                    [flag], {'cutoff' : cutoff},
+                    extra=['statistics_%s' %cutoff], exclusive=True)
+
+        if input_flags['save_all_data']==True:
+            # the processed data is made of the intermediates only.
+            analysis_dir = directories['analysis_directory']
+            intermediates = [name for name in graph.order if
+                    name not in self.outputs]
+            add_output('save_all_data',
+                    lambda: self.save_processed_data(analysis_dir,
+                        tally_number),
+                    ['save_all_data'], {'intermediates' : intermediates,
+                        'schema_version' : schema_version},
+                    inputs=[filename for filename in filenames.values() if
+                        filename and os.path.isfile(filename)],
+                    tasks=intermediates)
+
+        return graph
+
+    def get_stale_outputs(self, incremental=True):
+        '''
+        Checks each output in self.outputs against the provenance manifest.
+        Returns a dict of output name : reason for the outputs that have to
+        be rebuilt (all of them if incremental is False).
+        '''
+        logger=logging.getLogger("analysis.single_run.provenance")
+
+        stale = {}
+        for name in self.outputs:
+            inputs, parameters = self.outputs[name]
+            if incremental != True:
+                reason = 'incremental analysis is off'
+            else:
+                reason = self.provenance.check(name, inputs, parameters)
+            if reason is not None:
+                stale[name] = reason
+            else:
+                logger.info("skipping %s, its inputs are unchanged" %(name))
+        return stale
+
+    def build_output(self, name, function):
+        '''
+        Runs the function that builds the output name. The artifacts written
+        while it runs are collected with add_artifact and recorded in the
+        provenance manifest once it finishes.
+        '''
+        self.artifacts[name] = []
+        self.current_output.name = name
+        try:
+            result = function()
+        finally:
+            self.current_output.name = None
+        if self.provenance is not None:
+            inputs, parameters = self.outputs[name]
+            self.provenance.record(name, inputs, parameters,
+                    self.artifacts[name])
+        return result
+
+    def add_artifact(self, path):
+        '''
+        Adds path to the artifacts of the output being built on this thread.
+        '''
+        name = getattr(self.current_output, 'name', None)
+        if name is not None:
+            self.artifacts[name].append(os.path.abspath(path))
+
+    def plan_memory(self, memory_budget, input_flags, prefetch_depth=0,
+            max_workers=1, render_processes=0):
+        '''
+        Builds the MemoryPlan for the requested analyses from the shape of
+        the anisotropy file and keeps it in self.memory_plan. Raises
+        MemoryError if an output can not be made within memory_budget. If
+        plots are requested, the plan draws one small figure of each kind
+        first to measure the plotting libraries (see
+        memory_plan.warm_up_plotting).
+        '''
+        logger=logging.getLogger("analysis.single_run")
+
+        anisotropy_filename = self.filenames['anisotropy_file']
+        if anisotropy_filename is None:
+            cells, num_groups, num_metrics = 0, 0, 0
+        else:
+            anisotropy_file = H5Output(anisotropy_filename)
+            datanames = anisotropy_file.get_datanames()
+            metrics = [metric for metric in datanames['metric_names'] if
+                    metric != 'contributon_flux']
+            cells = int(np.prod(anisotropy_file.get_shape(metrics[0],
+                datanames['energy_groups'][0])))
+            num_groups = len(datanames['energy_groups'])
+            num_metrics = len(metrics)
+
+        dtype = self.dtype if self.dtype is not None else \
+                precision['dtype']
+        logger.info("planning the analysis for a memory budget of %s"
+                %(memory_budget))
+        plan = MemoryPlan(memory_budget, cells, num_groups, num_metrics,
+                dtype=dtype)
+        self.memory_plan = plan.plan(input_flags,
+                prefetch_depth=prefetch_depth, max_workers=max_workers,
+                render_processes=render_processes, warm_up=True)
+        return self.memory_plan
+
+    def open_anisotropy_file(self):
+        '''
+        Opens the anisotropy file of the run and reads the names of its
+        metrics and groups. Returns the H5Output object.
+        '''
+        if self.memory_plan is not None:
+            anisotropy_file = H5Output(self.filenames['anisotropy_file'],
+                    dtype=self.memory_plan.dtype,
+                    cache_filters=self.memory_plan.cache_filters)
+        else:
+            anisotropy_file = H5Output(self.filenames['anisotropy_file'],
+                    dtype=self.dtype)
+        self.datanames = anisotropy_file.get_datanames()
+        return anisotropy_file
+
+    def calculate_foms(self, tally_number='44', reused={},
+            needs_fom_object=False):
+        '''
+        Parses the MCNP output (and the timing files if they exist) and
+        calculates the FOMs of the run, unless processed data can be reused
+        and the FOMAnalysis object is not needed. Sets foms, MCNP_data and
+        frames. Returns the FOMAnalysis object, or None if data was reused.
+        '''
+        logger=logging.getLogger("analysis.single_run")
+        filenames = self.filenames
+
+        if 'mcnp' in reused and not needs_fom_object:
+            logger.info("reusing processed FOMs and MCNP data from %s"
+                    %(self.directories['analysis_directory']))
+            self.foms = reused['mcnp']['foms']
+            self.MCNP_data = reused['mcnp']['mcnp data']
+            self.frames = reused['mcnp']['frames']
+            return None
+
+        if filenames['timing_file'] is not None:
+            logger.debug("Calculating FOMs for Monte Carlo and adjusted"
+                    + " deterministic runtimes." )
+            FOM_init = FOMAnalysis(filenames['mcnp_output_file'], tally_number,
+                    deterministic_timing_file=filenames['timing_file'],
+                    omnibus_output_file=filenames['omni_out_file'])
+        else:
+            logger.debug("No timing file found. Calculating FOMs for"
+                    + " standard Monte Carlo without deterministic "
+                    + "timing adjustments")
+            FOM_init = FOMAnalysis(filenames['mcnp_output_file'],
+                    tally_number)
+
+        all_foms = FOM_init.calculate_all_foms()
+        MCNP_data = FOM_init.mc_data
+
+        self.foms = all_foms
+        self.MCNP_data = MCNP_data
+        self.frames = {'fom_frame': FOM_init.fom_frame,
+                       'tally_frame': FOM_init.tally_frame,
+                       'timing_frame': FOM_init.timing_frame}
+
+        return FOM_init
+
+    def plot_metric_distributions(self, anisotropy_file, input_flags,
+            prefetch_depth=0):
+        '''
+        Plots the violin, box and strip plots of each metric over all energy
+        groups, as requested in input_flags.
+        '''
+        logger=logging.getLogger("analysis.single_run")
+        analysis_dir = self.directories['analysis_directory']
+
+        logger.info("Starting plotting routines for single metric, all"
+                + " energy groups")
+
+        metrics = list(self.datanames['metric_names'])
+        if 'contributon_flux' in metrics:
+            metrics.remove('contributon_flux')
+
+        read_options = self.get_read_options()
+        full = input_flags['violins_for_metric'] == True or \
+                input_flags['boxes_for_metric'] == True
+
+        def load_metric(metric):
+            groupdata, subdata = None, None
+            if full:
+                groupdata =  anisotropy_file.get_data_by_metric(metric,
+                        cutoff=input_flags['select_anisotropies'],
+                        sample_rows=read_options['sample_rows'],
+                        chunk_size=read_options['chunk_size'])
+            if input_flags['strip_for_metric'] == True:
+                subdata = anisotropy_file.get_dataset_by_metric(metric,
+                        num_samples = 1500,
+                        cutoff=input_flags['select_anisotropies'],
+                        chunk_size=read_options['sample_chunk_size'])
+            return groupdata, subdata
+
+        metric_data = Prefetcher(metrics, load_metric,
+                depth=prefetch_depth, name='metric prefetch')
+        for metric, (groupdata, subdata) in metric_data:
+
+            # get the data for labelling the plot
+            if metric in metric_names:
+                name = metric_names[metric]
+            else:
+                name = metric
+            select = input_flags['select_anisotropies']
+            if select in selection_names:
+                selection = selection_names[select]
+            else:
+                selection = select
+            full_title = '%s Distribution, by Energy Group, %s' %(name,
+                    selection)
+
+            if input_flags['violins_for_metric'] == True:
+                logger.info("plotting violins for all energies, %s" %(name))
+                self.render('violinbyenergy', data=groupdata['data'],
+                        plot_title=full_title,
+                        x_title='Energy Group No.',
+                        y_title='Relative Metric Distribution',
+                        savepath=analysis_dir+'/%s_violin_%s.pdf'
+                                  %(metric, select),
+                        log_scale=True)
+
+            if input_flags['boxes_for_metric'] == True:
+                logger.info("plotting boxes for all energies, %s" %(name))
+                self.render('boxbyenergy', data=groupdata['data'],
+                        plot_title=full_title,
+                        x_title='Energy Group No.',
+                        y_title='Relative Metric Distribution',
+                        savepath=analysis_dir+'/%s_box_%s.pdf'
+                                  %(metric, select),
+                        log_scale=True)
+
+            if input_flags['strip_for_metric'] == True:
+                logger.info("plotting strips for all energies, %s" %(name))
+                self.render('stripbyenergy', data=subdata['data'],
+                        plot_title=full_title,
+                        x_title='Energy Group No.',
+                        y_title='Relative Metric Distribution',
+                        savepath=analysis_dir+'/%s_strip_%s.pdf'
+                                  %(metric, select),
+                        log_scale=True)
+
+            # free the data before the next metric is read
+            del groupdata, subdata
+
+        metric_data.log_overlap(logger)
+
+    def plot_energy_distributions(self, anisotropy_file, input_flags,
+            prefetch_depth=0):
+        '''
+        Plots the violin, box and strip plots of all metrics for each energy
+        group, as requested in input_flags.
+        '''
+        logger=logging.getLogger("analysis.single_run")
+        analysis_dir = self.directories['analysis_directory']
+
+        logger.info("Starting plotting routines for monoenergic plots, all"
+                + " metric types")
+        groups = self.datanames['energy_groups']
+
+        read_options = self.get_read_options()
+        full = input_flags['violins_for_energy'] == True or \
+                input_flags['boxes_for_energy'] == True
+
+        def load_group(group):
+            groupdata, subdata = None, None
+            if full:
+                groupdata =  anisotropy_file.get_data_by_energy(group,
+                        cutoff=input_flags['select_anisotropies'],
+                        sample_rows=read_options['sample_rows'],
+                        chunk_size=read_options['chunk_size'])
+            if input_flags['strip_for_energy'] == True:
+                subdata = anisotropy_file.get_dataset_by_energy(group,
+                        num_samples = 1500,
+                        cutoff=input_flags['select_anisotropies'],
+                        chunk_size=read_options['sample_chunk_size'])
+            return groupdata, subdata
+
+        group_data = Prefetcher(groups, load_group, depth=prefetch_depth,
+                name='group prefetch')
+        for group, (groupdata, subdata) in group_data:
+
+            # get the information to label the plots
+            if group in group_names:
+                name = group_names[group]
+            else:
+                name = group
+            select = input_flags['select_anisotropies']
+            if select in selection_names:
+                selection = selection_names[select]
+            else:
+                selection = select
+            full_title = '%s Distribution, by Metric, %s' %(name,
+                    selection)
+
+            if input_flags['strip_for_energy'] == True:
+                logger.info("plotting stripplots for all metrics, %s"
+                        %(name))
+                self.render('stripbymetric', data=subdata['data'],
+                        plot_title=full_title,
+                        x_title='Metric Type',
+                        x_names=subdata['names'],
+                        y_title='Relative Metric Distribution Density',
+                        savepath=analysis_dir+'/%s_strip_%s.pdf'
+                                  %(group, select),
+                        log_scale=True)
+
+            if input_flags['violins_for_energy'] == True:
+                logger.info("plotting violinplots for all metrics, %s"
+                        %(group))
+                self.render('violinbymetric', data=groupdata['data'],
+                        plot_title=full_title,
+                        x_title='Metric Type',
+                        x_names=groupdata['names'],
+                        y_title='Relative Metric Distribution',
+                        savepath=analysis_dir+'/%s_violin_%s.pdf'
+                                  %(group, select),
+                        log_scale=True)
+
+            if input_flags['boxes_for_energy'] == True:
+                logger.info("plotting boxplots for all metrics, %s" %(name))
+                self.render('boxbymetric', data=groupdata['data'],
+                        plot_title=full_title,
+                        x_title='Metric Type',
+                        x_names=groupdata['names'],
+                        y_title='Box of Metric Distribution',
+                        savepath=analysis_dir+'/%s_boxes_%s.pdf'
+                                  %(group, select),
+                        log_scale=True)
+
+            # free the data before the next group is read
+            del groupdata, subdata
+
+        group_data.log_overlap(logger)
+
+    def get_read_options(self):
+        '''
+        Returns the sampling and chunking options for reading the anisotropy
+        data, from the memory plan if there is one.
+        '''
+        plan = self.memory_plan
+        if plan is None:
+            return {'sample_rows' : None,
+                    'chunk_size' : 2**20,
+                    'sample_chunk_size' : None}
+        return {'sample_rows' : plan.sample_rows,
+                'chunk_size' : plan.chunk_size,
+                'sample_chunk_size' : plan.chunk_size if
+                    plan.chunked_samples else None}
+
+    def plot_fom_convergence(self, FOM_init, tally_number='44'):
+        '''
+        Plots the FOM convergence of the tally.
+        '''
+        logger=logging.getLogger("analysis.single_run")
+        logger.info("plotting fom convergence for tally %s" %(tally_number))
+        imagename = 'fom_converge'
+        FOM_init.plot_fom_convergence(imagename)
+        self.add_artifact('%s/%s.pdf' %(FOM_init.savepath, imagename))
+
+    def plot_tally_data(self, datatype='tallied_result', tally_number='44'):
+        '''
+        Plots an energy histogram of the tally result or of the tally
+        relative error (datatype='relative_error').
+        '''
+        logger=logging.getLogger("analysis.single_run")
+        analysis_dir = self.directories['analysis_directory']
+        MCNP_data = self.MCNP_data
+
+        bins = MCNP_data['tally_data']['energy_groups']
+        if datatype == 'relative_error':
             loc = analysis_dir+'/tally_%s_error.pdf' %(tally_number)
             logger.info("plotting tally %s relative error at %s" %(tally_number,
                 loc))
-            bins = MCNP_data['tally_data']['energy_groups']
             relative_err = MCNP_data['tally_data']['relative_error']
-            energy_histogram(bins, relative_err, loc,
+            self.render('energy_histogram', energy_bound=bins,
+                    tally_result=relative_err, savepath=loc,
                     y_title='Tally Relative Error', **styles[self.method_type])
-
-        if input_flags['tally_result'] == True:
+        else:
             loc = analysis_dir+'/tally_%s_result.pdf' %(tally_number)
             logger.info("plotting tally %s result at %s" %(tally_number, loc))
-            bins = MCNP_data['tally_data']['energy_groups']
             tally_result = MCNP_data['tally_data']['tallied_result']
-            energy_histogram(bins, tally_result, loc, **styles[self.method_type])
+            self.render('energy_histogram', energy_bound=bins,
+                    tally_result=tally_result, savepath=loc,
+                    **styles[self.method_type])
 
-        if input_flags['save_fom_data'] == True:
+    def save_tally_tables(self, FOM_init, tally_number='44', foms=False,
+            convergence=False):
+        '''
+        Saves the figure of merit table and/or the tally convergence table of
+        the run to text files in the analysis directory.
+        '''
+        logger=logging.getLogger("analysis.single_run")
+        analysis_dir = self.directories['analysis_directory']
+
+        if foms == True:
             loc = analysis_dir+'/tally_%s_foms.txt' %(tally_number)
             logger.info("saving figure of merit data to %s" %(loc))
             foms = FOM_init.print_tally_foms(printtype='str', float_format='%.2f')
             with open(loc, 'w') as fp:
                 fp.write(foms)
                 fp.close()
+            self.add_artifact(loc)
 
-        if input_flags['save_tally_data'] == True:
+        if convergence == True:
             loc = analysis_dir+'/tally_%s_converg.txt' %(tally_number)
             logger.info("saving tally %s convergence data to %s" %(tally_number,loc))
             conv = FOM_init.print_tally_convergence(printtype='str')
             with open(loc, 'w') as fp:
                 fp.write(conv)
+            self.add_artifact(loc)
 
-        self.anisotropy_data = {}
+    def get_anisotropy_statistics(self, anisotropy_file, cutoff='full'):
+        '''
+        Returns the anisotropy statistics for the given cutoff (full, median
+        or mean), reusing previously processed statistics or the statistics
+        in the shared store (see statistics_store.py) where they exist.
+        Statistics that are calculated are added to the store for
+        Compare_Runs.
+        '''
+        logger=logging.getLogger("analysis.single_run")
 
-        if input_flags['plot_anisotropy_correlations'] == True or \
-           input_flags['plot_anisotropy_corrs_median'] == True or \
-           input_flags['plot_anisotropy_corrs_mean'] == True:
-            # first calculate anisotropy stats
+        if cutoff in self.anisotropy_data:
+            logger.info("reusing %s anisotropy statistics" %(cutoff))
+            anisotropy_data = self.anisotropy_data[cutoff]
+            self.statistics_store.put(anisotropy_file.outputlocation,
+                    cutoff, anisotropy_data)
+            return anisotropy_data
 
-            from plotting_utils import statscatter
-            err = MCNP_data['tally_data']['relative_error']
-            bins = MCNP_data['tally_data']['energy_groups']
+        anisotropy_data = self.statistics_store.get_statistics(
+                anisotropy_file, cutoff=cutoff)
+        self.anisotropy_data[cutoff]=anisotropy_data
 
-            # because in the deterministic calculation, the first group is the
-            # highest energy, check that MC data is in the same order.
-            if bins[-1] > bins[0]:
-                logger.debug('''tally bins not in the same order as
-                        deterministic result. Reversing order for consistency.''')
-                err = err[::-1]
-                bins = bins[::-1]
-            else:
-                logger.debug('''Monte Carlo and deterministic results in same
-                        energy order.''')
-
-
-            if input_flags['plot_anisotropy_correlations'] == True:
-                logger.info("calculating anisotropy statistics for metrics")
-                anisotropy_data = anisotropy_file.get_data_statistics()
-                self.anisotropy_data['full']=anisotropy_data
-
-                # plot the anisotropy stats
-                logger.info("plotting anisotropy correlations ")
-                data = anisotropy_data['data']
-                for metric in anisotropy_data['metrics']:
-                    loc = analysis_dir+'/%s_stats.pdf' %(metric)
-                    name = metric_names[metric]
-                    scale = xscales[metric]
-                    metric_location = anisotropy_data['metrics'].index(metric)
-                    metric_data = anisotropy_data['data'][metric_location]
-                    x1 = metric_data[:,0]
-                    x2 = metric_data[:,1]
-                    x4 = metric_data[:,3]
-                    statscatter(x1,x2,x4, err, savepath=loc, metric_name=name,
-                            scale=scale)
-
-            if input_flags['plot_anisotropy_corrs_median'] == True:
-                logger.info("calculating anisotropy statistics for metrics")
-                anisotropy_data = anisotropy_file.get_data_statistics(
-                        filter_data=True, cutoff='median')
-                self.anisotropy_data['median']=anisotropy_data
-
-                # plot the anisotropy stats
-                logger.info("plotting anisotropy correlations for anisotropy"
-                           + " values above the median value")
-                data = anisotropy_data['data']
-                for metric in anisotropy_data['metrics']:
-                    loc = analysis_dir+'/%s_stats_median.pdf' %(metric)
-                    name = metric_names[metric]
-                    scale = xscales[metric]
-                    metric_location = anisotropy_data['metrics'].index(metric)
-                    metric_data = anisotropy_data['data'][metric_location]
-                    x1 = metric_data[:,0]
-                    x2 = metric_data[:,1]
-                    x4 = metric_data[:,3]
-                    statscatter(x1,x2,x4, err, savepath=loc, metric_name=name,
-                            scale=scale)
-
-            if input_flags['plot_anisotropy_corrs_mean'] == True:
-                logger.info("calculating anisotropy statistics for metrics")
-                anisotropy_data = anisotropy_file.get_data_statistics(
-                        filter_data=True, cutoff='mean')
-                self.anisotropy_data['mean']=anisotropy_data
-
-                # plot the anisotropy stats
-                logger.info("plotting anisotropy correlations for anisotropy"
-                           + " values above the mean value")
-                data = anisotropy_data['data']
-                for metric in anisotropy_data['metrics']:
-                    loc = analysis_dir+'/%s_stats_mean.pdf' %(metric)
-                    name = metric_names[metric]
-                    scale = xscales[metric]
-                    metric_location = anisotropy_data['metrics'].index(metric)
-                    metric_data = anisotropy_data['data'][metric_location]
-                    x1 = metric_data[:,0]
-                    x2 = metric_data[:,1]
-                    x4 = metric_data[:,3]
-                    statscatter(x1,x2,x4, err, savepath=loc, metric_name=name,
-                            scale=scale)
+        return anisotropy_data
 
-        if input_flags['save_all_data']==True:
-            varsave = analysis_dir+'/processed_data.json'
-            datasave = analysis_dir+'/processed_data.pkl'
-
-            logger.info("saving processed data to %s" %(datasave))
-            all_data = {
-                        'all foms' : self.foms,
-                        'mcnp data' : self.MCNP_data,
-                        'anisotropy data' : self.anisotropy_data,
-                        }
-
-            # dump the processed data to .pickle file later for accessibility
-            with open(datasave, 'w') as fp:
-                pickle.dump(all_data, fp)
-                fp.close()
+    def plot_anisotropy_correlations(self, anisotropy_data, cutoff='full'):
+        '''
+        Plots the anisotropy statistics of each metric against the tally
+        relative error by energy group.
+        '''
+        logger=logging.getLogger("analysis.single_run")
+        analysis_dir = self.directories['analysis_directory']
+        MCNP_data = self.MCNP_data
 
-            logger.info("saving processed variables to %s" %(varsave))
-            all_vars = {
-                        'filenames' : self.filenames,
-                        'directories' : self.directories,
-                        'input flags': self.input_flags,
-                        'datanames' : self.datanames,
-                        }
+        err = MCNP_data['tally_data']['relative_error']
+        bins = MCNP_data['tally_data']['energy_groups']
 
-            with open(varsave, 'w') as fp:
-                json.dump(all_vars, fp, indent=4)
-                fp.close()
+        # because in the deterministic calculation, the first group is the
+        # highest energy, check that MC data is in the same order.
+        if bins[-1] > bins[0]:
+            logger.debug('''tally bins not in the same order as
+                    deterministic result. Reversing order for consistency.''')
+            err = err[::-1]
+            bins = bins[::-1]
+        else:
+            logger.debug('''Monte Carlo and deterministic results in same
+                    energy order.''')
 
-        return
+        if cutoff == 'full':
+            logger.info("plotting anisotropy correlations ")
+            suffix = ''
+        else:
+            logger.info("plotting anisotropy correlations for anisotropy"
+                       + " values above the %s value" %(cutoff))
+            suffix = '_%s' %(cutoff)
+
+        for metric in anisotropy_data['metrics']:
+            loc = analysis_dir+'/%s_stats%s.pdf' %(metric, suffix)
+            name = metric_names[metric]
+            scale = xscales[metric]
+            metric_location = anisotropy_data['metrics'].index(metric)
+            metric_data = anisotropy_data['data'][metric_location]
+            x1 = metric_data[:,0]
+            x2 = metric_data[:,1]
+            x4 = metric_data[:,3]
+            self.render('statscatter', x1=x1, x2=x2, x4=x4, y=err,
+                    savepath=loc, metric_name=name, scale=scale)
+
+    def render(self, function_name, **kwargs):
+        '''
+        Renders a plotting_utils figure, on the render pool if one is running
+        and in this process otherwise.
+        '''
+        self.add_artifact(kwargs['savepath'])
+        if self.render_pool is not None:
+            self.render_pool.submit(function_name, **kwargs)
+        else:
+            render_job((function_name, kwargs))
+
+    def save_processed_data(self, analysis_dir, tally_number='44'):
+        '''
+        Saves the processed data of this run to processed_data.h5 (see
+        processed_data.py) and the variables used to produce it (filenames,
+        input flags, input file fingerprints) to processed_data.json in
+        analysis_dir. These files can be reused by
+        do_single_analysis(reuse_processed=True).
+        '''
+        logger=logging.getLogger("analysis.single_run")
+
+        varsave = analysis_dir+'/processed_data.json'
+        datasave = analysis_dir+'/processed_data.h5'
+
+        logger.info("saving processed data to %s" %(datasave))
+        all_data = {
+                    'all foms' : self.foms,
+                    'mcnp data' : self.MCNP_data,
+                    'anisotropy data' : self.anisotropy_data,
+                    'frames' : self.frames,
+                    }
+
+        write_processed_data(datasave, all_data, kind='single run')
+
+        logger.info("saving processed variables to %s" %(varsave))
+        all_vars = {
+                    'filenames' : self.filenames,
+                    'directories' : self.directories,
+                    'input flags': self.input_flags,
+                    'datanames' : self.datanames,
+                    'tally number' : tally_number,
+                    'fingerprints' : get_fingerprints(self.filenames),
+                    }
+
+        with open(varsave, 'w') as fp:
+            json.dump(all_vars, fp, indent=4)
+            fp.close()
+        self.add_artifact(datasave)
+        self.add_artifact(varsave)
+
+    def load_processed_data(self, analysis_dir, tally_number='44'):
+        '''
+        Loads the processed data saved by save_processed_data and returns the
+        pieces that are still valid for the current input files:
+        - 'mcnp' (foms, mcnp data and frames) if the MCNP output, timing and
+          omnibus files are unchanged and the tally number is the same
+        - 'anisotropy' (statistics by cutoff) if the anisotropy file is
+          unchanged.
+        Missing or stale pieces are left out so they are recomputed. Returns
+        an empty dict if nothing can be reused. Only the pieces that are
+        still valid are read from processed_data.h5. processed_data.pkl
+        files from older analyses are still read if there is no .h5 file.
+        '''
+        logger=logging.getLogger("analysis.single_run.reuse")
+
+        varsave = analysis_dir+'/processed_data.json'
+        datasave = analysis_dir+'/processed_data.h5'
+        picklesave = analysis_dir+'/processed_data.pkl'
+        if not os.path.isfile(datasave) and os.path.isfile(picklesave):
+            datasave = picklesave
+
+        if not (os.path.isfile(varsave) and os.path.isfile(datasave)):
+            logger.info("no processed data found in %s. Computing all data."
+                    %(analysis_dir))
+            return {}
+
+        try:
+            with open(varsave, 'r') as fp:
+                all_vars = json.load(fp)
+        except (IOError, ValueError) as e:
+            logger.warning("processed data in %s could not be read (%s)."
+                    %(analysis_dir, e) + " Computing all data.")
+            return {}
+
+        saved_prints = all_vars.get('fingerprints', {})
+        current_prints = get_fingerprints(self.filenames)
+
+        def unchanged(keys):
+            return all(saved_prints.get(key, 'missing') == current_prints[key]
+                    for key in keys)
+
+        def read(keys):
+            if datasave == picklesave:
+                with open(datasave, 'rb') as fp:
+                    all_data = pickle.load(fp)
+                return dict((key, all_data.get(key)) for key in keys)
+            return read_processed_data(datasave, keys)
+
+        reused = {}
+
+        mcnp_keys = ['mcnp_output_file', 'timing_file', 'omni_out_file']
+        try:
+            if unchanged(mcnp_keys) and \
+            str(all_vars.get('tally number')) == str(tally_number):
+                all_data = read(['all foms', 'mcnp data', 'frames'])
+            else:
+                all_data = {}
+            if unchanged(['anisotropy_file']):
+                all_data.update(read(['anisotropy data']))
+        except (IOError, ValueError, KeyError, EOFError,
+                pickle.UnpicklingError) as e:
+            logger.warning("processed data in %s could not be read (%s)."
+                    %(analysis_dir, e) + " Computing all data.")
+            return {}
+
+        if not unchanged(mcnp_keys):
+            logger.info("MCNP, timing or omnibus file changed since the data"
+                    + " was processed. Recomputing FOMs.")
+        elif str(all_vars.get('tally number')) != str(tally_number):
+            logger.info("processed data is for tally %s, not %s. Recomputing"
+                    %(all_vars.get('tally number'), tally_number) + " FOMs.")
+        elif all_data.get('mcnp data') is None or \
+                all_data.get('frames') is None:
+            logger.info("no processed MCNP data found. Computing FOMs.")
+        elif self.filenames['timing_file'] is not None and 'adjusted_foms' \
+                not in (all_data.get('all foms') or {}):
+            logger.info("processed FOMs have no cost models. Recomputing"
+                    + " FOMs.")
+        else:
+            reused['mcnp'] = {'foms' : all_data['all foms'],
+                              'mcnp data' : all_data['mcnp data'],
+                              'frames' : all_data['frames']}
+
+        if not unchanged(['anisotropy_file']):
+            logger.info("anisotropy file changed since the data was"
+                    + " processed. Recomputing anisotropy statistics.")
+        elif all_data.get('anisotropy data'):
+            reused['anisotropy'] = dict(all_data['anisotropy data'])
+            logger.info("found processed anisotropy statistics for %s"
+                    %(sorted(reused['anisotropy'])))
+
+        return reused
 
 ###############################################################################
 # end of thesiscode/scripts/single-run.py
@@ -0,0 +1,189 @@
+###############################################################################
+# File  : thesiscode/scripts/statistical_checks.py
+# Author: madicken
+# Date  : Tue Oct 20 14:03:51 2026
+#
+# statistical_checks evaluates the ten statistical checks MCNP prints for a
+# tally, from the tally fluctuation chart (TrackLengthTally.get_fom_data),
+# for any number of runs and tallies at once.
+#    -- stack_charts stacks the fluctuation charts into one array of shape
+#    (charts, rows, quantities), padded with NaN, with a mask of the rows in
+#    the last half of each chart.
+#    -- evaluate_checks runs the ten checks on the stacked array with array
+#    operations and returns a (charts, checks) pass/fail matrix.
+#    -- get_check_frame returns the matrix as a dataframe with one row per
+#    chart, for the Compare_Runs and Study_Runs tables.
+#
+# The checks, as in the MCNP manual, all on the last half of the chart:
+#    mean      1. the mean does not change monotonically
+#    error     2. the final relative error is below 0.1
+#              3. the relative error decreases monotonically
+#              4. the relative error decreases as 1/sqrt(N)
+#    vov       5. the final VOV is below 0.1
+#              6. the VOV decreases monotonically
+#              7. the VOV decreases as 1/N
+#    fom       8. the FOM is statistically constant
+#              9. the FOM does not change monotonically
+#    slope    10. the slope of the history score tail is at least 3
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import pandas as pd
+###############################################################################
+
+# order of the quantities in the stacked charts.
+quantities = ['nps', 'mean', 'error', 'vov', 'slope', 'fom']
+
+# (quantity, check) labels of the ten checks, in order.
+checks = [('mean', 'trend'),
+          ('error', 'value'),
+          ('error', 'decrease'),
+          ('error', '1/sqrt(N)'),
+          ('vov', 'value'),
+          ('vov', 'decrease'),
+          ('vov', '1/N'),
+          ('fom', 'constant'),
+          ('fom', 'trend'),
+          ('slope', 'value')]
+
+# limits of the checks. Use an error limit of 0.05 for point detectors. The
+# 1/sqrt(N) and 1/N rates pass within 'rate tolerance' of the fitted
+# exponent, and the FOM is constant if it varies by less than 'fom
+# variation' (relative standard deviation).
+limits = {'error' : 0.1,
+          'vov' : 0.1,
+          'slope' : 3.0,
+          'rate tolerance' : 0.1,
+          'fom variation' : 0.1}
+
+def stack_charts(charts):
+    '''
+    Stacks a list of fluctuation chart dicts (as from get_fom_data) into an
+    array of shape (charts, rows, quantities), padding the shorter charts
+    with NaN. Returns the array and a boolean (charts, rows) mask of the
+    rows in the last half of each chart.
+    '''
+    lengths = np.array([len(chart['nps']) for chart in charts], dtype=int)
+    stacked = np.full((len(charts), max(lengths.max(), 1) if len(charts) else
+        1, len(quantities)), np.nan)
+    for number, chart in enumerate(charts):
+        for column, quantity in enumerate(quantities):
+            stacked[number, :lengths[number], column] = chart[quantity]
+    rows = np.arange(stacked.shape[1])
+    last_half = (rows[None, :] >= lengths[:, None]//2) & \
+            (rows[None, :] < lengths[:, None])
+    return stacked, last_half
+
+def _monotonic(values, mask, sign):
+    '''
+    Returns whether the values in the mask of each chart change
+    monotonically in the direction of sign (1 increasing, -1 decreasing),
+    allowing equal neighbours. Charts with fewer than two rows in the mask
+    are not monotonic.
+    '''
+    steps = np.diff(values, axis=1)*sign
+    pairs = mask[:, 1:] & mask[:, :-1]
+    with np.errstate(invalid='ignore'):
+        ok = np.where(pairs, steps >= 0, True)
+    return ok.all(axis=1) & (pairs.sum(axis=1) > 0)
+
+def _strictly_monotonic(values, mask):
+    '''
+    Returns whether the values in the mask of each chart change strictly
+    monotonically, up or down.
+    '''
+    steps = np.diff(values, axis=1)
+    pairs = mask[:, 1:] & mask[:, :-1]
+    with np.errstate(invalid='ignore'):
+        up = np.where(pairs, steps > 0, True).all(axis=1)
+        down = np.where(pairs, steps < 0, True).all(axis=1)
+    return (up | down) & (pairs.sum(axis=1) > 0)
+
+def _exponents(nps, values, mask):
+    '''
+    Returns the exponent p of the least squares fit values = c*nps**p in
+    log space over the mask of each chart (NaN if there are fewer than two
+    usable rows).
+    '''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        usable = mask & (nps > 0) & (values > 0)
+        x = np.where(usable, np.log(nps), 0)
+        y = np.where(usable, np.log(values), 0)
+        count = usable.sum(axis=1)
+        x_mean = x.sum(axis=1)/count
+        y_mean = y.sum(axis=1)/count
+        dx = np.where(usable, x - x_mean[:, None], 0)
+        dy = np.where(usable, y - y_mean[:, None], 0)
+        exponents = (dx*dy).sum(axis=1)/(dx*dx).sum(axis=1)
+    exponents[count < 2] = np.nan
+    return exponents
+
+def evaluate_checks(stacked, last_half):
+    '''
+    Runs the ten statistical checks on charts stacked by stack_charts.
+    Returns a boolean (charts, 10) array with True where a check passes, in
+    the order of checks.
+    '''
+    nps, mean, error, vov, slope, fom = [stacked[:, :, column] for column in
+            range(len(quantities))]
+    lengths = (~np.isnan(nps)).sum(axis=1)
+    last = np.maximum(lengths - 1, 0)
+    charts = np.arange(stacked.shape[0])
+    final = lambda values: values[charts, last]
+
+    with np.errstate(invalid='ignore'):
+        error_rate = _exponents(nps, error, last_half)
+        vov_rate = _exponents(nps, vov, last_half)
+        fom_half = np.where(last_half, fom, np.nan)
+        fom_mean = np.nanmean(fom_half, axis=1)
+        fom_variation = np.nanstd(fom_half, axis=1)/fom_mean
+
+        results = np.column_stack([
+            ~_strictly_monotonic(mean, last_half),
+            final(error) < limits['error'],
+            _monotonic(error, last_half, -1),
+            np.abs(error_rate + 0.5) <= limits['rate tolerance'],
+            final(vov) < limits['vov'],
+            _monotonic(vov, last_half, -1),
+            np.abs(vov_rate + 1) <= limits['rate tolerance'],
+            fom_variation < limits['fom variation'],
+            ~_strictly_monotonic(fom, last_half),
+            final(slope) >= limits['slope']])
+    return results
+
+def get_check_frame(charts, keys, names):
+    '''
+    Returns the pass/fail matrix of the ten checks for a list of
+    fluctuation chart dicts as a dataframe indexed by keys (a list of
+    tuples, with index level names names), with (quantity, check) columns
+    and a column with the number of checks passed.
+    '''
+    names = list(names)
+    if len(names) == 1:
+        index = pd.Index([key[0] for key in keys], name=names[0])
+    else:
+        index = pd.MultiIndex.from_tuples([tuple(key) for key in keys],
+                names=names)
+    columns = pd.MultiIndex.from_tuples(checks, names=['quantity', 'check'])
+    if not charts:
+        return pd.DataFrame(columns=columns)
+    results = evaluate_checks(*stack_charts(charts))
+    frame = pd.DataFrame(results, index=index, columns=columns)
+    frame[('all', 'passed')] = results.sum(axis=1)
+    return frame
+
+def format_check_frame(frame):
+    '''
+    Returns a copy of a check frame with yes/no in place of True/False, as
+    MCNP prints the checks.
+    '''
+    formatted = frame.copy()
+    for column in checks:
+        formatted[column] = np.where(frame[column].values.astype(bool),
+                'yes', 'no')
+    return formatted
+
+###############################################################################
+# end of thesiscode/scripts/statistical_checks.py
+###############################################################################
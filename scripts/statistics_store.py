@@ -0,0 +1,155 @@
+###############################################################################
+# File  : thesiscode/scripts/statistics_store.py
+# Author: madicken
+# Date  : Mon Oct 19 20:05:43 2026
+#
+# statistics_store keeps the anisotropy statistics (H5Output.
+# get_data_statistics) of an anisotropy file so that Single_Run and
+# Compare_Runs calculate them once.
+#    -- StatisticsStore is the store of one analysis directory. Statistics
+#    are keyed by the fingerprint of the anisotropy file (its path, size and
+#    modification time), the cutoff (full, median or mean) and the weighting
+#    (the field the mesh cells are selected by). They are kept in memory for
+#    the process and in anisotropy_statistics.h5 on disk.
+#    -- get returns stored statistics or None, put stores them and
+#    get_statistics returns them for an open H5Output, calculating and
+#    storing them if they are not stored yet.
+#
+# A changed anisotropy file has a different fingerprint, so its old
+# statistics are never returned. They are dropped from the disk store the
+# next time statistics of that file are stored.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import threading
+import logging
+import os
+from processed_data import write_processed_data, read_processed_data
+from analysis_utils import get_file_fingerprint, get_parameter_hash
+###############################################################################
+
+# statistics stored by this process, by key hash, shared by every store.
+memory_store = {}
+store_lock = threading.Lock()
+
+# the field the mesh cells are selected by for each cutoff.
+weightings = {'full' : 'none',
+              'median' : 'contributon_flux',
+              'mean' : 'contributon_flux'}
+
+class StatisticsStore(object):
+    '''
+    Store of the anisotropy statistics calculated for the anisotropy files
+    of a run. savepath is the hdf5 file the statistics are kept in on disk
+    (None to keep them in memory only).
+    '''
+    def __init__(self, savepath=None):
+        self.savepath = savepath
+        self.entries = None
+
+    def get_key(self, filepath, cutoff='full', weighting=None):
+        '''
+        Returns the key of the statistics of filepath for a cutoff and
+        weighting, or None if the file does not exist.
+        '''
+        fingerprint = get_file_fingerprint(filepath)
+        if fingerprint is None:
+            return None
+        if weighting is None:
+            weighting = weightings[cutoff]
+        return {'file' : os.path.realpath(str(filepath)),
+                'size' : fingerprint['size'],
+                'mtime' : fingerprint['mtime'],
+                'cutoff' : cutoff,
+                'weighting' : weighting}
+
+    def read_entries(self):
+        '''
+        Reads the statistics stored on disk, once. Returns a dict of entries
+        by key hash.
+        '''
+        logger = logging.getLogger("analysis.statistics_store")
+
+        if self.entries is None:
+            self.entries = {}
+            if self.savepath is not None and os.path.isfile(self.savepath):
+                try:
+                    self.entries = read_processed_data(self.savepath)
+                except (ValueError, KeyError, IOError) as err:
+                    logger.warning("not reading stored anisotropy statistics"
+                            + " from %s: %s" %(self.savepath, err))
+        return self.entries
+
+    def get(self, filepath, cutoff='full', weighting=None):
+        '''
+        Returns the stored statistics of filepath for the cutoff and
+        weighting, or None if they are not stored.
+        '''
+        key = self.get_key(filepath, cutoff, weighting)
+        if key is None:
+            return None
+        name = get_parameter_hash(key)
+        with store_lock:
+            if name in memory_store:
+                return memory_store[name]
+            entry = self.read_entries().get(name)
+            if entry is None:
+                return None
+            memory_store[name] = entry['statistics']
+            return entry['statistics']
+
+    def put(self, filepath, cutoff, statistics, weighting=None):
+        '''
+        Stores the statistics of filepath for the cutoff and weighting in
+        memory and on disk. Stored statistics of an older version of the
+        same file are dropped.
+        '''
+        logger = logging.getLogger("analysis.statistics_store")
+
+        key = self.get_key(filepath, cutoff, weighting)
+        if key is None:
+            return
+        name = get_parameter_hash(key)
+        with store_lock:
+            memory_store[name] = statistics
+            entries = self.read_entries()
+            if self.savepath is None or name in entries:
+                return
+            for other in list(entries):
+                stored = entries[other]['key']
+                if stored['file'] == key['file'] and (stored['size'],
+                        stored['mtime']) != (key['size'], key['mtime']):
+                    del entries[other]
+            entries[name] = {'key' : key, 'statistics' : statistics}
+            write_processed_data(self.savepath, entries,
+                    kind='anisotropy statistics')
+        logger.debug("stored %s anisotropy statistics of %s in %s"
+                %(cutoff, filepath, self.savepath))
+
+    def get_statistics(self, anisotropy_file, cutoff='full'):
+        '''
+        Returns the statistics of an H5Output for the cutoff, calculating
+        and storing them if they are not stored.
+        '''
+        logger = logging.getLogger("analysis.statistics_store")
+
+        filepath = anisotropy_file.outputlocation
+        statistics = self.get(filepath, cutoff)
+        if statistics is not None:
+            logger.info("reusing stored %s anisotropy statistics of %s"
+                    %(cutoff, filepath))
+            return statistics
+
+        logger.info("calculating %s anisotropy statistics of %s"
+                %(cutoff, filepath))
+        if cutoff == 'full':
+            statistics = anisotropy_file.get_data_statistics()
+        else:
+            statistics = anisotropy_file.get_data_statistics(
+                    filter_data=True, cutoff=cutoff)
+        self.put(filepath, cutoff, statistics)
+        return statistics
+
+###############################################################################
+# end of thesiscode/scripts/statistics_store.py
+###############################################################################
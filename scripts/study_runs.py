@@ -0,0 +1,371 @@
+###############################################################################
+# File  : thesiscode/scripts/study_runs.py
+# Author: madicken
+# Date  : Tue Oct 20 09:12:33 2026
+#
+# study_runs aggregates every run of a study (all problems under all methods)
+# into a few tidy tables, instead of one Compare_Runs per problem.
+#    -- find_runs walks a study root and returns every run directory in it,
+#    with its problem name and method label.
+#    -- read_run parses the MCNP output and timing file of one run, or reads
+#    the processed data Single_Run saved for it if that is still current.
+#    -- Study_Runs reads all runs (on a process pool if asked) and builds:
+#       bins: one row per (problem, method, tally, bin) with the tally
+#       result, relative error, times and FOMs of that bin.
+#       totals: one row per (problem, method, tally) with the tally totals.
+#       timing: the timing breakdown of every run.
+#       checks: the ten MCNP statistical checks of every run and tally.
+#    FOM ratio tables against a reference method are computed from these
+#    in one vectorized pass, for the MC FOM and for the adjusted FOM under
+#    every cost model (see analysis.cost_models).
+#
+# The study layout is taken to be ${root}/${method}/${problem}, as used by the
+# submission scripts (for example demonstration/cadis/maze2). With
+# layout='problem/method' it is ${root}/${problem}/${method}.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import pandas as pd
+import multiprocessing
+import logging
+import os
+from analysis_utils import get_paths, get_method_type, format_logger
+from processed_data import read_saved_run_data, write_processed_data
+from instrumentation import stage
+###############################################################################
+
+def is_run_directory(path):
+    '''
+    Returns True if path looks like a run directory to get_paths: an ADVANTG
+    run (output and adjoint solution directories) or an MCNP-only run.
+    '''
+    return (os.path.isdir(path+'/output') and
+            os.path.isdir(path+'/adj_solution')) or \
+            os.path.isdir(path+'/fwcadis_adj_solution') or \
+            os.path.isfile(path+'/mcnp/out')
+
+def find_runs(root, layout='method/problem'):
+    '''
+    Returns a list of dicts (path, problem, method) for every run directory
+    under root, sorted by path. Directories inside a run are not searched.
+    The method label is the directory the layout names; a run directly
+    under root is labelled by its own name.
+    '''
+    root = os.path.abspath(os.path.expanduser(root))
+    runs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if not is_run_directory(dirpath):
+            continue
+        dirnames[:] = []
+        parts = os.path.relpath(dirpath, root).split(os.sep)
+        if parts == ['.']:
+            parts = [os.path.basename(dirpath)]
+        if len(parts) == 1:
+            problem = method = parts[0]
+        elif layout == 'problem/method':
+            problem, method = parts[0], '/'.join(parts[1:])
+        else:
+            problem, method = parts[-1], '/'.join(parts[:-1])
+        runs.append({'path' : dirpath, 'problem' : problem,
+                     'method' : method})
+    return runs
+
+def read_run(job):
+    '''
+    Reads one run for one tally. job is a tuple of (path, tally number,
+    reuse_processed). Returns a dict with the method type, the tally data,
+    the times used for the FOMs (times_used) and the timing frame, or None
+    if the run has no MCNP output. Used on a process pool by Study_Runs.
+    '''
+    path, tally_number, reuse_processed = job
+    logger = logging.getLogger("analysis.study")
+
+    paths = get_paths(path)
+    if paths is None:
+        return None
+    filenames, directories = paths
+    if filenames['mcnp_output_file'] is None:
+        logger.warning("no MCNP output in %s, skipping it" %(path))
+        return None
+
+    data = None
+    if reuse_processed == True:
+        saved = read_saved_run_data(filenames, directories, tally_number,
+                keys=['mcnp data/tally_data', 'mcnp data/fom_trends',
+                    'all foms/times_used', 'frames/timing_frame'])
+        if saved is not None:
+            logger.debug("reusing processed data of %s" %(path))
+            data = {'tally_data' : saved['mcnp data']['tally_data'],
+                    'fom_trends' : saved['mcnp data']['fom_trends'],
+                    'times_used' : saved['all foms']['times_used'],
+                    'timing_frame' : saved['frames']['timing_frame']}
+
+    if data is None:
+        from analysis import FOMAnalysis
+
+        if filenames['timing_file'] is not None:
+            foms = FOMAnalysis(filenames['mcnp_output_file'], tally_number,
+                    deterministic_timing_file=filenames['timing_file'],
+                    omnibus_output_file=filenames['omni_out_file'])
+        else:
+            foms = FOMAnalysis(filenames['mcnp_output_file'], tally_number)
+        data = {'tally_data' : foms.mc_data['tally_data'],
+                'fom_trends' : foms.mc_data['fom_trends'],
+                'times_used' : foms.all_foms['times_used'],
+                'timing_frame' : foms.timing_frame}
+
+    data['method_type'] = get_method_type(filenames, directories)
+    return data
+
+class Study_Runs(object):
+    def __init__(self, root, tally_numbers=('44',), layout='method/problem',
+            processes=0, reuse_processed=True, analysis_dir=None,
+            measure_efficiency=False):
+        '''
+        Aggregates every run under the study root for the given tallies.
+        With processes other than 0 the runs are read on a pool of that many
+        processes (None for one per cpu). If reuse_processed is True, runs
+        whose Single_Run processed data is current are read from it instead
+        of being parsed. If measure_efficiency is True, the parallel
+        efficiency of every run's Denovo solve is measured from the timing
+        of the study (see timing_analytics.py) and the adjusted FOMs of the
+        efficiency cost model are added. Outputs are saved in analysis_dir,
+        by default ${root}/analysis_study.
+        '''
+        self.root = os.path.abspath(os.path.expanduser(root))
+        if analysis_dir is None:
+            analysis_dir = self.root+'/analysis_study'
+        self.analysis_dir = os.path.expanduser(analysis_dir)
+        if not os.path.isdir(self.analysis_dir):
+            os.makedirs(self.analysis_dir)
+
+        logger = logging.getLogger("analysis")
+        if not logger.handlers:
+            logger = format_logger("analysis",
+                    '%s/study_analysis.log' %(self.analysis_dir))
+        logger.info("Initiated %s analysis of %s" %(__name__, self.root))
+
+        self.tally_numbers = [str(tally) for tally in tally_numbers]
+        self.layout = layout
+        self.processes = processes
+        self.reuse_processed = reuse_processed
+        self.measure_efficiency = measure_efficiency
+
+        self.runs = find_runs(self.root, layout)
+        self.results = self.read_runs()
+        if self.measure_efficiency == True:
+            self.add_efficiency_costs()
+        self.bins, self.totals = self.make_frames()
+        self.timing = self.make_timing_frame()
+        self.checks = self.make_check_frame()
+
+    def read_runs(self):
+        '''
+        Reads every run for every tally. Returns a list of (run, tally,
+        data) for the runs that could be read.
+        '''
+        logger = logging.getLogger("analysis.study")
+
+        jobs = [(run['path'], tally, self.reuse_processed) for run in
+                self.runs for tally in self.tally_numbers]
+        logger.info("reading %d runs for %d tallies" %(len(self.runs),
+            len(self.tally_numbers)))
+        with stage('read study runs', 'read', runs=len(jobs)):
+            if self.processes == 0 or len(jobs) < 2:
+                results = [read_run(job) for job in jobs]
+            else:
+                pool = multiprocessing.Pool(self.processes)
+                try:
+                    results = pool.map(read_run, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+
+        runs = [run for run in self.runs for tally in self.tally_numbers]
+        tallies = [tally for run in self.runs for tally in self.tally_numbers]
+        return [(run, tally, data) for run, tally, data in zip(runs,
+            tallies, results) if data is not None]
+
+    def add_efficiency_costs(self):
+        '''
+        Adds the efficiency cost model to the times used of every run, with
+        the parallel efficiency of its Denovo solve measured against the
+        scaling fit of its problem (Timing_Runs.get_run_efficiency). Runs
+        without a measured efficiency keep the other cost models only.
+        '''
+        from analysis import add_efficiency_cost
+        from timing_analytics import Timing_Runs
+
+        logger = logging.getLogger("analysis.study")
+
+        timing = Timing_Runs(self.root, processes=self.processes,
+                analysis_dir=self.analysis_dir)
+        for run, tally, data in self.results:
+            efficiency = timing.get_run_efficiency(run['path'])
+            if efficiency is None:
+                logger.info("no measured parallel efficiency for %s"
+                        %(run['path']))
+                continue
+            logger.debug("parallel efficiency of %s is %.3f" %(run['path'],
+                efficiency))
+            data['times_used'] = add_efficiency_cost(data['times_used'],
+                    efficiency)
+
+    def make_frames(self):
+        '''
+        Builds the per-bin frame, indexed by (problem, method, tally, bin),
+        and the per-run totals frame, indexed by (problem, method, tally),
+        with analysis.make_fom_frames. The FOMs of all bins of all runs are
+        computed together.
+        '''
+        from analysis import make_fom_frames
+
+        if not self.results:
+            return pd.DataFrame(), pd.DataFrame()
+
+        bins, totals = make_fom_frames(
+                [data['tally_data'] for run, tally, data in self.results],
+                [data['times_used'] for run, tally, data in self.results],
+                [(run['problem'], run['method'], tally) for run, tally, data
+                    in self.results], ['problem', 'method', 'tally'])
+        method_types = np.array([data['method_type'] for run, tally, data in
+            self.results], dtype=object)
+        counts = [len(data['tally_data']['relative_error']) for run, tally,
+                data in self.results]
+        bins.insert(0, 'method type', np.repeat(method_types, counts))
+        totals.insert(0, 'method type', method_types)
+
+        return bins.sort_index(), totals.sort_index()
+
+    def make_timing_frame(self):
+        '''
+        Returns the timing breakdown of every run, indexed by (problem,
+        method, tally, category, component), with the time and its units.
+        '''
+        if not self.results:
+            return pd.DataFrame()
+        frames = []
+        keys = []
+        for run, tally, data in self.results:
+            frame = data['timing_frame'].copy()
+            frame.columns = ['time']
+            frame['units'] = data['times_used']['units']
+            frames.append(frame)
+            keys.append((run['problem'], run['method'], tally))
+        timing = pd.concat(frames, keys=keys)
+        timing.index.names = ['problem', 'method', 'tally', 'category',
+                'component']
+        return timing.sort_index()
+
+    def make_check_frame(self):
+        '''
+        Returns the pass/fail matrix of the ten MCNP statistical checks (see
+        statistical_checks.py) of every run and tally, indexed by (problem,
+        method, tally). The checks of all runs are evaluated together.
+        '''
+        from statistical_checks import get_check_frame
+
+        frame = get_check_frame([data['fom_trends'] for run, tally, data in
+            self.results], [(run['problem'], run['method'], tally) for run,
+                tally, data in self.results], ['problem', 'method', 'tally'])
+        return frame.sort_index()
+
+    def get_methods(self):
+        '''
+        Returns the method labels in the study, sorted.
+        '''
+        return sorted(set(run['method'] for run, tally, data in
+            self.results))
+
+    def get_fom_ratios(self, reference='cadis', column='fom', by='bin'):
+        '''
+        Returns the ratio of every method's FOM to the reference method's
+        FOM for the same problem, tally (and bin with by='bin'). The result
+        has one column per method, indexed by (problem, tally, bin) or
+        (problem, tally) with by='total'. column is 'fom', 'fom adjusted'
+        or 'fom adjusted (model)' for a cost model.
+        '''
+        from analysis import get_fom_ratio_frame
+
+        frame = self.bins if by == 'bin' else self.totals
+        return get_fom_ratio_frame(frame, reference, level='method',
+                column=column)
+
+    def get_ratio_summary(self, reference='cadis', column='fom'):
+        '''
+        Returns a table of the per-bin FOM ratios to the reference method,
+        summarized over the bins of each problem and tally: the ratio of the
+        tally totals, and the median, minimum and maximum bin ratio.
+        '''
+        ratios = self.get_fom_ratios(reference, column, by='bin')
+        grouped = ratios.groupby(level=['problem', 'tally'])
+        summary = pd.concat([self.get_fom_ratios(reference, column,
+            by='total'), grouped.median(), grouped.min(), grouped.max()],
+            axis=1, keys=['total', 'median bin', 'min bin', 'max bin'])
+        return summary.swaplevel(0, 1, axis=1).sort_index(axis=1)
+
+    def save_tables(self, reference='cadis', saveformat='txt'):
+        '''
+        Saves the ratio summaries of the MC and adjusted FOMs (under every
+        cost model) and the statistical checks of every run to the analysis
+        directory as text or latex tables. Returns their paths.
+        '''
+        from analysis import cost_models
+        from statistical_checks import format_check_frame
+
+        logger = logging.getLogger("analysis.study")
+
+        saved = []
+        columns = [('fom', 'fom_ratios'),
+                ('fom adjusted', 'fom_adjusted_ratios')] + \
+                [('fom adjusted (%s)' %(model), 'fom_adjusted_%s_ratios'
+                    %(model.replace(' ', '_'))) for model in cost_models]
+        for column, name in columns:
+            if column not in self.totals or \
+                    self.totals[column].isnull().all():
+                continue
+            summary = self.get_ratio_summary(reference, column)
+            if saveformat == 'tex' or saveformat == 'latex':
+                savepath = self.analysis_dir+'/%s.tex' %(name)
+                table = summary.to_latex(float_format='%.3g', na_rep='--')
+            else:
+                savepath = self.analysis_dir+'/%s.txt' %(name)
+                table = summary.to_string(float_format='%.3g', na_rep='--')
+            logger.info("saving %s table to %s" %(column, savepath))
+            with open(savepath, 'w') as fp:
+                fp.write(table)
+            saved.append(savepath)
+
+        if not self.checks.empty:
+            checks = format_check_frame(self.checks)
+            if saveformat == 'tex' or saveformat == 'latex':
+                savepath = self.analysis_dir+'/statistical_checks.tex'
+                table = checks.to_latex()
+            else:
+                savepath = self.analysis_dir+'/statistical_checks.txt'
+                table = checks.to_string()
+            logger.info("saving statistical checks table to %s" %(savepath))
+            with open(savepath, 'w') as fp:
+                fp.write(table)
+            saved.append(savepath)
+        return saved
+
+    def save_data(self):
+        '''
+        Saves the bins, totals, timing and checks frames to study_data.h5 in
+        the analysis directory (see processed_data.py). Returns its path.
+        '''
+        logger = logging.getLogger("analysis.study")
+
+        datasave = self.analysis_dir+'/study_data.h5'
+        logger.info("saving study data to %s" %(datasave))
+        write_processed_data(datasave, {'bins' : self.bins,
+            'totals' : self.totals, 'timing' : self.timing,
+            'checks' : self.checks, 'root' : self.root}, kind='study runs')
+        return datasave
+
+###############################################################################
+# end of thesiscode/scripts/study_runs.py
+###############################################################################
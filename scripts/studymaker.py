@@ -5,27 +5,100 @@
 #
 # The StudyMaker script generates a parametric study based on a specified
 # (python-based) input for advantg, and then substitutes in values for the
-# user-defined study. This study is one-dimensional, meaning that only one
-# variable is changed per script. Should a user require multiple variables to
-# be changed at once, this script will need to be updated.
+# user-defined study. By default the study is one-dimensional, meaning that
+# only one variable is changed per script. With a sweep the variables are
+# changed together:
+#    -- 'product' makes every combination of the values.
+#    -- 'points' takes an explicit list of study points.
+#    -- 'latin hypercube' takes a Latin hypercube subset of the product, for
+#    when the product is too large to run.
+# The points are generated lazily, and make_study and make_submission_script
+# walk the same points. A point that changes more than one variable gets a
+# directory named after the hash of the point, and every study directory has
+# a study_point.json with its variables.
 ###############################################################################
 from __future__ import (division, absolute_import, print_function, )
 #-----------------------------------------------------------------------------#
 import numpy as np
+import itertools
+import json
 import os
 import re
+from analysis_utils import get_parameter_hash
 
 ###############################################################################
 
+# StudyMaker options and the advantg input variables they set, in the order
+# the variables of a study point are swept.
+parameter_names = [('xs_libs', 'anisn_library'),
+                   ('quad_type', 'denovo_quadrature'),
+                   ('quad_order', 'denovo_quad_order'),
+                   ('pn_order', 'denovo_pn_order'),
+                   ('x_blocks', 'denovo_x_blocks'),
+                   ('y_blocks', 'denovo_y_blocks'),
+                   ('z_blocks', 'denovo_z_blocks')]
+
+sweeps = ['one at a time', 'product', 'points', 'latin hypercube']
+
+def get_point_name(point):
+    '''
+    Returns the directory name of a study point, a dict of advantg input
+    variable : value. A point that changes one variable is named
+    ${variable}_${value}, as the one-dimensional studies always were. Other
+    points are named sweep_ and the start of the hash of the point, which
+    does not depend on the order of the variables or of the sweep.
+    '''
+    if len(point) == 1:
+        item, value = list(point.items())[0]
+        return '%s_%s' %(item, value)
+    return 'sweep_%s' %(get_parameter_hash(point)[:12])
+
+def latin_hypercube(levels, samples, seed=0):
+    '''
+    Yields a Latin hypercube sample of at most samples points from the
+    product of the lists of levels of each variable. The range of every
+    variable is cut into samples equal strata, each used once, so every
+    level of a variable is sampled about equally often. Points that come out
+    the same on a coarse grid are yielded once. The sample only depends on
+    the seed.
+    '''
+    random = np.random.RandomState(seed)
+    columns = []
+    for values in levels:
+        strata = (random.permutation(samples) +
+                random.uniform(size=samples))/samples
+        columns.append((strata*len(values)).astype(int))
+    seen = set()
+    for row in zip(*columns):
+        if row in seen:
+            continue
+        seen.add(row)
+        yield tuple(values[index] for values, index in zip(levels, row))
+
 class StudyMaker(object):
     def __init__(self, filename, xs_libs = [], quad_type = [],
                  quad_order = [], pn_order = [], x_blocks = [],
-                 y_blocks = [], z_blocks = []):
+                 y_blocks = [], z_blocks = [], sweep = 'one at a time',
+                 points = None, samples = None, seed = 0):
         '''
         The study maker takes user-defined parameters and modifies
         an advantg input file
         n number of times to include each parameter for a parametric study.
+
+        sweep is one of sweeps. With sweep='points', points is a list of
+        dicts of option (for example quad_order) or advantg input variable :
+        value. With sweep='latin hypercube', samples is the number of points
+        to take from the product and seed makes the choice repeatable.
         '''
+        if sweep not in sweeps:
+            raise ValueError('%s is not a sweep (they are %s)' %(sweep,
+                ', '.join(sweeps)))
+        if sweep == 'points' and not points:
+            raise ValueError('a points sweep needs a list of points')
+        if sweep == 'latin hypercube' and not samples:
+            raise ValueError('a latin hypercube sweep needs a number of '
+                    'samples')
+
         self.filename = filename
         self.path = os.path.dirname(os.path.abspath(filename))
         self.xs_libs = xs_libs
@@ -35,6 +108,10 @@ class StudyMaker(object):
         self.x_blocks = x_blocks
         self.y_blocks = y_blocks
         self.z_blocks = z_blocks
+        self.sweep = sweep
+        self.samples = samples
+        self.seed = seed
+        self.points = [self.normalize_point(point) for point in points or []]
         self.opt_dict ={}
 
         StudyMaker.filldictionary(self)
@@ -56,6 +133,9 @@ class StudyMaker(object):
         print('quad_types :', self.quad_type)
         print('quad_orders :', self.quad_order)
         print('pn_orders :', self.pn_order)
+        print('blocks :', self.x_blocks, self.y_blocks, self.z_blocks)
+        print('sweep :', self.sweep)
+        print('study points :', self.count_points())
 
     def filldictionary(self):
         '''
@@ -86,6 +166,73 @@ class StudyMaker(object):
             optiondictionary[name] = self.z_blocks
         self.opt_dict = optiondictionary
 
+    def normalize_point(self, point):
+        '''
+        Returns a study point with its options (quad_order) named by their
+        advantg input variables (denovo_quad_order), and text values as str.
+        '''
+        options = dict(parameter_names)
+        advantg_names = set(options.values())
+        normalized = {}
+        for key, value in point.items():
+            name = options.get(key, key)
+            if name not in advantg_names:
+                raise ValueError('%s is not a study option' %(key))
+            if isinstance(value, type(u'')):
+                value = str(value)
+            normalized[name] = value
+        return normalized
+
+    def iter_points(self):
+        '''
+        Yields the points of the study, each a dict of advantg input
+        variable : value, in a fixed order. The points are made as they are
+        needed, so a large product is never held in memory.
+        '''
+        names = [name for option, name in parameter_names if name in
+                self.opt_dict]
+        levels = [self.opt_dict[name] for name in names]
+        if self.sweep == 'one at a time':
+            for name, values in zip(names, levels):
+                for value in values:
+                    yield {name : value}
+        elif self.sweep == 'product':
+            for values in itertools.product(*levels):
+                yield dict(zip(names, values))
+        elif self.sweep == 'latin hypercube':
+            for values in latin_hypercube(levels, self.samples, self.seed):
+                yield dict(zip(names, values))
+        else:
+            for point in self.points:
+                yield dict(point)
+
+    def count_points(self):
+        '''
+        Returns the number of points in the study.
+        '''
+        if self.sweep == 'one at a time':
+            return sum(len(values) for values in self.opt_dict.values())
+        elif self.sweep == 'product':
+            return int(np.prod([len(values) for values in
+                self.opt_dict.values()])) if self.opt_dict else 0
+        elif self.sweep == 'points':
+            return len(self.points)
+        return sum(1 for point in self.iter_points())
+
+    def get_study_path(self, point):
+        '''
+        Returns the directory of a study point.
+        '''
+        return os.path.join(self.path, get_point_name(point))
+
+    def describe_point(self, point):
+        '''
+        Returns the variables of a study point as text, for the logs of the
+        submission script.
+        '''
+        return ' '.join('%s %s' %(name, point[name]) for option, name in
+                parameter_names if name in point)
+
     def printdict(self,dictionary):
         for item in dictionary:
             print(item + ':', dictionary[item])
@@ -126,25 +273,71 @@ class StudyMaker(object):
         newpath = self.path
         lines = f.readlines()
         num_studies = 0
-        for item in self.opt_dict:
-            for value in self.opt_dict[item]:
-                num_studies += 1
-                filebase = os.path.basename(self.filename)
-                input_name = os.path.splitext(filebase)[0]
-                studypath = newpath+'/%s_%s' %(item,value)
-                if not os.path.exists(studypath):
-                    os.makedirs(studypath)
-                newlines = StudyMaker.changeline(self, item, value, lines)
-                newfile = os.path.join(studypath,filebase)
-                nf = open(newfile, 'w')
-                nf.writelines(newlines)
-                copy('%s/%s' %(newpath,input_name), '%s/%s' %(studypath,input_name))
+        manifest = {}
+        for point in self.iter_points():
+            num_studies += 1
+            filebase = os.path.basename(self.filename)
+            input_name = os.path.splitext(filebase)[0]
+            studypath = self.get_study_path(point)
+            if not os.path.exists(studypath):
+                os.makedirs(studypath)
+            newlines = lines
+            for item in sorted(point):
+                newlines = StudyMaker.changeline(self, item, point[item],
+                        newlines)
+            newfile = os.path.join(studypath,filebase)
+            nf = open(newfile, 'w')
+            nf.writelines(newlines)
+            nf.close()
+            with open(os.path.join(studypath, 'study_point.json'), 'w') as fp:
+                json.dump(point, fp, sort_keys=True, indent=2)
+            manifest[os.path.basename(studypath)] = point
+            copy('%s/%s' %(newpath,input_name), '%s/%s' %(studypath,input_name))
+        with open(os.path.join(newpath, 'study_points.json'), 'w') as fp:
+            json.dump({'sweep' : self.sweep, 'points' : manifest}, fp,
+                    sort_keys=True, indent=2)
         print('%d studies created at %s' %(num_studies,newpath))
 
+    def get_run_lines(self, point, mcnpscript=False, cores=None):
+        '''
+        Returns the lines of a submission script that run one study point:
+        advantg, or MCNP on the input advantg wrote if mcnpscript is True.
+        cores limits the MCNP launcher to that many processes, for runs that
+        share a node.
+        '''
+        mcnpline1 = 'mkdir "./mcnp" \n'
+        mcnpline2 = 'rm "./mcnp/"* \n'
+        mcnpline3 = 'cp "./output/"*inp* "./mcnp/" \n'
+        mcnpline4 = 'cd "./mcnp" \n'
+        allmlines = mcnpline1+mcnpline2+mcnpline3+mcnpline4
+        filebase = os.path.basename(self.filename)
+        studypath = self.get_study_path(point)+'/'
+        description = self.describe_point(point)
+        studyline1 = 'cd "%s" \n' %(studypath)
+        studylinea = 'echo "Beginning PBS execution at ' + \
+                '$(date) for %s in $(pwd)" \n' %(description)
+        studylineb = 'echo ">>> PBS nodes: ${PBS_NUM_NODES}" \n'
+        studylinec = 'echo ">>> PBS cores per node: ${PBS_NUM_PPN}" \n'
+        if mcnpscript == False:
+            studyline2 = '"${ADVANTG}" %s \n' %(filebase)
+        else:
+            if cores:
+                mcnpexec = '"${LAUNCHER}" -np %d "${MCNP}" "i=inp o=out" \n' \
+                        %(cores)
+            else:
+                mcnpexec = '"${LAUNCHER}" "${MCNP}" "i=inp o=out" \n'
+            studyline2 = allmlines+mcnpexec
+        studylined = 'echo ">>> Finished PBS execution for ' + \
+                '%s at $(date)" \n' %(description)
+        return [studyline1, studylinea, studylineb, studylinec, studyline2,
+                studylined]
+
     def make_submission_script(self, input_base_file, name='', mcnpscript=False):
         '''
-        Generates a PBS submission script for the parametric study. For the
-        moment, this is limited to sequential runs in a single file.
+        Generates a PBS submission script for the parametric study, with a
+        run of every study point in the order of make_study. The runs are
+        sequential in a single file; make_array_script and
+        make_packed_scripts run them in parallel.
         '''
         f = open(input_base_file)
         f_name = os.path.basename(input_base_file)
@@ -159,38 +352,40 @@ class StudyMaker(object):
         lines.append('\n')
         print('edited runscript file located at: %s' %(edited_file))
         print('lines added to file:')
-        mcnpline1 = 'mkdir "./mcnp" \n'
-        mcnpline2 = 'rm "./mcnp/"* \n'
-        mcnpline3 = 'cp "./output/"*inp* "./mcnp/" \n'
-        mcnpline4 = 'cd "./mcnp" \n'
-        allmlines = mcnpline1+mcnpline2+mcnpline3+mcnpline4
-        for item in self.opt_dict:
-            for value in self.opt_dict[item]:
-                filebase = os.path.basename(self.filename)
-                studypath = newpath+'/%s_%s/' %(item,value)
-                studyline1 = 'cd "%s" \n' %(studypath)
-                studylinea = 'echo "Beginning PBS execution at ' + \
-                        '$(date) for %s %s in $(pwd)" \n' %(item, value)
-                studylineb = 'echo ">>> PBS nodes: ${PBS_NUM_NODES}" \n'
-                studylinec = 'echo ">>> PBS cores per node: ${PBS_NUM_PPN}" \n'
-                if mcnpscript == False:
-                    studyline2 = '"${ADVANTG}" %s \n' %(filebase)
-                else:
-                    mcnpexec = '"${LAUNCHER}" "${MCNP}" "i=inp o=out" \n'
-                    studyline2 = allmlines+mcnpexec
-                studylined = 'echo ">>> Finished PBS execution for ' + \
-                        '%s %s at $(date)" \n' %(item,value)
-                print(studyline1, studyline2)
-                lines.append(studyline1)
-                lines.append(studylinea)
-                lines.append(studylineb)
-                lines.append(studylinec)
-                lines.append(studyline2)
-                lines.append(studylined)
+        for point in self.iter_points():
+            runlines = self.get_run_lines(point, mcnpscript)
+            print(runlines[0], runlines[4])
+            lines.extend(runlines)
         nf = open(edited_file, 'w')
         nf.writelines(lines)
         nf.close()
 
+    def make_array_script(self, input_base_file, name='', mcnpscript=False,
+            flavor='torque', estimate=None, margin=1.25, walltime=None):
+        '''
+        Generates a PBS job array script with one array task per study point.
+        See submission.make_array_script. Returns its path.
+        '''
+        from submission import make_array_script
+
+        return make_array_script(self, input_base_file, name=name,
+                mcnpscript=mcnpscript, flavor=flavor, estimate=estimate,
+                margin=margin, walltime=walltime)
+
+    def make_packed_scripts(self, input_base_file, name='', mcnpscript=False,
+            estimate=None, walltime=None, scripts=None, cores_per_run=None,
+            margin=1.25):
+        '''
+        Generates PBS scripts with the study points packed by estimated
+        runtime, longest first, under a walltime limit or into a number of
+        scripts. See submission.make_packed_scripts. Returns their paths.
+        '''
+        from submission import make_packed_scripts
+
+        return make_packed_scripts(self, input_base_file, name=name,
+                mcnpscript=mcnpscript, estimate=estimate, walltime=walltime,
+                scripts=scripts, cores_per_run=cores_per_run, margin=margin)
+
 #-----------------------------------------------------------------------------#
 
 ###############################################################################
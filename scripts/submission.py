@@ -0,0 +1,361 @@
+###############################################################################
+# File  : thesiscode/scripts/submission.py
+# Author: madicken
+# Date  : Wed Oct 21 10:17:42 2026
+#
+# submission writes PBS scripts that run the points of a StudyMaker study in
+# parallel, instead of one after another in a single script for the whole
+# walltime.
+#    -- make_array_script writes one job array script with an array task per
+#    study point (Torque: -t and ${PBS_ARRAYID}, PBS Pro: -J and
+#    ${PBS_ARRAY_INDEX}).
+#    -- pack_runs packs runs into scripts by their estimated runtime, longest
+#    processing time first: each run goes to the least loaded lane it still
+#    fits in. A script has as many lanes as runs that fit side by side on its
+#    node (ppn over the cores of one run).
+#    -- make_packed_scripts writes the packed scripts. The lanes of a script
+#    run in the background and the script waits for them. Its walltime is
+#    that of its most loaded lane, times a margin. Runs are packed against
+#    the walltime limit over the margin, so no script asks for more than the
+#    limit. A point that needs more than the limit on its own is an error
+#    (check_walltime), rather than a script that is sure to be killed.
+# The #PBS directives and the variables (ADVANTG, MCNP, LAUNCHER) are taken
+# from an existing submission script, such as submission_scripts/run.pbs.
+# Both work for the advantg runs and for the MCNP runs (mcnpscript=True).
+#
+# The runtime of a point is estimate(point) in seconds, such as the
+# RuntimeEstimator.get_estimate of runtime_model.py. Without an estimate every
+# point is taken to need the walltime of the base script.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import logging
+import heapq
+import os
+import re
+from analysis_utils import parse_walltime, format_walltime
+###############################################################################
+
+# the directive and the index variable of a job array, by scheduler.
+array_flavors = {'torque' : ('-t', 'PBS_ARRAYID'),
+                 'pbspro' : ('-J', 'PBS_ARRAY_INDEX')}
+
+assignment = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*=')
+
+def read_script_header(input_base_file):
+    '''
+    Returns the header of a submission script, the leading comments, #PBS
+    directives, variable assignments and blank lines before its first
+    command, and a dict of its nodes, ppn and walltime (seconds), None where
+    they are not set.
+    '''
+    with open(input_base_file) as fp:
+        lines = fp.readlines()
+    header = []
+    for line in lines:
+        stripped = line.strip()
+        if stripped and not stripped.startswith('#') and \
+                not assignment.match(stripped):
+            break
+        header.append(line)
+    while header and not header[-1].strip():
+        header.pop()
+
+    resources = {'nodes' : None, 'ppn' : None, 'walltime' : None}
+    for line in header:
+        match = re.match(r'#PBS\s+-l\s+(.*)', line.strip())
+        if match is None:
+            continue
+        for resource in re.split(r'[,:]', match.group(1)):
+            if '=' not in resource:
+                continue
+            key, value = resource.split('=', 1)
+            if key == 'walltime':
+                # the walltime itself has colons, so read it whole.
+                value = re.search(r'walltime=([0-9:]+)',
+                        match.group(1)).group(1)
+                resources['walltime'] = parse_walltime(value)
+            elif key in ('nodes', 'ppn') and value.isdigit():
+                resources[key] = int(value)
+    return header, resources
+
+def set_directive(header, flag, value, resource=None):
+    '''
+    Returns a copy of a script header with the #PBS flag set to value
+    (#PBS -N name), or with the resource of #PBS -l set (#PBS -l
+    walltime=value). The directive replaces an existing one or is added
+    after the last directive.
+    '''
+    if resource is not None:
+        pattern = re.compile(r'#PBS\s+-l\s+%s=' %(re.escape(resource)))
+        newline = '#PBS -l %s=%s\n' %(resource, value)
+    else:
+        pattern = re.compile(r'#PBS\s+%s(\s|$)' %(re.escape(flag)))
+        newline = '#PBS %s %s\n' %(flag, value)
+    header = list(header)
+    directives = [number for number, line in enumerate(header) if
+            line.startswith('#PBS')]
+    for number in directives:
+        if pattern.match(header[number]):
+            header[number] = newline
+            return header
+    position = directives[-1] + 1 if directives else min(1, len(header))
+    header.insert(position, newline)
+    return header
+
+def get_directive(header, flag):
+    '''
+    Returns the value of a #PBS flag in a script header, or None.
+    '''
+    for line in header:
+        match = re.match(r'#PBS\s+%s\s+(\S+)' %(re.escape(flag)),
+                line.strip())
+        if match is not None:
+            return match.group(1)
+    return None
+
+def get_estimates(points, estimate=None, resources=None):
+    '''
+    Returns an array of the estimated seconds of every point, from
+    estimate(point), or the walltime of the base script for every point if
+    there is no estimate. Raises ValueError if there is neither.
+    '''
+    if estimate is not None:
+        return np.array([estimate(point) for point in points], dtype=float)
+    if resources is None or resources['walltime'] is None:
+        raise ValueError('give a runtime estimate or a base script with a '
+                'walltime')
+    return np.full(len(points), float(resources['walltime']))
+
+def pack_runs(estimates, walltime=None, scripts=None, lanes=1):
+    '''
+    Packs runs with the estimated times into scripts of lanes lanes each,
+    longest processing time first. With a walltime limit, each run goes to
+    the least loaded lane it fits in and a new script is started when it
+    fits in none; with a number of scripts, each run goes to the least
+    loaded of their lanes. Returns a list of scripts, each a list of lanes,
+    each a list of run indices in the order they run. A run longer than the
+    walltime gets a lane of its own in a new script.
+    '''
+    logger = logging.getLogger("analysis.submission")
+
+    if walltime is None and scripts is None:
+        raise ValueError('give a walltime limit or a number of scripts')
+    estimates = np.asarray(estimates, dtype=float)
+    order = np.argsort(-estimates, kind='mergesort')
+    lanes = max(int(lanes), 1)
+
+    if scripts is not None:
+        packed = [[[] for lane in range(lanes)] for script in range(scripts)]
+        heap = [(0.0, script, lane) for script in range(scripts) for lane in
+                range(lanes)]
+        heapq.heapify(heap)
+        for run in order:
+            load, script, lane = heapq.heappop(heap)
+            packed[script][lane].append(int(run))
+            heapq.heappush(heap, (load + estimates[run], script, lane))
+        if walltime is not None:
+            for load, script, lane in heap:
+                if load > walltime:
+                    logger.warning("script %d needs %s, more than the "
+                            %(script, format_walltime(load)) +
+                            "packing limit %s" %(format_walltime(walltime)))
+        return [script for script in packed if any(script)]
+
+    packed = []
+    loads = []
+    for run in order:
+        time = estimates[run]
+        if time > walltime:
+            logger.warning("run %d needs %s, more than the packing limit "
+                    %(run, format_walltime(time)) + "%s. It goes in a "
+                    %(format_walltime(walltime)) + "new script.")
+        best = None
+        for script in range(len(packed)):
+            for lane in range(lanes):
+                load = loads[script][lane]
+                if load + time <= walltime and (best is None or
+                        load < loads[best[0]][best[1]]):
+                    best = (script, lane)
+        if best is None:
+            packed.append([[] for lane in range(lanes)])
+            loads.append([0.0]*lanes)
+            best = (len(packed) - 1, 0)
+        packed[best[0]][best[1]].append(int(run))
+        loads[best[0]][best[1]] += time
+    return packed
+
+def indent(lines, prefix='  '):
+    '''
+    Returns script lines indented by prefix, line by line.
+    '''
+    return [prefix+line for line in ''.join(lines).splitlines(True)]
+
+def get_script_name(input_base_file, name, suffix):
+    '''
+    Returns the file name of a generated script, name (or the name of the
+    base script) with suffix, keeping the extension of the base script.
+    '''
+    prefix, extension = os.path.splitext(os.path.basename(input_base_file))
+    return '%s_%s%s' %(name or prefix, suffix, extension)
+
+def check_walltime(maker, points, estimates, margin=1.25, walltime=None):
+    '''
+    Raises ValueError naming the points of the StudyMaker maker whose
+    estimated seconds times margin are more than the walltime limit, as no
+    script could give them the time they need.
+    '''
+    if walltime is None:
+        return
+    over = [number for number in range(len(points)) if
+            margin*estimates[number] > walltime]
+    if over:
+        raise ValueError('%d point(s) need more than the walltime limit %s '
+                %(len(over), format_walltime(walltime)) + 'with a margin of '
+                '%.2f: %s' %(margin, '; '.join('%s (%s)'
+                    %(maker.describe_point(points[number]),
+                        format_walltime(margin*estimates[number])) for number
+                    in over)))
+
+def get_walltime(load, margin=1.25, walltime=None):
+    '''
+    Returns the walltime (seconds) to request for a load of estimated
+    seconds, the load times margin. Raises ValueError if that is more than
+    the walltime limit, if one is given.
+    '''
+    needed = margin*load
+    if walltime is None:
+        return needed
+    # a load packed against walltime/margin may round to just over it.
+    if needed > walltime*(1 + 1e-9):
+        raise ValueError('%s is needed, more than the walltime limit %s'
+                %(format_walltime(needed), format_walltime(walltime)))
+    return min(needed, walltime)
+
+def make_array_script(maker, input_base_file, name='', mcnpscript=False,
+        flavor='torque', estimate=None, margin=1.25, walltime=None):
+    '''
+    Writes a job array script for the points of the StudyMaker maker, with
+    the header of input_base_file. Array task i runs point i. With an
+    estimate, the walltime of every task is that of the longest point times
+    margin. walltime is a limit in seconds or as a PBS walltime; with an
+    estimate, ValueError is raised naming the points that need more than
+    it, otherwise it is the walltime of every task. Returns the path of the
+    script.
+    '''
+    logger = logging.getLogger("analysis.submission")
+
+    if flavor not in array_flavors:
+        raise ValueError('%s is not a scheduler (they are %s)' %(flavor,
+            ', '.join(sorted(array_flavors))))
+    flag, index = array_flavors[flavor]
+
+    points = list(maker.iter_points())
+    header, resources = read_script_header(input_base_file)
+    header = set_directive(header, flag, '0-%d' %(len(points) - 1))
+    if walltime is not None and not isinstance(walltime, (int, float)):
+        walltime = parse_walltime(walltime)
+    if estimate is not None:
+        estimates = get_estimates(points, estimate)
+        check_walltime(maker, points, estimates, margin, walltime)
+        header = set_directive(header, '-l', format_walltime(get_walltime(
+            estimates.max(), margin, walltime)), resource='walltime')
+    elif walltime is not None:
+        header = set_directive(header, '-l', format_walltime(walltime),
+                resource='walltime')
+
+    lines = header + ['\n', 'case "${%s}" in\n' %(index)]
+    for number, point in enumerate(points):
+        lines.append('%d)\n' %(number))
+        lines.extend(indent(maker.get_run_lines(point, mcnpscript)))
+        lines.append('  ;;\n')
+    lines.append('esac\n')
+
+    savepath = os.path.join(maker.path, get_script_name(input_base_file,
+        name, 'array'))
+    with open(savepath, 'w') as fp:
+        fp.writelines(lines)
+    logger.info("job array of %d tasks written to %s" %(len(points),
+        savepath))
+    print('job array script of %d runs located at: %s' %(len(points),
+        savepath))
+    return savepath
+
+def make_packed_scripts(maker, input_base_file, name='', mcnpscript=False,
+        estimate=None, walltime=None, scripts=None, cores_per_run=None,
+        margin=1.25):
+    '''
+    Writes the points of the StudyMaker maker into PBS scripts packed by
+    estimated runtime (see pack_runs), with the header of input_base_file.
+    walltime is the limit of a script, in seconds or as a PBS walltime, and
+    scripts the number of scripts; give either. With cores_per_run, ppn over
+    cores_per_run runs share the node of a script. The walltime of each
+    script is its most loaded lane times margin. Runs are packed against
+    walltime over margin, so that this is not more than the limit.
+    ValueError is raised, before any script is written, naming the points
+    that need more than the limit, or if a given number of scripts can not
+    hold the runs within it. Returns the paths of the scripts.
+    '''
+    logger = logging.getLogger("analysis.submission")
+
+    points = list(maker.iter_points())
+    header, resources = read_script_header(input_base_file)
+    estimates = get_estimates(points, estimate, resources)
+    if walltime is not None and not isinstance(walltime, (int, float)):
+        walltime = parse_walltime(walltime)
+    lanes = 1
+    if cores_per_run and resources['ppn']:
+        lanes = max(resources['ppn']//cores_per_run, 1)
+    check_walltime(maker, points, estimates, margin, walltime)
+    packed = pack_runs(estimates, walltime=None if walltime is None else
+            walltime/margin, scripts=scripts, lanes=lanes)
+    scriptwalltimes = []
+    for number, script in enumerate(packed):
+        load = max(estimates[lane].sum() for lane in script if lane)
+        try:
+            scriptwalltimes.append(get_walltime(load, margin, walltime))
+        except ValueError as e:
+            raise ValueError('script %d of %d: %s. Use more scripts.'
+                    %(number, len(packed), e))
+
+    jobname = get_directive(header, '-N')
+    savepaths = []
+    for number, script in enumerate(packed):
+        scriptwalltime = scriptwalltimes[number]
+        scriptheader = set_directive(header, '-l', format_walltime(
+            scriptwalltime), resource='walltime')
+        if jobname is not None:
+            scriptheader = set_directive(scriptheader, '-N', '%s_%d'
+                    %(jobname, number))
+        lines = scriptheader + ['\n']
+        busy = [lane for lane in script if lane]
+        for lane in busy:
+            runlines = []
+            for run in lane:
+                runlines.extend(maker.get_run_lines(points[run], mcnpscript,
+                    cores=cores_per_run if len(busy) > 1 else None))
+            if len(busy) > 1:
+                lines.append('(\n')
+                lines.extend(indent(runlines))
+                lines.append(') &\n')
+            else:
+                lines.extend(runlines)
+        if len(busy) > 1:
+            lines.append('wait\n')
+
+        savepath = os.path.join(maker.path, get_script_name(input_base_file,
+            name, 'pack%d' %(number)))
+        with open(savepath, 'w') as fp:
+            fp.writelines(lines)
+        logger.info("%d runs in %d lanes written to %s, walltime %s"
+                %(sum(len(lane) for lane in script), len(busy), savepath,
+                    format_walltime(scriptwalltime)))
+        savepaths.append(savepath)
+    print('%d runs packed into %d scripts at: %s' %(len(points),
+        len(savepaths), maker.path))
+    return savepaths
+
+###############################################################################
+# end of thesiscode/scripts/submission.py
+###############################################################################
@@ -0,0 +1,331 @@
+###############################################################################
+# File  : thesiscode/scripts/timing_analytics.py
+# Author: madicken
+# Date  : Tue Oct 20 16:38:20 2026
+#
+# timing_analytics tabulates the deterministic (ADVANTG) timing of every run
+# of a study and fits a strong-scaling model to it, so that the walltime of a
+# new configuration can be predicted instead of guessed.
+#    -- find_timing_runs walks a study root for run directories with a
+#    timing.json file.
+#    -- read_timing reads the per-phase times of one run (advantg, denovo,
+#    omega and dispose, split as in TimingOutput.split_timing_dict), its
+#    core count (omnibus.pp.json) and its block decomposition (the
+#    denovo_x/y/z_blocks of its advantg input, as set by StudyMaker).
+#    -- Timing_Runs reads every run (on a process pool if asked), and for
+#    every problem and phase fits the model
+#        T = serial + parallel/cores + pipeline*(x + y + z - 3)
+#    where the last term is the fill of the KBA sweep pipeline over the
+#    blocks. It predicts the per-phase walltime, the parallel efficiency and
+#    a PBS walltime request for any core count and decomposition, and gives
+#    the measured efficiency of each run for the adjusted FOMs.
+#
+# Times are the wall seconds written to timing.json. They are not multiplied
+# by the core count as they are in TimingOutput.get_timing_data.
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import pandas as pd
+import multiprocessing
+import logging
+import glob
+import os
+import re
+from analysis_utils import get_num_cores, format_logger, format_walltime
+from instrumentation import stage
+###############################################################################
+
+phases = ['advantg', 'denovo', 'omega', 'dispose']
+
+# terms of the strong-scaling model, in the order of the fitted coefficients.
+terms = ['serial', 'parallel', 'pipeline']
+
+block_pattern = re.compile(r'"denovo_([xyz])_blocks"\s*:\s*(\d+)')
+
+def find_timing_runs(root):
+    '''
+    Returns the sorted list of directories under root that have a
+    timing.json file. Directories inside a run are not searched.
+    '''
+    root = os.path.abspath(os.path.expanduser(root))
+    runs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if 'timing.json' in filenames:
+            runs.append(dirpath)
+            dirnames[:] = []
+    return runs
+
+def get_decomposition(path):
+    '''
+    Returns the problem name and the (x, y, z) Denovo blocks of a run from
+    the advantg input in its directory. Blocks that are not set are 1. The
+    problem name is the name of the input, or of the directory if there is
+    no input.
+    '''
+    blocks = {'x' : 1, 'y' : 1, 'z' : 1}
+    problem = os.path.basename(os.path.normpath(path))
+    for inputfile in sorted(glob.glob(os.path.join(path, '*.py'))):
+        with open(inputfile) as fp:
+            found = block_pattern.findall(fp.read())
+        problem = os.path.splitext(os.path.basename(inputfile))[0]
+        for axis, value in found:
+            blocks[axis] = int(value)
+        if found:
+            break
+    return problem, (blocks['x'], blocks['y'], blocks['z'])
+
+def read_timing(path):
+    '''
+    Reads the timing of the run in path. Returns a dict with the problem,
+    the cores, the blocks and the wall seconds of every phase, or None if
+    the timing file can not be read.
+    '''
+    from analysis import TimingOutput
+
+    logger = logging.getLogger("analysis.timing")
+
+    try:
+        timing = TimingOutput(path+'/timing.json').get_timing_data()
+    except (IOError, ValueError) as err:
+        logger.warning("can not read the timing of %s: %s" %(path, err))
+        return None
+    totals = timing['timing_dicts']['totals']
+
+    problem, blocks = get_decomposition(path)
+    cores = None
+    for adj_dir in ['adj_solution', 'fwcadis_adj_solution']:
+        omnibus = os.path.join(path, adj_dir, 'omnibus.pp.json')
+        if os.path.isfile(omnibus):
+            cores = get_num_cores(omnibus)
+            break
+    if cores is None:
+        cores = blocks[0]*blocks[1]*blocks[2]
+
+    data = {'path' : path, 'problem' : problem, 'cores' : cores,
+            'x blocks' : blocks[0], 'y blocks' : blocks[1],
+            'z blocks' : blocks[2]}
+    for phase in phases:
+        data[phase] = float(totals['%s_time' %(phase)])
+    return data
+
+def get_design(cores, x_blocks, y_blocks, z_blocks):
+    '''
+    Returns the (runs, terms) design matrix of the scaling model for arrays
+    of core counts and blocks.
+    '''
+    cores = np.asarray(cores, dtype=float)
+    stages = np.asarray(x_blocks, dtype=float) + \
+            np.asarray(y_blocks, dtype=float) + \
+            np.asarray(z_blocks, dtype=float) - 3
+    return np.column_stack([np.ones_like(cores), 1/cores, stages])
+
+def fit_nonnegative(design, times):
+    '''
+    Least squares fit of times = design.coefficients with coefficients that
+    are not negative. Terms whose coefficient comes out negative are dropped
+    and the rest refitted. Terms with no spread in the data (for example the
+    pipeline term when every run has one block) are left at zero.
+    '''
+    active = [term for term in range(design.shape[1]) if term == 0 or
+            np.ptp(design[:, term]) > 0]
+    coefficients = np.zeros(design.shape[1])
+    while active:
+        # no more terms than runs
+        active = active[:len(times)]
+        fitted = np.linalg.lstsq(design[:, active], times, rcond=None)[0]
+        if (fitted >= 0).all():
+            coefficients[active] = fitted
+            break
+        active = [term for term, value in zip(active, fitted) if value >= 0]
+    return coefficients
+
+class Timing_Runs(object):
+    def __init__(self, root, processes=0, analysis_dir=None):
+        '''
+        Reads the timing of every run under the study root and fits the
+        scaling model of every problem and phase. With processes other than
+        0 the runs are read on a pool of that many processes (None for one
+        per cpu). Tables are saved in analysis_dir, by default
+        ${root}/analysis_timing.
+        '''
+        self.root = os.path.abspath(os.path.expanduser(root))
+        if analysis_dir is None:
+            analysis_dir = self.root+'/analysis_timing'
+        self.analysis_dir = os.path.expanduser(analysis_dir)
+        if not os.path.isdir(self.analysis_dir):
+            os.makedirs(self.analysis_dir)
+
+        logger = logging.getLogger("analysis")
+        if not logger.handlers:
+            logger = format_logger("analysis",
+                    '%s/timing_analysis.log' %(self.analysis_dir))
+        logger.info("Initiated %s analysis of %s" %(__name__, self.root))
+
+        self.processes = processes
+        self.paths = find_timing_runs(self.root)
+        self.timing = self.read_runs()
+        self.fits = self.fit_scaling()
+
+    def read_runs(self):
+        '''
+        Returns a frame of the timing of every run, indexed by its path
+        relative to the root, with the problem, cores, blocks, the wall
+        seconds of each phase, the total and the core hours.
+        '''
+        logger = logging.getLogger("analysis.timing")
+
+        logger.info("reading the timing of %d runs" %(len(self.paths)))
+        with stage('read timing', 'read', runs=len(self.paths)):
+            if self.processes == 0 or len(self.paths) < 2:
+                results = [read_timing(path) for path in self.paths]
+            else:
+                pool = multiprocessing.Pool(self.processes)
+                try:
+                    results = pool.map(read_timing, self.paths)
+                finally:
+                    pool.close()
+                    pool.join()
+
+        results = [data for data in results if data is not None]
+        columns = ['problem', 'cores', 'x blocks', 'y blocks', 'z blocks'] + \
+                phases + ['total', 'core hours']
+        if not results:
+            return pd.DataFrame(columns=columns)
+        frame = pd.DataFrame(results, index=pd.Index([os.path.relpath(
+            data['path'], self.root) for data in results], name='run'))
+        frame['total'] = frame[phases].sum(axis=1)
+        frame['core hours'] = frame['cores']*frame['total']/3600
+        return frame[columns]
+
+    def fit_scaling(self):
+        '''
+        Fits the scaling model to every phase of every problem. Returns a
+        frame indexed by (problem, phase) with the serial, parallel and
+        pipeline coefficients (seconds), the number of runs and the relative
+        rms error of the fit.
+        '''
+        rows = []
+        keys = []
+        for problem, frame in self.timing.groupby('problem'):
+            design = get_design(frame['cores'], frame['x blocks'],
+                    frame['y blocks'], frame['z blocks'])
+            for phase in phases:
+                times = frame[phase].values.astype(float)
+                coefficients = fit_nonnegative(design, times)
+                predicted = design.dot(coefficients)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    error = np.sqrt(np.mean(((predicted - times)/
+                        times)**2)) if (times > 0).all() else np.nan
+                row = dict(zip(terms, coefficients))
+                row.update({'runs' : len(times), 'rms error' : error})
+                rows.append(row)
+                keys.append((problem, phase))
+        if not rows:
+            return pd.DataFrame(columns=terms+['runs', 'rms error'])
+        index = pd.MultiIndex.from_tuples(keys, names=['problem', 'phase'])
+        return pd.DataFrame(rows, index=index)[terms+['runs', 'rms error']]
+
+    def get_problem(self, problem=None):
+        '''
+        Returns problem, or the only problem of the study if problem is
+        None. Raises ValueError if it is ambiguous or unknown.
+        '''
+        problems = sorted(set(self.timing['problem']))
+        if problem is None and len(problems) == 1:
+            return problems[0]
+        if problem not in problems:
+            raise ValueError('choose a problem of the study: %s'
+                    %(', '.join(problems)))
+        return problem
+
+    def predict(self, cores, x_blocks=1, y_blocks=1, z_blocks=1,
+            problem=None):
+        '''
+        Returns a dict of the predicted wall seconds of every phase and
+        their total for a core count and decomposition. The arguments can be
+        arrays, to predict several configurations at once.
+        '''
+        problem = self.get_problem(problem)
+        design = get_design(np.atleast_1d(cores), np.atleast_1d(x_blocks),
+                np.atleast_1d(y_blocks), np.atleast_1d(z_blocks))
+        prediction = {}
+        for phase in phases:
+            prediction[phase] = design.dot(
+                    self.fits.loc[(problem, phase), terms].values.astype(
+                        float))
+        prediction['total'] = np.sum([prediction[phase] for phase in phases],
+                axis=0)
+        if np.ndim(cores) == 0:
+            prediction = dict((key, float(value[0])) for key, value in
+                    prediction.items())
+        return prediction
+
+    def get_parallel_efficiency(self, cores, x_blocks=1, y_blocks=1,
+            z_blocks=1, problem=None, phase='total'):
+        '''
+        Returns the predicted parallel efficiency T(1)/(cores T(cores)) of a
+        phase (or the total) for a core count and decomposition.
+        '''
+        serial = self.predict(1, 1, 1, 1, problem)[phase]
+        parallel = self.predict(cores, x_blocks, y_blocks, z_blocks,
+                problem)[phase]
+        return serial/(np.asarray(cores, dtype=float)*parallel)
+
+    def get_run_efficiency(self, path, phase='denovo'):
+        '''
+        Returns the measured parallel efficiency T(1)/(cores T) of a phase of
+        the run in path, from its measured wall time T and the fitted one
+        core time of its problem. Returns None if the run is not in the
+        study, or if its problem was only timed on one core count, since
+        then the scaling can not be told from the serial time. Used by the
+        efficiency cost model of the adjusted FOMs.
+        '''
+        run = os.path.relpath(os.path.abspath(os.path.expanduser(path)),
+                self.root)
+        if run not in self.timing.index:
+            return None
+        row = self.timing.loc[run]
+        problem_cores = self.timing.loc[self.timing['problem'] ==
+                row['problem'], 'cores']
+        if problem_cores.nunique() < 2 or not row[phase] > 0:
+            return None
+        serial = self.predict(1, 1, 1, 1, row['problem'])[phase]
+        return serial/(row['cores']*row[phase])
+
+    def suggest_walltime(self, cores, x_blocks=1, y_blocks=1, z_blocks=1,
+            problem=None, margin=1.25):
+        '''
+        Returns a PBS walltime request (HH:MM:SS) for the deterministic part
+        of a run: the predicted total times margin, rounded up to the
+        minute.
+        '''
+        return format_walltime(margin*self.predict(cores, x_blocks, y_blocks,
+            z_blocks, problem)['total'])
+
+    def save_tables(self, saveformat='txt'):
+        '''
+        Saves the timing of every run and the scaling fits to the analysis
+        directory as text or latex tables. Returns their paths.
+        '''
+        logger = logging.getLogger("analysis.timing")
+
+        saved = []
+        for frame, name in [(self.timing, 'timing_phases'),
+                (self.fits, 'scaling_fits')]:
+            if saveformat == 'tex' or saveformat == 'latex':
+                savepath = self.analysis_dir+'/%s.tex' %(name)
+                table = frame.to_latex(float_format='%.3g', na_rep='--')
+            else:
+                savepath = self.analysis_dir+'/%s.txt' %(name)
+                table = frame.to_string(float_format='%.3g', na_rep='--')
+            logger.info("saving %s table to %s" %(name, savepath))
+            with open(savepath, 'w') as fp:
+                fp.write(table)
+            saved.append(savepath)
+        return saved
+
+###############################################################################
+# end of thesiscode/scripts/timing_analytics.py
+###############################################################################
@@ -0,0 +1,167 @@
+###############################################################################
+# File  : thesiscode/tests/test_denovo_output.py
+# Author: madicken
+# Date  : Mon Oct 19 15:02:47 2026
+#
+# Tests DenovoOutput on a small synthetic silo file.
+#    -- make_silo_file writes the layout of the silo HDF5 driver: the data of
+#    each variable lives in the /.silo/ directory and a small object with a
+#    'silo' attribute points to it. Plain datasets sit next to them.
+#    -- the group names cover every spelling that get_variables matches.
+#
+# Run from the repository root with
+#     python -m unittest discover tests
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+###############################################################################
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'scripts'))
+
+shape = (6, 5, 4)
+
+def add_silo_object(f, name, target):
+    '''
+    Writes a silo object called name whose 'silo' attribute points to the
+    dataset at target.
+    '''
+    silo_type = np.dtype([('value0', 'S32'), ('ndims', np.int32)])
+    obj = f.create_dataset(name, data=0)
+    obj.attrs.create('silo', np.array((target.encode('utf8'), 3),
+        dtype=silo_type))
+
+def make_silo_file(path):
+    '''
+    Writes a silo file with a scalar and an adjoint flux stored behind silo
+    pointers, an angular flux stored as plain datasets, a non-flux variable,
+    a pointer to missing data and a scalar, and returns the data written by
+    (variable, group number).
+    '''
+    import h5py
+
+    random = np.random.RandomState(0)
+    data = {}
+    with h5py.File(path, 'w') as f:
+        silo = f.create_group('.silo')
+        names = [('scalar_flux', 'scalar_flux_%03d'),
+                 ('adjoint_flux', 'adjoint_flux_g%d'),
+                 ('omega_flux', 'omega_flux_grp%02d')]
+        count = 0
+        for variable, name in names:
+            for number in range(3):
+                values = random.lognormal(size=shape)
+                target = '/.silo/#%06d' %count
+                silo.create_dataset(target, data=values)
+                add_silo_object(f, name %number, target)
+                data[(variable, number)] = values
+                count += 1
+        angular = f.create_group('angular_flux')
+        for number in range(2):
+            values = random.lognormal(size=shape + (8,))
+            angular.create_dataset('group_%03d' %number, data=values)
+            data[('angular_flux', number)] = values
+        # not fluxes, or not resolvable: never variables
+        add_silo_object(f, 'material_000', '/.silo/#000000')
+        add_silo_object(f, 'lost_flux_000', '/.silo/#999999')
+        f.create_dataset('eigenvalue', data=1.0)
+    return data
+
+class TestDenovoOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'denovo_adjoint_output.silo')
+        self.data = make_silo_file(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def output(self, dtype='float32'):
+        from analysis import DenovoOutput
+        return DenovoOutput(self.tmpdir, dtype=dtype)
+
+    def test_finds_file_in_directory(self):
+        self.assertEqual(self.output().outputlocation, self.path)
+
+    def test_group_names(self):
+        variables = self.output().get_variables()
+        self.assertEqual(sorted(variables), ['adjoint_flux', 'angular_flux',
+            'omega_flux', 'scalar_flux'])
+        for variable in ['adjoint_flux', 'omega_flux', 'scalar_flux']:
+            self.assertEqual(sorted(variables[variable]), ['group_000',
+                'group_001', 'group_002'])
+        self.assertEqual(sorted(variables['angular_flux']), ['group_000',
+            'group_001'])
+
+    def test_silo_pointers_resolved(self):
+        variables = self.output().get_variables()
+        self.assertTrue(variables['scalar_flux']['group_001'].startswith(
+            '/.silo/#'))
+        self.assertEqual(variables['angular_flux']['group_001'],
+                '/angular_flux/group_001')
+        for (variable, number), values in self.data.items():
+            np.testing.assert_allclose(self.output('float64'
+                ).get_data_by_group(variable, number), values)
+
+    def test_get_data_by_group_dtype(self):
+        data = self.output().get_data_by_group('adjoint_flux', 2)
+        self.assertEqual(data.dtype, np.float32)
+        self.assertEqual(data.shape, shape)
+        np.testing.assert_allclose(data, self.data[('adjoint_flux', 2)],
+                rtol=1e-6)
+
+    def test_iter_data_chunks(self):
+        chunks = list(self.output().iter_data_chunks('angular_flux',
+            'group_001', chunk_size=100))
+        self.assertGreater(len(chunks), 1)
+        np.testing.assert_allclose(np.concatenate(chunks),
+                self.data[('angular_flux', 1)].ravel(), rtol=1e-6)
+
+    def test_get_data_by_metric(self):
+        result = self.output().get_data_by_metric('omega_flux')
+        self.assertEqual(result['names'], ['group_000', 'group_001',
+            'group_002'])
+        self.assertEqual(result['data'].dtype, np.float32)
+        self.assertEqual(result['data'].shape, (int(np.prod(shape)), 3))
+        for number in range(3):
+            np.testing.assert_allclose(result['data'][:,number],
+                    self.data[('omega_flux', number)].ravel(), rtol=1e-6)
+
+    def test_get_data_by_metric_sampled(self):
+        np.random.seed(1)
+        result = self.output().get_data_by_metric('scalar_flux',
+                sample_rows=10, chunk_size=16)
+        self.assertEqual(result['data'].shape, (10, 3))
+        full = np.column_stack([self.data[('scalar_flux', number)].ravel()
+            for number in range(3)])
+        # the same mesh cells are sampled for every group
+        for row in result['data']:
+            matches = np.where(np.isclose(full[:,0], row[0], rtol=1e-6))[0]
+            self.assertEqual(len(matches), 1)
+            np.testing.assert_allclose(full[matches[0]], row, rtol=1e-6)
+
+    def test_get_data_by_energy(self):
+        output = self.output()
+        with self.assertRaises(ValueError):
+            # the angular flux has a value per angle as well
+            output.get_data_by_energy(0)
+        result = output.get_data_by_energy(2)
+        self.assertEqual(result['names'], ['adjoint_flux', 'omega_flux',
+            'scalar_flux'])
+        for column, variable in enumerate(result['names']):
+            np.testing.assert_allclose(result['data'][:,column],
+                    self.data[(variable, 2)].ravel(), rtol=1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
+
+###############################################################################
+# end of thesiscode/tests/test_denovo_output.py
+###############################################################################
@@ -0,0 +1,183 @@
+###############################################################################
+# File  : thesiscode/tests/test_memory_plan.py
+# Author: madicken
+# Date  : Mon Oct 19 11:40:12 2026
+#
+# Tests that a Single_Run analysis given a memory budget stays within it.
+#    -- make_run writes a small synthetic cadisangle run (an MCNP output, a
+#    timing file and a problem_anisotropies.h5) to a temporary directory.
+#    -- each analysis runs in a fresh interpreter, so that its peak RSS is
+#    its own and not that of the test runner.
+#    -- budgets and limits are set above the peak RSS of that interpreter
+#    once single_run is imported, so they do not depend on the size of the
+#    python build or of the installed libraries.
+#
+# Run from the repository root with
+#     python -m unittest discover tests
+###############################################################################
+from __future__ import (division, absolute_import, print_function, )
+#-----------------------------------------------------------------------------#
+import numpy as np
+import subprocess
+import unittest
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+###############################################################################
+
+scripts_dir = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'scripts')
+
+metrics = ['adjoint_anisotropy', 'forward_anisotropy', 'metric_one',
+           'metric_two', 'metric_three', 'metric_four', 'metric_five',
+           'metric_six']
+
+def write_mcnp_output(path, num_groups):
+    '''
+    Writes an MCNP output with the computer time, an energy binned tally and
+    its fluctuation chart.
+    '''
+    lines = [' computer time =    2.10 minutes\n',
+             '  computer time in mcrun   2.00 minutes\n',
+             '1tally       44        nps =    100000\n',
+             '           cell  1\n',
+             '      energy\n']
+    for group in range(num_groups):
+        lines.append('    %.4E   %.5E %.4f\n' %(10.0**(group-num_groups+1),
+            1e-4*(group+1), 0.01*(group+1)))
+    lines.append('      total      3.00000E-03 0.0300\n')
+    lines.append('\n1tally fluctuation charts\n\n        tally       44\n')
+    lines.append('      nps      mean     error   vov  slope    fom\n')
+    for step in range(1, 11):
+        error = 0.3/np.sqrt(step)
+        lines.append('   %6d   3.0E-03 %.4f 0.0100  10.0  %.1E\n'
+                %(10000*step, error, 1.0/(error**2*0.2*step)))
+    lines.append('\n dump no.    2\n')
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+def make_run(root, shape=(20, 15, 10), num_groups=5):
+    '''
+    Writes the minimal layout of a cadisangle run to root: an MCNP output,
+    the adjoint solution parameters, timing.json and a problem_anisotropies
+    file with every metric and the contributon flux for each group.
+    '''
+    import h5py
+
+    for directory in ['mcnp', 'output', 'adj_solution', 'omega_solution',
+            'fwd_solution']:
+        os.makedirs(os.path.join(root, directory))
+    write_mcnp_output(os.path.join(root, 'mcnp', 'out'), num_groups)
+    with open(os.path.join(root, 'adj_solution', 'omnibus.pp.json'),
+            'w') as f:
+        json.dump({'run' : {'np' : 4}}, f)
+    with open(os.path.join(root, 'timing.json'), 'w') as f:
+        json.dump({'mix_mats' : 1.0, 'map_cells' : 2.0,
+                   'Executing Denovo' : 30.0,
+                   'Loading material compositions' : 1.0,
+                   'Calculating the omega fluxes' : 5.0,
+                   'Writing omega solution to disk' : 1.0}, f)
+
+    random = np.random.RandomState(0)
+    path = os.path.join(root, 'omega_solution', 'problem_anisotropies.h5')
+    with h5py.File(path, 'w') as f:
+        for metric in metrics + ['contributon_flux']:
+            group = f.create_group(metric)
+            # contributon fluxes are small, well below the filter values
+            # of 0 and 1 that get_filter_matrix writes over them.
+            scale = 1e-3 if metric == 'contributon_flux' else 1.0
+            for number in range(num_groups):
+                group.create_dataset('group_%03d' %(number),
+                        data=scale*random.lognormal(size=shape))
+
+# run in a fresh interpreter: analyses the run with a memory budget of
+# margin bytes over the peak RSS after the imports, and prints the outcome,
+# that baseline and the peak RSS of the process in bytes.
+analysis_case = '''
+import json, sys
+sys.path.insert(0, %(scripts)r)
+import matplotlib
+matplotlib.use('agg')
+from single_run import Single_Run
+
+def peak_rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])*2**10
+
+baseline = peak_rss()
+error = None
+try:
+    Single_Run(%(path)r).do_single_analysis(
+            memory_budget=baseline + %(margin)r, incremental=False,
+            **%(flags)r)
+except MemoryError as e:
+    error = str(e)
+print(json.dumps({'error' : error, 'baseline' : baseline,
+    'peak' : peak_rss()}))
+'''
+
+flags = {'plot_violins_for_metric' : True,
+         'plot_boxes_for_energy' : True,
+         'plot_strip_for_metric' : True,
+         'plot_RE_by_bin' : True,
+         'plot_anisotropies_median' : True}
+
+@unittest.skipUnless(os.path.exists('/proc/self/status'),
+        'measures the peak RSS from /proc')
+class TestMemoryBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.run_dir = os.path.join(self.tmpdir, 'cadisangle')
+        make_run(self.run_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def analyse(self, margin):
+        code = analysis_case %{'scripts' : scripts_dir,
+                'path' : self.run_dir, 'margin' : margin, 'flags' : flags}
+        output = subprocess.check_output([sys.executable, '-c', code],
+                cwd=self.tmpdir)
+        return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+    def outputs(self):
+        analysis_dir = os.path.join(self.run_dir, 'analysis')
+        if not os.path.isdir(analysis_dir):
+            return []
+        return [name for name in os.listdir(analysis_dir)
+                if name.endswith('.pdf')]
+
+    def test_peak_within_budget(self):
+        # room for the plotting libraries, their reserve and the data
+        margin = 130*2**20
+        result = self.analyse(margin)
+        self.assertIsNone(result['error'])
+        self.assertTrue(self.outputs())
+        self.assertLessEqual(result['peak'], result['baseline'] + margin,
+                'peak RSS %.1f MiB over the budget of %.1f MiB'
+                %(result['peak']/2**20, (result['baseline'] + margin)/2**20))
+
+    def test_impossible_budget_refused_up_front(self):
+        # less than MemoryPlan.plotting_libraries
+        margin = 60*2**20
+        start = time.time()
+        result = self.analyse(margin)
+        self.assertIsNotNone(result['error'])
+        self.assertEqual(self.outputs(), [])
+        # refused before the plotting libraries are loaded or any
+        # anisotropy data is read.
+        self.assertLess(result['peak'], result['baseline'] + margin)
+        self.assertLess(time.time() - start, 30)
+
+if __name__ == '__main__':
+    unittest.main()
+
+###############################################################################
+# end of thesiscode/tests/test_memory_plan.py
+###############################################################################